@@ -0,0 +1,105 @@
+"""
+Compare WSGI, sync views under ASGI and native async views under uvicorn.
+
+Run from the ice_cream_truck_api directory against a migrated database:
+
+    python -m benchmarks.async_views --requests 2000 --concurrency 32
+"""
+
+import argparse
+
+from .load import (
+    Request,
+    drive,
+    http_sender,
+    setup_django,
+    start_uvicorn,
+    write_results,
+)
+
+MODES: dict[str, tuple[str, str, str]] = {
+    # mode: (application, uvicorn interface, URL prefix)
+    "wsgi": ("ice_cream_truck_api.wsgi:application", "wsgi", "/api/"),
+    "asgi_sync": ("ice_cream_truck_api.asgi:application", "asgi3", "/api/"),
+    "asgi_async": ("ice_cream_truck_api.asgi:application", "asgi3", "/api/async/"),
+}
+
+
+def seed() -> dict[str, int]:
+    from django.contrib.auth import get_user_model
+
+    from ice_cream_truck.models import Customer, FoodItem, IceCreamTruck
+
+    user, _ = get_user_model().objects.get_or_create(username="benchmark")
+    customer, _ = Customer.objects.get_or_create(user=user)
+    ice_cream_truck, _ = IceCreamTruck.objects.get_or_create(name="Benchmark Truck")
+    food_item, _ = FoodItem.objects.get_or_create(
+        name="Benchmark Ice Cream", defaults={"price": "0.01"}
+    )
+    ice_cream_truck.food_items.add(food_item)
+    return {
+        "customer": customer.pk,
+        "ice_cream_truck": ice_cream_truck.pk,
+        "food_item": food_item.pk,
+    }
+
+
+def restock(ids: dict[str, int]) -> None:
+    from ice_cream_truck.models import Customer, TruckStock
+
+    TruckStock.objects.filter(
+        ice_cream_truck_id=ids["ice_cream_truck"], food_item_id=ids["food_item"]
+    ).update(stock=1_000_000)
+    Customer.objects.filter(pk=ids["customer"]).update(balance="9999.99")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    setup_django()
+    ids = seed()
+    endpoints: dict[str, Request] = {
+        "buy_food": Request(
+            "POST",
+            "buy_food/",
+            {
+                "food_item_id": ids["food_item"],
+                "customer_id": ids["customer"],
+                "ice_cream_truck_id": ids["ice_cream_truck"],
+                "quantity": 1,
+            },
+        ),
+        "revenue": Request("GET", f"revenue/{ids['ice_cream_truck']}/"),
+        "inventory": Request("GET", f"inventory/{ids['ice_cream_truck']}/"),
+    }
+
+    results: dict[str, list] = {}
+    for mode, (app, interface, prefix) in MODES.items():
+        restock(ids)
+        server = start_uvicorn(app, args.port, interface)
+        try:
+            results[mode] = [
+                drive(
+                    name,
+                    lambda rng, request=request: Request(
+                        request.method, prefix + request.path, request.body
+                    ),
+                    http_sender(f"http://127.0.0.1:{args.port}"),
+                    args.requests,
+                    args.concurrency,
+                )
+                for name, request in endpoints.items()
+            ]
+        finally:
+            server.terminate()
+            server.wait()
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
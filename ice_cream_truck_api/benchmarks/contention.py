@@ -0,0 +1,120 @@
+"""
+Compare buy_food throughput at one hot truck with single-row and sharded rows.
+
+Every client buys the same item from the same truck. Each purchase updates
+the truck's stock of the item and its hour and day revenue rollups, so with
+single rows all purchases queue on those row locks. The runs cover every
+combination of --shards (stock) and --rollup-shards (revenue rollups). Run
+from the ice_cream_truck_api directory against a migrated PostgreSQL
+database (SQLite serialises every write, so it can't show the difference):
+
+    python -m benchmarks.contention --requests 2000 --clients 32 --shards 1 8 32 --rollup-shards 1 8
+"""
+
+import argparse
+
+from .load import Request, client_sender, drive, setup_django, write_results
+
+
+def seed() -> dict[str, list[int]]:
+    from django.contrib.auth import get_user_model
+
+    from ice_cream_truck.models import Customer, FoodItem, IceCreamTruck
+
+    User = get_user_model()
+    ice_cream_truck, _ = IceCreamTruck.objects.get_or_create(name="Contention Truck")
+    food_item, _ = FoodItem.objects.get_or_create(
+        name="Contention Ice Cream", defaults={"price": "0.01"}
+    )
+    ice_cream_truck.food_items.add(food_item)
+    # Separate customers, so that only the truck's rows are shared
+    customers: list[int] = []
+    for i in range(64):
+        user, _ = User.objects.get_or_create(username=f"contention-{i}")
+        customer, _ = Customer.objects.get_or_create(user=user)
+        customers.append(customer.pk)
+    return {
+        "ice_cream_truck": [ice_cream_truck.pk],
+        "food_item": [food_item.pk],
+        "customers": customers,
+    }
+
+
+def reset(ids: dict[str, list[int]], shards: int, stock: int) -> None:
+    from ice_cream_truck.models import Customer, RevenueRollup, TruckStock
+    from ice_cream_truck.stock import spread_stock
+
+    Customer.objects.filter(pk__in=ids["customers"]).update(balance="9999.99")
+    # Every run starts without the truck's rollup rows, so each one pays for
+    # creating its shards
+    RevenueRollup.objects.filter(ice_cream_truck_id=ids["ice_cream_truck"][0]).delete()
+    row_id = TruckStock.objects.get(
+        ice_cream_truck_id=ids["ice_cream_truck"][0], food_item_id=ids["food_item"][0]
+    ).pk
+    # Unshard the row, set its stock, then spread it over the shards
+    spread_stock(row_id, 0)
+    TruckStock.objects.filter(pk=row_id).update(stock=stock)
+    spread_stock(row_id, shards)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument(
+        "--shards",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32],
+        help="Stock shard counts to compare; 1 means single-row stock",
+    )
+    parser.add_argument(
+        "--rollup-shards",
+        type=int,
+        nargs="+",
+        default=[1, 8],
+        help="REVENUE_ROLLUP_SHARDS values to compare; 1 means one row per bucket",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+
+    # Lets the test client through ALLOWED_HOSTS ("testserver")
+    setup_test_environment()
+    ids = seed()
+
+    def make_request(rng) -> Request:
+        return Request(
+            "POST",
+            "/api/buy_food/",
+            {
+                "food_item_id": ids["food_item"][0],
+                "customer_id": rng.choice(ids["customers"]),
+                "ice_cream_truck_id": ids["ice_cream_truck"][0],
+                "quantity": 1,
+            },
+        )
+
+    results = []
+    for rollup_shards in args.rollup_shards:
+        settings.REVENUE_ROLLUP_SHARDS = rollup_shards
+        for shards in args.shards:
+            # One shard is plain TruckStock.stock, without StockShard rows
+            reset(ids, 0 if shards == 1 else shards, args.requests)
+            results.append(
+                drive(
+                    f"buy_food_shards_{shards}_rollup_shards_{rollup_shards}",
+                    make_request,
+                    client_sender,
+                    args.requests,
+                    args.clients,
+                )
+            )
+    write_results(args.output, {"clients": args.clients, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django() -> None:
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ice_cream_truck_api.settings")
+    # Measure the views, not the limiter; servers started below inherit this
+    os.environ.setdefault("RATE_LIMITS", "off")
+    django.setup()
+
+
+# A database whose name contains one of these is taken to be disposable
+SCRATCH_DATABASE_MARKERS: tuple[str, ...] = ("bench", "scratch", "test")
+
+
+def require_scratch_database(confirmed: Optional[str] = None) -> None:
+    # Benchmarks write rows of their own to the default database; refuse one
+    # that doesn't look disposable unless its name was confirmed
+    from django.db import connection
+
+    name: str = str(connection.settings_dict["NAME"])
+    if confirmed == name or any(
+        marker in Path(name).name.lower() for marker in SCRATCH_DATABASE_MARKERS
+    ):
+        return
+    raise SystemExit(
+        f"Refusing to write benchmark data to the {name!r} database. Use a "
+        f"scratch database (named with one of {', '.join(SCRATCH_DATABASE_MARKERS)}) "
+        f"or confirm it with --database {name}."
+    )
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    body: Optional[dict] = None
+
+
+@dataclass
+class Result:
+    name: str
+    requests: int
+    errors: int
+    seconds: float
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries_per_request: Optional[float] = None
+
+
+# A sender performs one request and returns its status code
+Sender = Callable[[Request], int]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(name: str, latencies: list[float], errors: int, seconds: float) -> Result:
+    latencies = sorted(latencies)
+    return Result(
+        name=name,
+        requests=len(latencies),
+        errors=errors,
+        seconds=round(seconds, 3),
+        requests_per_second=round(len(latencies) / seconds, 1) if seconds else 0.0,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+    )
+
+
+def drive(
+    name: str,
+    make_request: Callable[[random.Random], Request],
+    open_sender: Callable[[], tuple[Sender, Callable[[], None]]],
+    total: int,
+    concurrency: int,
+    seed: int = 0,
+) -> Result:
+    # Runs `total` requests spread over `concurrency` clients. Each client has
+    # its own connection and seeded RNG, so runs are repeatable. Any status
+    # of 400 or above counts as an error.
+    def client(index: int) -> tuple[list[float], int]:
+        rng = random.Random(seed * 1000 + index)
+        send, close = open_sender()
+        latencies: list[float] = []
+        errors = 0
+        try:
+            for _ in range(shares[index]):
+                request = make_request(rng)
+                started = time.perf_counter()
+                status = send(request)
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 400
+        finally:
+            close()
+        return latencies, errors
+
+    shares = [
+        total // concurrency + (i < total % concurrency) for i in range(concurrency)
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(client, range(concurrency)))
+    seconds = time.perf_counter() - started
+    return summarize(
+        name,
+        [latency for latencies, _ in outcomes for latency in latencies],
+        sum(errors for _, errors in outcomes),
+        seconds,
+    )
+
+
+def http_sender(base_url: str) -> Callable[[], tuple[Sender, Callable[[], None]]]:
+    # One keep-alive connection per client
+    parts = urlsplit(base_url)
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+
+    def open_sender() -> tuple[Sender, Callable[[], None]]:
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+
+        def send(request: Request) -> int:
+            body = json.dumps(request.body) if request.body is not None else None
+            connection.request(request.method, request.path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+
+        return send, connection.close
+
+    return open_sender
+
+
+def client_sender() -> tuple[Sender, Callable[[], None]]:
+    # Django's test client, in process; each thread gets its own DB connection
+    from django.db import connection
+    from django.test import Client
+
+    client = Client(HTTP_ACCEPT="application/json")
+
+    def send(request: Request) -> int:
+        if request.method == "GET":
+            return client.get(request.path).status_code
+        return client.generic(
+            request.method,
+            request.path,
+            json.dumps(request.body or {}),
+            content_type="application/json",
+        ).status_code
+
+    return send, connection.close
+
+
+def queries_per_request(
+    make_request: Callable[[random.Random], Request], samples: int = 5, seed: int = 0
+) -> float:
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    rng = random.Random(seed)
+    send, _ = client_sender()
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(samples):
+            send(make_request(rng))
+    return round(len(queries) / samples, 2)
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def start_uvicorn(app: str, port: int, interface: str = "asgi3", workers: int = 1):
+    env = {**os.environ}
+    env.setdefault("ALLOWED_HOSTS", "127.0.0.1,localhost")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            app,
+            "--interface",
+            interface,
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BASE_DIR,
+        env=env,
+    )
+    try:
+        wait_for_port(port)
+    except RuntimeError:
+        process.terminate()
+        raise
+    return process
+
+
+def write_results(path: Optional[str], results: dict) -> None:
+    print(json.dumps(results, indent=2, default=asdict))
+    if path:
+        Path(path).write_text(json.dumps(results, indent=2, default=asdict))
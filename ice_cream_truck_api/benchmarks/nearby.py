@@ -0,0 +1,94 @@
+"""
+Compare the grid-indexed nearby truck search with a full scan of every truck.
+
+Seeds --trucks trucks with seed_load_data (once; later runs reuse them),
+then times searches around random points in the seeded area for each
+radius, with and without a flavor filter, against a scan that computes the
+distance to every truck. The two are checked to return the same trucks.
+Run from the ice_cream_truck_api directory against a migrated database:
+
+    python -m benchmarks.nearby --trucks 100000 --radii 1 5 25 50
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from .load import setup_django, write_results
+
+
+def seed(count: int) -> None:
+    from django.core.management import call_command
+
+    from ice_cream_truck.models import IceCreamTruck
+
+    located: int = IceCreamTruck.objects.filter(latitude__isnull=False).count()
+    if located < count:
+        call_command(
+            "seed_load_data",
+            f"--trucks={count - located}",
+            "--food-items=50",
+            "--items-per-truck=3",
+            "--customers=0",
+            "--transactions=0",
+            "--batch-size=5000",
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trucks", type=int, default=100000)
+    parser.add_argument("--radii", type=float, nargs="+", default=[1, 5, 25, 50])
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--flavor", default="Mint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    setup_django()
+    from ice_cream_truck.load_data import TRUCK_AREA
+    from ice_cream_truck.models import IceCreamTruck
+    from ice_cream_truck.nearby import closest, in_stock, nearby_trucks
+
+    seed(args.trucks)
+    rng = random.Random(args.seed)
+    results: dict = {"trucks": IceCreamTruck.objects.count()}
+    for radius_km in args.radii:
+        for flavor in (None, args.flavor):
+            timings: dict[str, list[float]] = {"grid_ms": [], "full_scan_ms": []}
+            found: list[int] = []
+            for _ in range(args.searches):
+                latitude = rng.uniform(*TRUCK_AREA[:2])
+                longitude = rng.uniform(*TRUCK_AREA[2:])
+
+                started = time.perf_counter()
+                rows = nearby_trucks(
+                    latitude, longitude, radius_km, args.limit, flavor=flavor
+                )
+                timings["grid_ms"].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                trucks = IceCreamTruck.objects.filter(latitude__isnull=False)
+                if flavor:
+                    trucks = trucks.filter(in_stock(None, flavor))
+                expected = closest(trucks, latitude, longitude, radius_km, args.limit)
+                timings["full_scan_ms"].append((time.perf_counter() - started) * 1000)
+
+                assert rows == expected, "grid search results differ"
+                found.append(len(rows))
+
+            grid_ms = statistics.median(timings["grid_ms"])
+            full_scan_ms = statistics.median(timings["full_scan_ms"])
+            results[f"{radius_km:g}km{f' {flavor}' if flavor else ''}"] = {
+                "grid_ms": round(grid_ms, 2),
+                "full_scan_ms": round(full_scan_ms, 2),
+                "speedup": round(full_scan_ms / grid_ms, 1),
+                "median_results": statistics.median(found),
+            }
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
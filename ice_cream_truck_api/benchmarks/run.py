@@ -0,0 +1,200 @@
+"""
+Load-test the main API endpoints and write the results as JSON.
+
+Seeds a dataset, then drives buy_food, inventory, revenue and food_items
+with concurrent clients, either in process through Django's test client or
+over HTTP against uvicorn. Run from the ice_cream_truck_api directory against
+a scratch, migrated database (PostgreSQL for meaningful write numbers); it
+refuses a database whose name doesn't contain "bench", "scratch" or "test"
+unless confirmed with --database:
+
+    python -m benchmarks.run --clients 16 --requests 1000 --output results.json
+    python -m benchmarks.run --target uvicorn --workers 4
+"""
+
+import argparse
+import platform
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from .load import (
+    Request,
+    client_sender,
+    drive,
+    http_sender,
+    queries_per_request,
+    require_scratch_database,
+    setup_django,
+    start_uvicorn,
+    write_results,
+)
+
+
+def seed(args: argparse.Namespace) -> dict[str, list[int]]:
+    from django.contrib.auth import get_user_model
+
+    from ice_cream_truck.models import (
+        Customer,
+        Flavor,
+        FoodItem,
+        IceCreamTruck,
+        Transaction,
+        TruckStock,
+    )
+    from ice_cream_truck.rollups import rebuild_rollups
+
+    User = get_user_model()
+    rng = random.Random(args.seed)
+    # Names are unique per run so the suite can be re-run on the same database
+    tag = f"{int(time.time())}"
+
+    trucks = IceCreamTruck.objects.bulk_create(
+        IceCreamTruck(name=f"Bench Truck {tag}-{i}") for i in range(args.trucks)
+    )
+    food_items = FoodItem.objects.bulk_create(
+        FoodItem(
+            name=f"Bench Item {tag}-{i}",
+            price=f"{rng.randint(100, 500) / 100:.2f}",
+        )
+        for i in range(args.items)
+    )
+    Flavor.objects.bulk_create(
+        Flavor(name=f"Flavor {j}", food_item=food_item)
+        for food_item in food_items
+        for j in range(args.flavors)
+    )
+    TruckStock.objects.bulk_create(
+        TruckStock(ice_cream_truck=truck, food_item=food_item, stock=1_000_000)
+        for truck in trucks
+        for food_item in food_items
+    )
+    users = User.objects.bulk_create(
+        User(username=f"bench-{tag}-{i}") for i in range(args.customers)
+    )
+    customers = Customer.objects.bulk_create(
+        Customer(user=user, balance="9999.99") for user in users
+    )
+
+    batch: list[Transaction] = []
+    for _ in range(args.transactions):
+        quantity = rng.randint(1, 3)
+        batch.append(
+            Transaction(
+                food_item=rng.choice(food_items),
+                customer=rng.choice(customers),
+                ice_cream_truck=rng.choice(trucks),
+                quantity=quantity,
+                total=quantity * 2,
+            )
+        )
+        if len(batch) == 5000:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+    # Only the bench trucks have new transactions
+    rebuild_rollups(
+        IceCreamTruck.objects.filter(name__startswith=f"Bench Truck {tag}-"),
+        batch_size=5000,
+    )
+
+    return {
+        "trucks": [truck.pk for truck in trucks],
+        "food_items": [food_item.pk for food_item in food_items],
+        "customers": [customer.pk for customer in customers],
+    }
+
+
+def endpoints(
+    ids: dict[str, list[int]],
+) -> dict[str, Callable[[random.Random], Request]]:
+    return {
+        "buy_food": lambda rng: Request(
+            "POST",
+            "/api/buy_food/",
+            {
+                "food_item_id": rng.choice(ids["food_items"]),
+                "customer_id": rng.choice(ids["customers"]),
+                "ice_cream_truck_id": rng.choice(ids["trucks"]),
+                "quantity": 1,
+            },
+        ),
+        "inventory": lambda rng: Request(
+            "GET", f"/api/inventory/{rng.choice(ids['trucks'])}/"
+        ),
+        "revenue": lambda rng: Request(
+            "GET", f"/api/revenue/{rng.choice(ids['trucks'])}/"
+        ),
+        "food_items": lambda rng: Request("GET", "/api/food_items/"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=["client", "uvicorn"], default="client")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="Per endpoint")
+    parser.add_argument("--endpoints", nargs="*", help="Subset of endpoints to run")
+    parser.add_argument("--trucks", type=int, default=10)
+    parser.add_argument("--items", type=int, default=30)
+    parser.add_argument("--flavors", type=int, default=4)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument(
+        "--database",
+        help="Confirms that this database is scratch when its name doesn't say so",
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    require_scratch_database(args.database)
+    from django.test.utils import setup_test_environment
+
+    # Lets the test client through ALLOWED_HOSTS ("testserver")
+    setup_test_environment()
+    ids = seed(args)
+    selected = {
+        name: make_request
+        for name, make_request in endpoints(ids).items()
+        if not args.endpoints or name in args.endpoints
+    }
+
+    server = None
+    open_sender = client_sender
+    if args.target == "uvicorn":
+        server = start_uvicorn(
+            "ice_cream_truck_api.asgi:application", args.port, workers=args.workers
+        )
+        open_sender = http_sender(f"http://127.0.0.1:{args.port}")
+
+    results = []
+    try:
+        for name, make_request in selected.items():
+            result = drive(
+                name, make_request, open_sender, args.requests, args.clients, args.seed
+            )
+            result.queries_per_request = queries_per_request(make_request)
+            results.append(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    write_results(
+        args.output,
+        {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "options": vars(args),
+            "results": results,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
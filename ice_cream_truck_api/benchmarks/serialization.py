@@ -0,0 +1,113 @@
+"""
+Compare food item list serialization through FoodItemSerializer and the values() fast path.
+
+Each size is timed from query to rendered bytes, through the serializer
+with JSONRenderer, the fast path with JSONRenderer and the fast path with
+FastJSONRenderer (orjson, when installed). The outputs are checked to be
+identical. Run from the ice_cream_truck_api directory against a migrated
+database; the food items are created once and reused:
+
+    python -m benchmarks.serialization --sizes 10 1000 100000
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from .load import setup_django, write_results
+
+PREFIX: str = "bench-serialization"
+
+
+def seed(count: int) -> list[int]:
+    from ice_cream_truck.models import Flavor, FoodItem
+
+    ids: list[int] = list(
+        FoodItem.objects.filter(name__startswith=PREFIX)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    if len(ids) < count:
+        FoodItem.objects.bulk_create(
+            [
+                FoodItem(name=f"{PREFIX}-{i}", price=f"{i % 500}.{i % 100:02d}")
+                for i in range(len(ids), count)
+            ],
+            batch_size=5000,
+        )
+        new_ids = list(
+            FoodItem.objects.filter(name__startswith=PREFIX)
+            .exclude(id__in=ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        Flavor.objects.bulk_create(
+            [
+                Flavor(food_item_id=food_item_id, name=name)
+                for food_item_id in new_ids
+                for name in ("Vanilla", "Chocolate")
+            ],
+            batch_size=5000,
+        )
+        ids += new_ids
+    return ids[:count]
+
+
+def median_of(repeat: int, run: Callable[[], bytes]) -> tuple[float, bytes]:
+    # Median milliseconds over `repeat` runs, and the last output
+    timings: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        content = run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), content
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+
+    from ice_cream_truck.fast_serializers import food_item_rows, food_item_values
+    from ice_cream_truck.renderers import FastJSONRenderer, orjson
+    from ice_cream_truck.serializers import FoodItemSerializer
+    from ice_cream_truck.views import FoodItemViewSet
+
+    ids = seed(max(args.sizes))
+    results: dict = {"fast_json_backend": "orjson" if orjson else "json"}
+    for size in args.sizes:
+        window = {"id__gte": ids[0], "id__lte": ids[size - 1]}
+
+        def serializer() -> bytes:
+            queryset = FoodItemViewSet.queryset.filter(**window).order_by("id")
+            return JSONRenderer().render(FoodItemSerializer(queryset, many=True).data)
+
+        def fast_path(renderer: type[JSONRenderer]) -> Callable[[], bytes]:
+            def run() -> bytes:
+                rows = list(food_item_values().filter(**window).order_by("id"))
+                return renderer().render(food_item_rows(rows))
+
+            return run
+
+        serializer_ms, expected = median_of(args.repeat, serializer)
+        values_ms, content = median_of(args.repeat, fast_path(JSONRenderer))
+        assert content == expected, "values() fast path output differs"
+        fast_ms, content = median_of(args.repeat, fast_path(FastJSONRenderer))
+        assert content == expected, "FastJSONRenderer output differs"
+        results[str(size)] = {
+            "serializer_ms": round(serializer_ms, 2),
+            "values_ms": round(values_ms, 2),
+            "values_fast_json_ms": round(fast_ms, 2),
+            "speedup": round(serializer_ms / fast_ms, 1),
+        }
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
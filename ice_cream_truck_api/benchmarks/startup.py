@@ -0,0 +1,98 @@
+"""
+Compare worker cold-start time for the full and lean API_PROFILE settings.
+
+Each run starts a fresh Python process that imports Django and builds the
+WSGI application (the import time), then serves one request (the time to
+first request, which loads the URLconf and views and connects to the
+database). Reports the median over the runs, and the modules each profile
+ends up importing. Run from the ice_cream_truck_api directory against a
+migrated database:
+
+    python -m benchmarks.startup --repeat 10 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PROFILES: tuple[str, ...] = ("full", "lean")
+
+
+def measure(path: str) -> dict:
+    # Runs in the child process, so nothing from Django is imported yet
+    from wsgiref.util import setup_testing_defaults
+
+    started = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    loaded = time.perf_counter()
+
+    environ: dict = {"PATH_INFO": path, "HTTP_ACCEPT": "application/json"}
+    setup_testing_defaults(environ)
+    statuses: list[str] = []
+    b"".join(application(environ, lambda status, headers: statuses.append(status)))
+    served = time.perf_counter()
+    return {
+        "status": int(statuses[0].split()[0]),
+        "import_ms": (loaded - started) * 1000,
+        "first_request_ms": (served - loaded) * 1000,
+        "modules": len(sys.modules),
+    }
+
+
+def run(profile: str, path: str) -> dict:
+    env = {**os.environ, "API_PROFILE": profile}
+    env.setdefault("DJANGO_SETTINGS_MODULE", "ice_cream_truck_api.settings")
+    env.setdefault("ALLOWED_HOSTS", "127.0.0.1,localhost")
+    env.setdefault("RATE_LIMITS", "off")
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", "--path", path],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result: dict = json.loads(output)
+    # Including the interpreter's own startup
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    if result["status"] != 200:
+        raise RuntimeError(f"{profile}: {path} answered {result['status']}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--path", default="/api/food_items/")
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=PROFILES)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.path)))
+        return
+
+    from .load import write_results
+
+    results: dict = {}
+    for profile in args.profiles:
+        runs = [run(profile, args.path) for _ in range(args.repeat)]
+        results[profile] = {
+            metric: round(statistics.median(result[metric] for result in runs), 1)
+            for metric in ("import_ms", "first_request_ms", "process_ms", "modules")
+        }
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
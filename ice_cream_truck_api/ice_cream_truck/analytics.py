@@ -0,0 +1,104 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, QuerySet, Sum, Window
+from django.db.models.functions import RowNumber, TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+
+from .models import Transaction
+
+PERIODS: dict[str, type[TruncHour]] = {
+    "hour": TruncHour,
+    "day": TruncDay,
+    "week": TruncWeek,
+}
+# group_by: (id lookup, name lookup)
+GROUPS: dict[str, tuple[str, str]] = {
+    "truck": ("ice_cream_truck_id", "ice_cream_truck__name"),
+    "food_item": ("food_item_id", "food_item__name"),
+    "customer": ("customer_id", "customer__user__username"),
+}
+
+
+def period_start(date: datetime, period: str) -> datetime:
+    # Matches what the Trunc functions produce in the current time zone;
+    # weeks start on Monday
+    date = timezone.localtime(date).replace(minute=0, second=0, microsecond=0)
+    if period != "hour":
+        date = date.replace(hour=0)
+    if period == "week":
+        date -= timedelta(days=date.weekday())
+    return date
+
+
+def sales_rows(
+    transactions: QuerySet[Transaction],
+    period: str,
+    group_by: Optional[str] = None,
+    top: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    # One GROUP BY query: revenue and units sold per bucket (and group).
+    # With `top`, a ROW_NUMBER() window keeps the K best-sellers of each
+    # bucket, still in SQL.
+    fields: tuple[str, ...] = GROUPS[group_by] if group_by else ()
+    rows = (
+        transactions.annotate(bucket=PERIODS[period]("date"))
+        .values("bucket", *fields)
+        .annotate(revenue=Sum("total"), units_sold=Sum("quantity"))
+    )
+    if top is not None:
+        rows = rows.annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("bucket")],
+                order_by=[F("units_sold").desc(), F("revenue").desc()],
+            )
+        ).filter(rank__lte=top)
+    return [
+        {
+            "bucket": row["bucket"],
+            **({"id": row[fields[0]], "name": row[fields[1]]} if group_by else {}),
+            "revenue": row["revenue"],
+            "units_sold": row["units_sold"],
+        }
+        for row in rows.order_by("bucket", "-units_sold", "-revenue")
+    ]
+
+
+def sales_analytics(
+    period: str,
+    group_by: Optional[str] = None,
+    top: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    filters: Optional[dict[str, int]] = None,
+) -> list[dict[str, Any]]:
+    # Buckets that ended a little while ago can't change any more, so the
+    # part of the window before the current bucket is cached. Only the open
+    # bucket is aggregated on every request.
+    filters = filters or {}
+    closed_until: datetime = period_start(
+        timezone.now() - timedelta(seconds=settings.ANALYTICS_CLOSE_GRACE_SECONDS),
+        period,
+    )
+    transactions = Transaction.objects.filter(**filters)
+    if start is not None and start >= closed_until:
+        return sales_rows(transactions.in_window(start, end), period, group_by, top)
+
+    closed_end: datetime = closed_until if end is None else min(end, closed_until)
+    key_parts = [period, group_by, top, start, closed_end, sorted(filters.items())]
+    key: str = "analytics:" + hashlib.sha256(repr(key_parts).encode()).hexdigest()
+    rows: Optional[list[dict[str, Any]]] = cache.get(key)
+    if rows is None:
+        rows = sales_rows(
+            transactions.in_window(start, closed_end), period, group_by, top
+        )
+        cache.set(key, rows, settings.ANALYTICS_CACHE_TIMEOUT)
+    if end is not None and end <= closed_until:
+        return rows
+    return rows + sales_rows(
+        transactions.in_window(closed_until, end), period, group_by, top
+    )
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class IceCreamTruckConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ice_cream_truck"
+
+    def ready(self) -> None:
+        # Connect the catalog cache invalidation signals, the query recorder
+        # for /metrics and the outbox event handlers
+        from . import handlers, metrics, signals  # noqa: F401
@@ -0,0 +1,118 @@
+import json
+from decimal import Decimal
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.views import View
+from rest_framework.utils.encoders import JSONEncoder
+
+from .idempotency import idempotent
+from .models import IceCreamTruck, RevenueRollup
+from .purchases import PurchaseError, buy_food
+from .rollups import revenue_buckets, truck_revenue, window_revenue
+from .routers import read_from_replica
+from .serializers import IceCreamTruckSerializer
+from .views import IceCreamTruckInventoryView, parse_quantity, parse_window_bound
+
+# Native async counterparts of the hot views for ASGI (uvicorn) deployments.
+# They skip DRF, whose views are sync only, and await the ORM directly. The
+# purchase core stays in transaction.atomic(), which can't span awaits, so it
+# runs as one sync_to_async call.
+
+
+class AsyncBuyFoodView(View):
+    @idempotent(JsonResponse)
+    async def post(self, request, *args, **kwargs):
+        try:
+            data: Any = (
+                json.loads(request.body)
+                if request.content_type == "application/json"
+                else request.POST
+            )
+        except ValueError:
+            return JsonResponse({"message": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({"message": "Expected an object"}, status=400)
+
+        quantity = parse_quantity(data.get("quantity"))
+        if quantity is None:
+            return JsonResponse({"message": "Invalid quantity"}, status=400)
+
+        try:
+            await sync_to_async(buy_food)(
+                data.get("food_item_id"),
+                data.get("customer_id"),
+                data.get("ice_cream_truck_id"),
+                quantity,
+            )
+        except PurchaseError as error:
+            return JsonResponse({"message": error.message}, status=error.status_code)
+
+        return JsonResponse({"message": "ENJOY!"})
+
+
+class AsyncIceCreamTruckRevenueView(View):
+    async def get(self, request, *args, **kwargs):
+        sticky_keys = [f"ice_cream_truck:{kwargs['pk']}"] if "pk" in kwargs else []
+        with read_from_replica(*sticky_keys):
+            return await self.revenue(request, **kwargs)
+
+    async def revenue(self, request, **kwargs):
+        trucks = IceCreamTruck.objects.annotate(total_revenue=truck_revenue())
+        if "pk" in kwargs:
+            try:
+                ice_cream_truck = await trucks.aget(pk=kwargs["pk"])
+            except IceCreamTruck.DoesNotExist:
+                raise Http404
+        else:
+            ice_cream_truck = await trucks.order_by("pk").afirst()
+            if ice_cream_truck is None:
+                return JsonResponse({"total_revenue": 0})
+
+        params = request.GET
+        if not {"period", "from", "to"} & set(params):
+            return revenue_response(ice_cream_truck.total_revenue)
+
+        try:
+            start = parse_window_bound(params.get("from"))
+            end = parse_window_bound(params.get("to"))
+        except ValueError:
+            return JsonResponse({"message": "Invalid time window"}, status=400)
+
+        if "period" not in params:
+            return revenue_response(
+                await sync_to_async(window_revenue)(ice_cream_truck, start, end)
+            )
+
+        period: str = params["period"]
+        if period not in dict(RevenueRollup.PERIOD_CHOICES):
+            return JsonResponse({"message": "Invalid period"}, status=400)
+
+        buckets = await sync_to_async(revenue_buckets)(
+            ice_cream_truck, period, start, end
+        )
+        return revenue_response(
+            sum((bucket["revenue"] for bucket in buckets), Decimal("0.00")),
+            buckets=buckets,
+        )
+
+
+class AsyncIceCreamTruckInventoryView(View):
+    async def get(self, request, *args, **kwargs):
+        try:
+            with read_from_replica(f"ice_cream_truck:{kwargs['pk']}"):
+                ice_cream_truck = await IceCreamTruckInventoryView.queryset.aget(
+                    pk=kwargs["pk"]
+                )
+        except IceCreamTruck.DoesNotExist:
+            raise Http404
+        # Everything the serializer reads was prefetched by aget()
+        return JsonResponse(
+            IceCreamTruckSerializer(ice_cream_truck).data, encoder=JSONEncoder
+        )
+
+
+def revenue_response(total_revenue: Decimal, **extra: Any) -> JsonResponse:
+    # DRF's encoder, so decimals and dates come out as in the sync view
+    return JsonResponse({"total_revenue": total_revenue, **extra}, encoder=JSONEncoder)
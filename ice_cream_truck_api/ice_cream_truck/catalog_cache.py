@@ -0,0 +1,81 @@
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from .routers import mark_written
+
+CATALOG_VERSION_KEY: str = "catalog:version"
+
+
+def catalog_version() -> int:
+    # The version lives in the cache so that, with a shared backend, a bump
+    # in one worker invalidates every worker. It starts from the clock so a
+    # version evicted and recreated can't collide with an older one.
+    version: Optional[int] = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version() -> None:
+    # Deferred to commit so a reader can't cache the old rows under the new
+    # version while the writing transaction is still open. Catalog reads are
+    # pinned to the primary first, for the same reason with lagging replicas.
+    mark_written("catalog")
+    transaction.on_commit(_incr_catalog_version)
+
+
+def _incr_catalog_version() -> None:
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        catalog_version()
+
+
+class CatalogCacheMixin:
+    # Serves list/retrieve as rendered JSON bytes keyed on the catalog version,
+    # with a version-based ETag so clients can revalidate with If-None-Match.
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler: Callable, request, *args, **kwargs):
+        # The browsable API renders per-user forms, so only JSON is cached
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+
+        version: int = catalog_version()
+        etag: str = f'"catalog-{version}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            key: str = (
+                f"catalog:{version}:{request.accepted_media_type}"
+                f":{request.get_full_path()}"
+            )
+            cached: Optional[tuple[bytes, str]] = cache.get(key)
+            if cached is None:
+                rendered = self.finalize_response(
+                    request, handler(request, *args, **kwargs), *args, **kwargs
+                ).render()
+                if rendered.status_code != 200:
+                    return rendered
+                cached = (rendered.content, rendered["Content-Type"])
+                cache.set(key, cached, settings.CATALOG_CACHE_TIMEOUT)
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+
+        response["ETag"] = etag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ("Accept",))
+        return response
@@ -0,0 +1,235 @@
+import csv
+import io
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .catalog_cache import bump_catalog_version
+from .models import Flavor, FoodItem, TruckStock
+from .routers import mark_written
+from .serializers import CatalogRowSerializer
+from .stock import restock
+
+IMPORT_BATCH_SIZE: int = 500
+# Below this many stock rows the ORM path is as quick as COPY
+IMPORT_COPY_THRESHOLD: int = 500
+
+
+def parse_csv(text: str) -> list[dict[str, Any]]:
+    # Columns: name, price, flavors (separated by ";"), stock. Empty cells
+    # are left out so they count as "not given".
+    rows: list[dict[str, Any]] = []
+    for record in csv.DictReader(io.StringIO(text)):
+        row: dict[str, Any] = {
+            key.strip(): value.strip()
+            for key, value in record.items()
+            if key and value and value.strip()
+        }
+        if "flavors" in row:
+            row["flavors"] = [
+                flavor.strip() for flavor in row["flavors"].split(";") if flavor.strip()
+            ]
+        rows.append(row)
+    return rows
+
+
+def import_catalog(
+    rows: list[Any], ice_cream_truck_id: Optional[int] = None
+) -> tuple[bool, dict[str, Any]]:
+    # Creates or updates food items (by name), adds missing flavors and adds
+    # `stock` units to the truck's stock, all in one transaction with batched
+    # bulk_create/bulk_update calls. Nothing is written unless every row is
+    # valid. Returns (applied, report).
+    report: list[dict[str, Any]] = []
+    valid: dict[str, dict[str, Any]] = {}
+    for index, row in enumerate(rows, 1):
+        serializer = CatalogRowSerializer(data=row)
+        if not serializer.is_valid():
+            report.append(
+                {"row": index, "status": "invalid", "errors": serializer.errors}
+            )
+            continue
+        data: dict[str, Any] = serializer.validated_data
+        errors: dict[str, list[str]] = {}
+        if data["name"] in valid:
+            errors["name"] = ["Duplicate food item"]
+        if "stock" in data and ice_cream_truck_id is None:
+            errors["stock"] = ["Stock needs an ice cream truck"]
+        if errors:
+            report.append({"row": index, "status": "invalid", "errors": errors})
+            continue
+        valid[data["name"]] = data
+        report.append({"row": index, "name": data["name"]})
+
+    with transaction.atomic():
+        existing: dict[str, FoodItem] = FoodItem.objects.in_bulk(
+            list(valid), field_name="name"
+        )
+        for entry in report:
+            if "name" not in entry:
+                continue
+            if entry["name"] in existing:
+                entry["status"] = "updated"
+            elif "price" in valid[entry["name"]]:
+                entry["status"] = "created"
+            else:
+                entry["status"] = "invalid"
+                entry["errors"] = {"price": ["Required for a new food item"]}
+
+        invalid: int = sum(entry["status"] == "invalid" for entry in report)
+        if invalid:
+            return False, {
+                "message": f"{invalid} invalid rows, nothing imported",
+                "rows": report,
+            }
+
+        counts: dict[str, int] = {
+            "created": 0,
+            "repriced": 0,
+            "flavors_created": 0,
+            "restocked": 0,
+        }
+        food_items: dict[str, FoodItem] = dict(existing)
+        new_items: list[FoodItem] = FoodItem.objects.bulk_create(
+            [
+                FoodItem(name=name, price=data["price"])
+                for name, data in valid.items()
+                if name not in existing
+            ],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        if connection.features.can_return_rows_from_bulk_insert:
+            food_items.update((food_item.name, food_item) for food_item in new_items)
+        else:
+            food_items.update(
+                FoodItem.objects.in_bulk(
+                    [food_item.name for food_item in new_items], field_name="name"
+                )
+            )
+        counts["created"] = len(new_items)
+
+        repriced: list[FoodItem] = []
+        for name, food_item in existing.items():
+            price: Optional[Decimal] = valid[name].get("price")
+            if price is not None and price != food_item.price:
+                food_item.price = price
+                repriced.append(food_item)
+        FoodItem.objects.bulk_update(repriced, ["price"], batch_size=IMPORT_BATCH_SIZE)
+        counts["repriced"] = len(repriced)
+
+        counts["flavors_created"] = add_flavors(valid, food_items)
+
+        stock: dict[int, int] = {
+            food_items[name].pk: data["stock"]
+            for name, data in valid.items()
+            if data.get("stock")
+        }
+        if stock:
+            add_stock(ice_cream_truck_id, stock)
+            mark_written(f"ice_cream_truck:{ice_cream_truck_id}")
+        counts["restocked"] = len(stock)
+
+        # bulk_create and bulk_update don't send the signals that would
+        if counts["created"] or counts["repriced"] or counts["flavors_created"]:
+            bump_catalog_version()
+
+    return True, {"message": "Catalog imported", **counts, "rows": report}
+
+
+def add_flavors(
+    valid: dict[str, dict[str, Any]], food_items: dict[str, FoodItem]
+) -> int:
+    wanted: set[tuple[int, str]] = {
+        (food_items[name].pk, flavor)
+        for name, data in valid.items()
+        for flavor in data.get("flavors", [])
+    }
+    if not wanted:
+        return 0
+    have: set[tuple[int, str]] = set(
+        Flavor.objects.filter(
+            food_item_id__in={food_item_id for food_item_id, _ in wanted}
+        ).values_list("food_item_id", "name")
+    )
+    missing: list[tuple[int, str]] = sorted(wanted - have)
+    Flavor.objects.bulk_create(
+        [
+            Flavor(food_item_id=food_item_id, name=name)
+            for food_item_id, name in missing
+        ],
+        batch_size=IMPORT_BATCH_SIZE,
+    )
+    return len(missing)
+
+
+def add_stock(ice_cream_truck_id: int, stock: dict[int, int]) -> None:
+    # Adds units to the truck's stock rows, creating the missing ones
+    stock = dict(stock)
+    rows: dict[int, tuple[int, int]] = {
+        food_item_id: (row_id, stock_shards)
+        for food_item_id, row_id, stock_shards in TruckStock.objects.filter(
+            ice_cream_truck_id=ice_cream_truck_id, food_item_id__in=stock
+        ).values_list("food_item_id", "id", "stock_shards")
+    }
+    # Sharded rows spread the units over their shards
+    for food_item_id, (_, stock_shards) in rows.items():
+        if stock_shards:
+            restock(ice_cream_truck_id, food_item_id, stock.pop(food_item_id))
+
+    if connection.vendor == "postgresql" and len(stock) >= IMPORT_COPY_THRESHOLD:
+        copy_stock(ice_cream_truck_id, stock)
+        return
+
+    TruckStock.objects.bulk_update(
+        [
+            TruckStock(id=rows[food_item_id][0], stock=F("stock") + units)
+            for food_item_id, units in stock.items()
+            if food_item_id in rows
+        ],
+        ["stock"],
+        batch_size=IMPORT_BATCH_SIZE,
+    )
+    TruckStock.objects.bulk_create(
+        [
+            TruckStock(
+                ice_cream_truck_id=ice_cream_truck_id,
+                food_item_id=food_item_id,
+                stock=units,
+            )
+            for food_item_id, units in stock.items()
+            if food_item_id not in rows
+        ],
+        batch_size=IMPORT_BATCH_SIZE,
+    )
+
+
+def copy_stock(ice_cream_truck_id: int, stock: dict[int, int]) -> None:
+    # PostgreSQL fast path: COPY the units into a temporary table and upsert
+    # them in one statement
+    table: str = connection.ops.quote_name(TruckStock._meta.db_table)
+    data = io.StringIO(
+        "".join(f"{food_item_id},{units}\n" for food_item_id, units in stock.items())
+    )
+    with connection.cursor() as cursor:
+        # Two imports in one outer transaction would otherwise collide
+        cursor.execute("DROP TABLE IF EXISTS truck_stock_import")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE truck_stock_import "
+            "(food_item_id bigint, stock integer) ON COMMIT DROP"
+        )
+        copy_sql = "COPY truck_stock_import FROM STDIN WITH (FORMAT csv)"
+        if hasattr(cursor.cursor, "copy_expert"):
+            # psycopg2
+            cursor.cursor.copy_expert(copy_sql, data)
+        else:
+            with cursor.cursor.copy(copy_sql) as copy:
+                copy.write(data.getvalue())
+        cursor.execute(
+            f"INSERT INTO {table} (ice_cream_truck_id, food_item_id, stock, stock_shards) "
+            "SELECT %s, food_item_id, stock, 0 FROM truck_stock_import "
+            "ON CONFLICT (ice_cream_truck_id, food_item_id) "
+            f"DO UPDATE SET stock = {table}.stock + EXCLUDED.stock",
+            [ice_cream_truck_id],
+        )
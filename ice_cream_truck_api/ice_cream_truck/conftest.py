@@ -0,0 +1,99 @@
+import os
+import time
+from io import StringIO
+from typing import Any, Callable
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .models import Customer, TruckStock
+from .ratelimit import local_buckets
+
+# Wall-time budgets are multiplied by this, e.g. for slow CI machines; 0
+# checks the query counts only
+BUDGET_TIME_SCALE: float = float(os.getenv("BUDGET_TIME_SCALE", "1"))
+
+
+def timed(send: Callable[[], Any]) -> tuple[Any, float]:
+    # The response and the milliseconds it took, streamed content included
+    started = time.perf_counter()
+    response = send()
+    if getattr(response, "streaming", False):
+        b"".join(response.streaming_content)
+    return response, (time.perf_counter() - started) * 1000
+
+
+@pytest.fixture
+def budget_data(db) -> dict[str, int]:
+    # A small seed_load_data set, plus the IDs of a customer who can afford
+    # anything and of a truck with two food items in stock
+    call_command(
+        "seed_load_data",
+        "--seed=24",
+        "--trucks=3",
+        "--food-items=60",
+        "--items-per-truck=20",
+        "--customers=50",
+        "--transactions=2000",
+        stdout=StringIO(),
+    )
+    customer: Customer = Customer.objects.order_by("-pk").first()
+    customer.balance = 1_000_000
+    customer.save(update_fields=["balance"])
+    stock: TruckStock = TruckStock.objects.order_by("-pk").first()
+    other: TruckStock = (
+        TruckStock.objects.filter(ice_cream_truck_id=stock.ice_cream_truck_id)
+        .exclude(food_item_id=stock.food_item_id)
+        .first()
+    )
+    return {
+        "customer": customer.pk,
+        "ice_cream_truck": stock.ice_cream_truck_id,
+        "food_item": stock.food_item_id,
+        "other_food_item": other.food_item_id,
+    }
+
+
+@pytest.fixture
+def within_budget() -> Callable[..., Any]:
+    # check(queries, milliseconds, send) runs send() `repeat` times with a
+    # cold cache, after a warm-up run, and fails listing the SQL if a run
+    # took more than `queries` statements or the fastest run took more than
+    # `milliseconds`. Returns the last response.
+    def check(
+        queries: int,
+        milliseconds: float,
+        send: Callable[[], Any],
+        repeat: int = 3,
+        warm_up: bool = True,
+    ) -> Any:
+        if warm_up:
+            timed(send)
+        fastest: float = float("inf")
+        worst: list[dict[str, str]] = []
+        for _ in range(repeat):
+            cache.clear()
+            local_buckets.clear()
+            with CaptureQueriesContext(connection) as context:
+                response, elapsed = timed(send)
+            fastest = min(fastest, elapsed)
+            if len(context.captured_queries) > len(worst):
+                worst = context.captured_queries
+
+        problems: list[str] = []
+        if len(worst) > queries:
+            problems.append(f"{len(worst)} queries, over the budget of {queries}")
+        limit: float = milliseconds * BUDGET_TIME_SCALE
+        if limit and fastest > limit:
+            problems.append(f"{fastest:.1f}ms, over the budget of {limit:.0f}ms")
+        if problems:
+            statements = "\n".join(
+                f"{index}. {query['sql']}" for index, query in enumerate(worst, 1)
+            )
+            pytest.fail(f"{'; '.join(problems)}:\n{statements}", pytrace=False)
+        return response
+
+    return check
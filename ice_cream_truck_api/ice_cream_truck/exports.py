@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+
+from .models import Transaction
+
+# (column, lookup) for each exported field; the names come from JOINs done
+# by values_list(), so no row triggers a query of its own
+EXPORT_COLUMNS: tuple[tuple[str, str], ...] = (
+    ("id", "id"),
+    ("date", "date"),
+    ("customer_id", "customer_id"),
+    ("customer", "customer__user__username"),
+    ("ice_cream_truck_id", "ice_cream_truck_id"),
+    ("ice_cream_truck", "ice_cream_truck__name"),
+    ("food_item_id", "food_item_id"),
+    ("food_item", "food_item__name"),
+    ("quantity", "quantity"),
+    ("total", "total"),
+)
+EXPORT_CHUNK_SIZE: int = 2000
+CONTENT_TYPES: dict[str, str] = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_rows(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    using: str = "default",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[tuple]:
+    # iterator() streams from a server-side cursor on PostgreSQL (fetchmany()
+    # elsewhere) without filling the queryset cache, so only one chunk of
+    # rows is held at a time. Ordering by id walks the primary key index
+    # rather than sorting the table.
+    return (
+        Transaction.objects.using(using)
+        .in_window(start, end)
+        .order_by("id")
+        .values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def render_csv(
+    rows: Iterable[tuple], chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column for column, _ in EXPORT_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value for value in row
+        )
+        if count % chunk_size == 0:
+            yield flush(buffer)
+    yield flush(buffer)
+
+
+def render_ndjson(
+    rows: Iterable[tuple], chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[str]:
+    buffer = io.StringIO()
+    columns: list[str] = [column for column, _ in EXPORT_COLUMNS]
+    for count, row in enumerate(rows, 1):
+        buffer.write(json.dumps(dict(zip(columns, row)), default=encode) + "\n")
+        if count % chunk_size == 0:
+            yield flush(buffer)
+    yield flush(buffer)
+
+
+RENDERERS = {"csv": render_csv, "ndjson": render_ndjson}
+
+
+async def stream_async(chunks: Iterator[str]) -> AsyncIterator[str]:
+    # Under ASGI a StreamingHttpResponse reads a sync iterator into a list
+    # before sending it, so the export is handed over as an async iterator.
+    # Each chunk is still produced in the thread the view ran in, where its
+    # database connection (and the open cursor) lives.
+    done = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, done)) is not done:
+        yield chunk
+
+
+def flush(buffer: io.StringIO) -> str:
+    # Rows are yielded a chunk at a time; one yield per row would make the
+    # streaming overhead dominate
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def encode(value: Any) -> str:
+    # Decimals keep their exact digits as strings, as in the API
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
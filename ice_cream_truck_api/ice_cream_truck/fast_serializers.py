@@ -0,0 +1,114 @@
+from typing import Any, Callable, Iterable
+
+from django.db.models import QuerySet
+
+from .models import Flavor, FoodItem, Transaction, TruckStock
+from .serializers import (
+    FoodItemSerializer,
+    InventoryItemSerializer,
+    TransactionSerializer,
+)
+from .stock import total_stock
+
+# Read-only counterparts of the list serializers. Rows come straight from
+# values() querysets and only the fields that need formatting go through
+# the serializer field's own to_representation, so the output is the same
+# as the serializer's without building a serializer per object.
+
+
+def formatter(serializer_class: type, field_name: str) -> Callable[[Any], Any]:
+    return serializer_class().fields[field_name].to_representation
+
+
+format_price: Callable[[Any], Any] = formatter(FoodItemSerializer, "price")
+format_stock: Callable[[Any], Any] = formatter(InventoryItemSerializer, "stock")
+format_total: Callable[[Any], Any] = formatter(TransactionSerializer, "total")
+format_date: Callable[[Any], Any] = formatter(TransactionSerializer, "date")
+
+
+def food_item_values() -> QuerySet:
+    # What food_item_rows() needs; also carries the id the keyset
+    # pagination orders by
+    return FoodItem.objects.values("id", "name", "price")
+
+
+def flavors_by_food_item(
+    food_item_ids: Iterable[int], ordering: str
+) -> dict[int, list[dict[str, str]]]:
+    # One query for the flavors of every row, as the prefetch would do
+    flavors: dict[int, list[dict[str, str]]] = {}
+    for food_item_id, name in (
+        Flavor.objects.filter(food_item_id__in=list(food_item_ids))
+        .order_by(ordering)
+        .values_list("food_item_id", "name")
+    ):
+        flavors.setdefault(food_item_id, []).append({"name": name})
+    return flavors
+
+
+def food_item_rows(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    # FoodItemSerializer(many=True).data for food_item_values() rows
+    flavors = flavors_by_food_item((row["id"] for row in rows), "id")
+    return [
+        {
+            "name": row["name"],
+            "price": format_price(row["price"]),
+            "flavors": flavors.get(row["id"], []),
+        }
+        for row in rows
+    ]
+
+
+def inventory(ice_cream_truck: dict[str, Any]) -> dict[str, Any]:
+    # IceCreamTruckSerializer(truck).data for a values("id", "name") row,
+    # with the same two queries the view's prefetches run
+    rows: list[dict[str, Any]] = list(
+        TruckStock.objects.filter(ice_cream_truck_id=ice_cream_truck["id"])
+        .annotate(total_stock=total_stock())
+        .order_by("food_item__name")
+        .values("food_item_id", "food_item__name", "food_item__price", "total_stock")
+    )
+    flavors = flavors_by_food_item((row["food_item_id"] for row in rows), "name")
+    return {
+        "id": ice_cream_truck["id"],
+        "name": ice_cream_truck["name"],
+        "food_items": [
+            {
+                "id": row["food_item_id"],
+                "name": row["food_item__name"],
+                "price": format_price(row["food_item__price"]),
+                "stock": format_stock(row["total_stock"]),
+                "flavors": flavors.get(row["food_item_id"], []),
+            }
+            for row in rows
+        ],
+    }
+
+
+def transaction_values(queryset: QuerySet[Transaction]) -> QuerySet:
+    # Carries the (date, id) the history pagination orders by
+    return queryset.values(
+        "id",
+        "food_item_id",
+        "customer_id",
+        "ice_cream_truck_id",
+        "quantity",
+        "total",
+        "date",
+    )
+
+
+def transaction_rows(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    # TransactionSerializer(many=True).data for transaction_values() rows
+    return [
+        {
+            "id": row["id"],
+            "food_item": row["food_item_id"],
+            "customer": row["customer_id"],
+            "ice_cream_truck": row["ice_cream_truck_id"],
+            "quantity": row["quantity"],
+            "total": format_total(row["total"]),
+            "date": format_date(row["date"]),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,78 @@
+import math
+from typing import Optional
+
+# Truck locations are indexed by grid cell: the world is cut into squares of
+# CELL_DEGREES, numbered row by row from the south-west corner, so the cells
+# of one row are consecutive integers. A search covers its bounding box with
+# one BETWEEN range per row of cells, which any B-tree index answers; no
+# PostGIS or SQLite extension needed. Changing CELL_DEGREES means
+# recomputing every truck's grid_cell.
+CELL_DEGREES: float = 0.05
+ROWS: int = round(180 / CELL_DEGREES)
+COLUMNS: int = round(360 / CELL_DEGREES)
+EARTH_RADIUS_KM: float = 6371.0088
+
+# (min_latitude, max_latitude, [(min_longitude, max_longitude), ...]); a
+# box across the antimeridian has two longitude ranges
+BoundingBox = tuple[float, float, list[tuple[float, float]]]
+
+
+def cell_row(latitude: float) -> int:
+    return min(max(int((latitude + 90) // CELL_DEGREES), 0), ROWS - 1)
+
+
+def cell_column(longitude: float) -> int:
+    return min(max(int((longitude + 180) // CELL_DEGREES), 0), COLUMNS - 1)
+
+
+def grid_cell(latitude: Optional[float], longitude: Optional[float]) -> Optional[int]:
+    if latitude is None or longitude is None:
+        return None
+    return cell_row(latitude) * COLUMNS + cell_column(longitude)
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> BoundingBox:
+    # The smallest latitude/longitude box around the circle, as in
+    # http://janmatuschek.de/LatitudeLongitudeBoundingCoordinates
+    angle: float = radius_km / EARTH_RADIUS_KM
+    delta: float = math.degrees(angle)
+    south, north = latitude - delta, latitude + delta
+    if south <= -90 or north >= 90:
+        # A pole is inside the circle: every longitude is
+        return max(south, -90), min(north, 90), [(-180, 180)]
+    spread: float = math.degrees(
+        math.asin(min(1, math.sin(angle) / math.cos(math.radians(latitude))))
+    )
+    west, east = longitude - spread, longitude + spread
+    if east - west >= 360:
+        return south, north, [(-180, 180)]
+    if west < -180:
+        return south, north, [(west + 360, 180), (-180, east)]
+    if east > 180:
+        return south, north, [(west, 180), (-180, east - 360)]
+    return south, north, [(west, east)]
+
+
+def cell_ranges(box: BoundingBox) -> list[tuple[int, int]]:
+    # The grid cells the box touches, as inclusive ranges: one per row of
+    # cells and longitude range
+    south, north, longitudes = box
+    return [
+        (row * COLUMNS + cell_column(west), row * COLUMNS + cell_column(east))
+        for row in range(cell_row(south), cell_row(north) + 1)
+        for west, east in longitudes
+    ]
+
+
+def distance_km(
+    latitude: float, longitude: float, other_latitude: float, other_longitude: float
+) -> float:
+    # Great-circle (haversine) distance
+    phi, other_phi = math.radians(latitude), math.radians(other_latitude)
+    a: float = (
+        math.sin((other_phi - phi) / 2) ** 2
+        + math.cos(phi)
+        * math.cos(other_phi)
+        * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
@@ -0,0 +1,30 @@
+import logging
+from typing import Any
+
+from django.conf import settings
+
+from .models import TruckStock
+from .outbox import handler
+from .stock import total_stock
+
+logger = logging.getLogger(__name__)
+
+
+@handler("sale")
+def alert_low_stock(payload: dict[str, Any]) -> None:
+    # One query per sale, off the purchase's critical path
+    for food_item, stock in (
+        TruckStock.objects.filter(
+            ice_cream_truck_id=payload["ice_cream_truck_id"],
+            food_item_id__in=payload["food_item_ids"],
+        )
+        .annotate(total_stock=total_stock())
+        .filter(total_stock__lte=settings.LOW_STOCK_THRESHOLD)
+        .values_list("food_item__name", "total_stock")
+    ):
+        logger.warning(
+            "Ice cream truck %s is low on %s: %s left",
+            payload["ice_cream_truck_id"],
+            food_item,
+            stock,
+        )
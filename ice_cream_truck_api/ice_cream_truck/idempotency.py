@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import time
+from asyncio import iscoroutinefunction
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER: str = "Idempotency-Key"
+POLL_SECONDS: float = 0.05
+
+# (request body digest, status code, response data)
+Stored = tuple[str, int, Any]
+
+
+def idempotent(response_class: Callable = Response) -> Callable:
+    # Replays the first response for a repeated Idempotency-Key instead of
+    # running the handler again. Responses live in the cache for
+    # IDEMPOTENCY_KEY_TTL seconds; 5xx responses aren't kept so those retry
+    # for real. A duplicate that arrives while the first request is still
+    # running waits up to IDEMPOTENCY_WAIT_SECONDS for its response.
+    def decorator(method: Callable) -> Callable:
+        if iscoroutinefunction(method):
+
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                key: Optional[str] = request.headers.get(IDEMPOTENCY_HEADER)
+                if key is None:
+                    return await method(view, request, *args, **kwargs)
+                if not valid_key(key):
+                    return invalid_key(response_class)
+                user = await request.auser() if hasattr(request, "auser") else None
+                result_key, lock_key = cache_keys(
+                    request.path, caller(request, user), key
+                )
+                digest = body_digest(request)
+                deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+                while not await cache.aadd(
+                    lock_key, True, settings.IDEMPOTENCY_LOCK_SECONDS
+                ):
+                    stored = await cache.aget(result_key)
+                    if stored is not None:
+                        return replay(response_class, stored, digest)
+                    if time.monotonic() > deadline:
+                        return in_progress(response_class)
+                    await asyncio.sleep(POLL_SECONDS)
+                try:
+                    stored = await cache.aget(result_key)
+                    if stored is not None:
+                        return replay(response_class, stored, digest)
+                    response = await method(view, request, *args, **kwargs)
+                    if response.status_code < 500:
+                        await cache.aset(
+                            result_key,
+                            store(response, digest),
+                            settings.IDEMPOTENCY_KEY_TTL,
+                        )
+                    return response
+                finally:
+                    await cache.adelete(lock_key)
+
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key: Optional[str] = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return method(view, request, *args, **kwargs)
+            if not valid_key(key):
+                return invalid_key(response_class)
+            user = getattr(request, "user", None)
+            result_key, lock_key = cache_keys(request.path, caller(request, user), key)
+            digest = body_digest(request)
+            deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+            while not cache.add(lock_key, True, settings.IDEMPOTENCY_LOCK_SECONDS):
+                stored = cache.get(result_key)
+                if stored is not None:
+                    return replay(response_class, stored, digest)
+                if time.monotonic() > deadline:
+                    return in_progress(response_class)
+                time.sleep(POLL_SECONDS)
+            try:
+                # Checked under the lock, so two requests can't both miss it
+                stored = cache.get(result_key)
+                if stored is not None:
+                    return replay(response_class, stored, digest)
+                response = method(view, request, *args, **kwargs)
+                if response.status_code < 500:
+                    cache.set(
+                        result_key,
+                        store(response, digest),
+                        settings.IDEMPOTENCY_KEY_TTL,
+                    )
+                return response
+            finally:
+                cache.delete(lock_key)
+
+        return wrapper
+
+    return decorator
+
+
+def valid_key(key: str) -> bool:
+    return 0 < len(key) <= 255
+
+
+def caller(request, user: Any) -> str:
+    # Who a key belongs to: the signed-in user or, for anonymous purchases,
+    # the customer being charged
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"customer:{body_customer_id(request)}"
+
+
+def body_customer_id(request) -> Any:
+    data: Any = getattr(request, "data", None)
+    if data is None:
+        if request.content_type != "application/json":
+            data = request.POST
+        else:
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                return None
+    return data.get("customer_id") if isinstance(data, dict) else None
+
+
+def cache_keys(path: str, caller: str, key: str) -> tuple[str, str]:
+    # Keys are scoped to the endpoint and the caller, so one key can't replay
+    # another route, nor another client's response
+    digest = hashlib.sha256(f"{path}\n{caller}\n{key}".encode()).hexdigest()
+    return f"idempotency:{digest}", f"idempotency-lock:{digest}"
+
+
+def body_digest(request) -> str:
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def store(response, digest: str) -> Stored:
+    data = getattr(response, "data", None)
+    if data is None:
+        data = json.loads(response.content)
+    return digest, response.status_code, data
+
+
+def replay(response_class: Callable, stored: Stored, digest: str):
+    stored_digest, status_code, data = stored
+    if stored_digest != digest:
+        return response_class(
+            {"message": f"{IDEMPOTENCY_HEADER} was reused with a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = response_class(data, status=status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def invalid_key(response_class: Callable):
+    return response_class(
+        {"message": f"{IDEMPOTENCY_HEADER} must be 1 to 255 characters"},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def in_progress(response_class: Callable):
+    return response_class(
+        {"message": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+        status=status.HTTP_409_CONFLICT,
+    )
@@ -0,0 +1,279 @@
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .geo import grid_cell
+from .models import (
+    Customer,
+    Flavor,
+    FoodItem,
+    IceCreamTruck,
+    Transaction,
+    TruckStock,
+)
+
+User = get_user_model()
+
+# Rows are generated in blocks, each from its own RNG seeded with
+# (seed, table, block), so the data only depends on the seed and volumes:
+# not on the batch size or on how many processes share the work. A block is
+# also all that is held in memory at a time.
+BLOCK_SIZE: int = 10_000
+FLAVOR_NAMES: tuple[str, ...] = (
+    "Vanilla",
+    "Chocolate",
+    "Strawberry",
+    "Pistachio",
+    "Mint",
+    "Mango",
+    "Blueberry",
+    "Caramel",
+)
+# Trucks are spread evenly over this (south, north, west, east) area, about
+# 220 by 280 km around London
+TRUCK_AREA: tuple[float, float, float, float] = (50.5, 52.5, -2.5, 1.5)
+SEEDED_MODELS: tuple[type, ...] = (
+    User,
+    Customer,
+    IceCreamTruck,
+    FoodItem,
+    Flavor,
+    TruckStock,
+    Transaction,
+)
+
+
+@dataclass(frozen=True)
+class LoadPlan:
+    seed: int
+    trucks: int
+    food_items: int
+    items_per_truck: int
+    customers: int
+    transactions: int
+    # Transactions are spread over the `days` before `end`
+    days: int
+    end: datetime
+    batch_size: int
+    # The seeded rows get the IDs after these, so rows can refer to each
+    # other without reading anything back
+    user_base: int = 0
+    customer_base: int = 0
+    truck_base: int = 0
+    food_item_base: int = 0
+    transaction_base: int = 0
+
+
+def id_bases() -> dict[str, int]:
+    # The highest ID of each table that seeded rows refer to
+    return {
+        f"{name}_base": model.objects.aggregate(top=Max("pk"))["top"] or 0
+        for name, model in (
+            ("user", User),
+            ("customer", Customer),
+            ("truck", IceCreamTruck),
+            ("food_item", FoodItem),
+            ("transaction", Transaction),
+        )
+    }
+
+
+def block_rng(plan: LoadPlan, table: str, block: int) -> random.Random:
+    return random.Random(f"{plan.seed}:{table}:{block}")
+
+
+def blocks(count: int) -> range:
+    return range((count + BLOCK_SIZE - 1) // BLOCK_SIZE)
+
+
+def block_range(count: int, block: int) -> range:
+    return range(block * BLOCK_SIZE, min(count, (block + 1) * BLOCK_SIZE))
+
+
+@lru_cache(maxsize=4)
+def catalog(plan: LoadPlan) -> tuple[list[Decimal], list[list[int]]]:
+    # Food item prices, and the food items (as indexes) each truck carries.
+    # Recomputed from the seed by every process that needs them.
+    rng = random.Random(f"{plan.seed}:catalog")
+    prices: list[Decimal] = [
+        Decimal(rng.randint(99, 999)) / 100 for _ in range(plan.food_items)
+    ]
+    carried: int = min(plan.items_per_truck, plan.food_items)
+    truck_items: list[list[int]] = [
+        sorted(rng.sample(range(plan.food_items), carried)) for _ in range(plan.trucks)
+    ]
+    return prices, truck_items
+
+
+def truck_at(pk: int, latitude: float, longitude: float) -> IceCreamTruck:
+    # bulk_create() skips save(), which fills in grid_cell
+    return IceCreamTruck(
+        id=pk,
+        name=f"Load Truck {pk}",
+        latitude=latitude,
+        longitude=longitude,
+        grid_cell=grid_cell(latitude, longitude),
+    )
+
+
+def seed_catalog(plan: LoadPlan) -> dict[str, int]:
+    # Trucks, food items, flavors and stock; small next to the customers and
+    # transactions, so always in this process
+    prices, truck_items = catalog(plan)
+    for block in blocks(plan.trucks):
+        rng = block_rng(plan, "trucks", block)
+        IceCreamTruck.objects.bulk_create(
+            (
+                truck_at(
+                    plan.truck_base + index + 1,
+                    rng.uniform(*TRUCK_AREA[:2]),
+                    rng.uniform(*TRUCK_AREA[2:]),
+                )
+                for index in block_range(plan.trucks, block)
+            ),
+            batch_size=plan.batch_size,
+        )
+    flavors: int = 0
+    for block in blocks(plan.food_items):
+        rng = block_rng(plan, "food_items", block)
+        indexes = block_range(plan.food_items, block)
+        FoodItem.objects.bulk_create(
+            (
+                FoodItem(
+                    id=plan.food_item_base + index + 1,
+                    name=f"Load Item {plan.food_item_base + index + 1}",
+                    price=prices[index],
+                )
+                for index in indexes
+            ),
+            batch_size=plan.batch_size,
+        )
+        rows: list[Flavor] = [
+            Flavor(food_item_id=plan.food_item_base + index + 1, name=name)
+            for index in indexes
+            for name in rng.sample(FLAVOR_NAMES, rng.randint(0, 3))
+        ]
+        Flavor.objects.bulk_create(rows, batch_size=plan.batch_size)
+        flavors += len(rows)
+    stock: int = 0
+    for truck, items in enumerate(truck_items):
+        rng = block_rng(plan, "stock", truck)
+        TruckStock.objects.bulk_create(
+            (
+                TruckStock(
+                    ice_cream_truck_id=plan.truck_base + truck + 1,
+                    food_item_id=plan.food_item_base + index + 1,
+                    stock=rng.randint(100, 10_000),
+                )
+                for index in items
+            ),
+            batch_size=plan.batch_size,
+        )
+        stock += len(items)
+    return {
+        "trucks": plan.trucks,
+        "food items": plan.food_items,
+        "flavors": flavors,
+        "stock rows": stock,
+    }
+
+
+def seed_customers(plan: LoadPlan, block: int) -> int:
+    rng = block_rng(plan, "customers", block)
+    indexes = block_range(plan.customers, block)
+    with transaction.atomic():
+        User.objects.bulk_create(
+            (
+                User(
+                    id=plan.user_base + index + 1,
+                    username=f"load-{plan.user_base + index + 1}",
+                    # Unusable, and cheaper than hashing a million passwords
+                    password="!",
+                )
+                for index in indexes
+            ),
+            batch_size=plan.batch_size,
+        )
+        Customer.objects.bulk_create(
+            (
+                Customer(
+                    id=plan.customer_base + index + 1,
+                    user_id=plan.user_base + index + 1,
+                    balance=Decimal(rng.randint(0, 999_999)) / 100,
+                )
+                for index in indexes
+            ),
+            batch_size=plan.batch_size,
+        )
+    return len(indexes)
+
+
+def seed_transactions(plan: LoadPlan, block: int) -> int:
+    prices, truck_items = catalog(plan)
+    rng = block_rng(plan, "transactions", block)
+    span: int = plan.days * 24 * 60 * 60
+    indexes = block_range(plan.transactions, block)
+
+    rows: list[Transaction] = []
+    dates: list[datetime] = []
+    for index in indexes:
+        truck: int = rng.randrange(plan.trucks)
+        item: int = rng.choice(truck_items[truck])
+        quantity: int = rng.randint(1, 3)
+        rows.append(
+            Transaction(
+                id=plan.transaction_base + index + 1,
+                food_item_id=plan.food_item_base + item + 1,
+                customer_id=plan.customer_base + rng.randrange(plan.customers) + 1,
+                ice_cream_truck_id=plan.truck_base + truck + 1,
+                quantity=quantity,
+                total=prices[item] * quantity,
+            )
+        )
+        dates.append(plan.end - timedelta(seconds=rng.randrange(span)))
+
+    with transaction.atomic():
+        # Transaction.date is auto_now_add, which bulk_create stamps on every
+        # row; the generated dates are written over it in the same transaction
+        Transaction.objects.bulk_create(rows, batch_size=plan.batch_size)
+        for row, date in zip(rows, dates):
+            row.date = date
+        Transaction.objects.bulk_update(rows, ["date"], batch_size=plan.batch_size)
+    return len(indexes)
+
+
+# Tables that can be spread over worker processes: (rows in the plan, seeder)
+PARALLEL_TABLES = {
+    "customers": (lambda plan: plan.customers, seed_customers),
+    "transactions": (lambda plan: plan.transactions, seed_transactions),
+}
+
+
+def seed_block(job: tuple[LoadPlan, str, int]) -> int:
+    plan, table, block = job
+    return PARALLEL_TABLES[table][1](plan, block)
+
+
+def start_worker() -> None:
+    # Spawned workers start from scratch; forked ones already are set up and
+    # open their own connections, as the parent closes its own before forking
+    django.setup()
+
+
+def reset_sequences() -> None:
+    # The rows were inserted with explicit IDs, which PostgreSQL sequences
+    # don't see
+    statements: list[str] = connection.ops.sequence_reset_sql(
+        no_style(), list(SEEDED_MODELS)
+    )
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ice_cream_truck_api.openapi import artifact_path, build_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the OpenAPI schema as versioned JSON and YAML files for the "
+        "schema endpoints to serve. Run at build time, after any API change."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--output-dir", help="Where to write the files (default: OPENAPI_DIR)"
+        )
+
+    def handle(self, *args, **options) -> None:
+        for extension, content in build_schema().items():
+            path: Path = artifact_path(extension, options["output_dir"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+            self.stdout.write(f"Wrote {path} ({len(content)} bytes)")
+        self.stdout.write(self.style.SUCCESS("OpenAPI schema built."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ice_cream_truck.exports import EXPORT_CHUNK_SIZE, RENDERERS, export_rows
+from ice_cream_truck.views import parse_window_bound
+
+
+class Command(BaseCommand):
+    help = "Stream transactions as CSV or NDJSON, in constant memory"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--format", choices=sorted(RENDERERS), default="csv")
+        parser.add_argument("--from", dest="start", help="Date or ISO datetime")
+        parser.add_argument("--to", dest="end", help="Date or ISO datetime, exclusive")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options) -> None:
+        try:
+            start = parse_window_bound(options["start"])
+            end = parse_window_bound(options["end"])
+        except ValueError as error:
+            raise CommandError(f"Invalid time window: {error}")
+
+        chunks = RENDERERS[options["format"]](
+            export_rows(start, end, options["database"], options["chunk_size"]),
+            options["chunk_size"],
+        )
+        if not options["output"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        with open(options["output"], "w", newline="", encoding="utf-8") as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}."))
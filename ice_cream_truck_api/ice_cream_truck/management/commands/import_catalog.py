@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ice_cream_truck.catalog_import import import_catalog, parse_csv
+from ice_cream_truck.models import IceCreamTruck
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update food items, flavors and a truck's stock from a JSON or "
+        "CSV file (columns: name, price, flavors separated by ';', stock)"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path", help="JSON list of rows or CSV file")
+        parser.add_argument(
+            "--format", choices=["json", "csv"], help="Default: from the extension"
+        )
+        parser.add_argument("--truck", type=int, help="Truck to add the stock to")
+
+    def handle(self, *args, **options) -> None:
+        path = Path(options["path"])
+        import_format: str = options["format"] or path.suffix.lstrip(".").lower()
+        if import_format not in ("json", "csv"):
+            raise CommandError("Pass --format json or --format csv")
+        if (
+            options["truck"] is not None
+            and not IceCreamTruck.objects.filter(pk=options["truck"]).exists()
+        ):
+            raise CommandError(f"Ice cream truck {options['truck']} does not exist")
+
+        text: str = path.read_text(encoding="utf-8")
+        try:
+            rows = json.loads(text) if import_format == "json" else parse_csv(text)
+        except ValueError as error:
+            raise CommandError(f"Could not parse {path}: {error}")
+        if not isinstance(rows, list):
+            raise CommandError("Expected a list of rows")
+
+        applied, report = import_catalog(rows, options["truck"])
+        if not applied:
+            for entry in report["rows"]:
+                if entry["status"] == "invalid":
+                    self.stderr.write(
+                        f"Row {entry['row']}: {json.dumps(entry['errors'])}"
+                    )
+            raise CommandError(report["message"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']} and repriced {report['repriced']} food "
+                f"items, added {report['flavors_created']} flavors and restocked "
+                f"{report['restocked']} items."
+            )
+        )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ice_cream_truck.models import TruckStock
+from ice_cream_truck.stock import spread_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Spread each truck's stock of a food item evenly over its stock shards. "
+        "With --shards, shard the stock into that many rows (0 turns sharding off)."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "food_item_ids",
+            nargs="*",
+            type=int,
+            help="Food items to rebalance (default: every sharded item)",
+        )
+        parser.add_argument("--truck", type=int, help="Only this ice cream truck")
+        parser.add_argument("--shards", type=int, help="New number of shards")
+
+    def handle(self, *args, **options) -> None:
+        if options["shards"] is not None and options["shards"] < 0:
+            raise CommandError("--shards can't be negative")
+
+        rows = TruckStock.objects.order_by("pk")
+        if options["truck"] is not None:
+            rows = rows.filter(ice_cream_truck_id=options["truck"])
+        if options["food_item_ids"]:
+            rows = rows.filter(food_item_id__in=options["food_item_ids"])
+        elif options["shards"] is None:
+            rows = rows.filter(stock_shards__gt=0)
+
+        count: int = 0
+        for row_id, truck_id, food_item_id, stock_shards in rows.values_list(
+            "pk", "ice_cream_truck_id", "food_item_id", "stock_shards"
+        ):
+            shards = stock_shards if options["shards"] is None else options["shards"]
+            stock = spread_stock(row_id, shards)
+            self.stdout.write(
+                f"Truck {truck_id}, food item {food_item_id}: "
+                f"{stock} over {shards} shards"
+            )
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebalanced {count} stock rows."))
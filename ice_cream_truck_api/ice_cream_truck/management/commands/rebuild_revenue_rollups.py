@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ice_cream_truck.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the revenue rollups from Transaction"
+
+    def handle(self, *args, **options) -> None:
+        count: int = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} revenue rollups."))
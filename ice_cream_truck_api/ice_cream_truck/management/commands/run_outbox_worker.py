@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ice_cream_truck.outbox import process_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Handle pending outbox events in batches until stopped. Several "
+        "workers can run side by side on PostgreSQL; each claims its own batch."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=0,
+            help="Events claimed per transaction (default: OUTBOX_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when no event is due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no event is due instead of polling",
+        )
+
+    def handle(self, *args, **options) -> None:
+        if options["batch_size"] < 0:
+            raise CommandError("--batch-size can't be negative")
+
+        total: int = 0
+        try:
+            while True:
+                claimed: int = process_batch(options["batch_size"])
+                total += claimed
+                if claimed:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} outbox events."))
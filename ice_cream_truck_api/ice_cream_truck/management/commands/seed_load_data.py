@@ -0,0 +1,136 @@
+import multiprocessing
+import time
+from datetime import datetime, time as day_start
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from ice_cream_truck.catalog_cache import bump_catalog_version
+from ice_cream_truck.load_data import (
+    PARALLEL_TABLES,
+    LoadPlan,
+    blocks,
+    id_bases,
+    reset_sequences,
+    seed_block,
+    seed_catalog,
+    start_worker,
+)
+from ice_cream_truck.models import IceCreamTruck
+from ice_cream_truck.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Add a large, deterministic data set for performance testing. The same "
+        "--seed and volumes always produce the same rows, e.g. --trucks 500 "
+        "--food-items 10000 --customers 1000000 --transactions 50000000."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--trucks", type=int, default=10)
+        parser.add_argument("--food-items", type=int, default=100)
+        parser.add_argument(
+            "--items-per-truck",
+            type=int,
+            default=50,
+            help="Food items each truck stocks",
+        )
+        parser.add_argument("--customers", type=int, default=1000)
+        parser.add_argument("--transactions", type=int, default=10000)
+        parser.add_argument(
+            "--days", type=int, default=90, help="Days the transactions span"
+        )
+        parser.add_argument(
+            "--end-date",
+            help="Transactions are dated before this day (default: today)",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes for the customers and transactions (PostgreSQL only)",
+        )
+
+    def handle(self, *args, **options) -> None:
+        self.verbosity: int = options["verbosity"]
+        counts = [
+            options[name]
+            for name in ("trucks", "food_items", "customers", "transactions")
+        ]
+        if min(counts) < 0 or min(options["days"], options["batch_size"]) < 1:
+            raise CommandError("Volumes can't be negative")
+        if options["transactions"] and not all(counts[:3]):
+            raise CommandError(
+                "Transactions need trucks, food items and customers to refer to"
+            )
+        if options["items_per_truck"] < 1:
+            raise CommandError("--items-per-truck must be at least 1")
+        if options["workers"] > 1 and connection.vendor == "sqlite":
+            raise CommandError("SQLite takes one writer at a time; use --workers 1")
+
+        end_date = timezone.localdate()
+        if options["end_date"]:
+            end_date = parse_date(options["end_date"])
+            if end_date is None:
+                raise CommandError("--end-date must be YYYY-MM-DD")
+
+        plan = LoadPlan(
+            seed=options["seed"],
+            trucks=options["trucks"],
+            food_items=options["food_items"],
+            items_per_truck=options["items_per_truck"],
+            customers=options["customers"],
+            transactions=options["transactions"],
+            days=options["days"],
+            end=timezone.make_aware(datetime.combine(end_date, day_start.min)),
+            batch_size=options["batch_size"],
+            **id_bases(),
+        )
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            for table, count in seed_catalog(plan).items():
+                self.stdout.write(f"Created {count} {table}")
+        for table, (size, _) in PARALLEL_TABLES.items():
+            self.seed_table(plan, table, size(plan), options["workers"])
+
+        reset_sequences()
+        # Only the seeded trucks have new transactions
+        rebuilt: int = rebuild_rollups(
+            IceCreamTruck.objects.filter(
+                pk__gt=plan.truck_base, pk__lte=plan.truck_base + plan.trucks
+            ),
+            batch_size=plan.batch_size,
+        )
+        bump_catalog_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded in {time.perf_counter() - started:.1f}s; "
+                f"rebuilt {rebuilt} revenue rollups."
+            )
+        )
+
+    def seed_table(self, plan: LoadPlan, table: str, total: int, workers: int) -> None:
+        jobs = [(plan, table, block) for block in blocks(total)]
+        done: int = 0
+        if workers > 1:
+            # Children must not share the parent's connections
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=start_worker) as pool:
+                for rows in pool.imap_unordered(seed_block, jobs):
+                    done += rows
+                    self.progress(table, done, total)
+        else:
+            for job in jobs:
+                done += seed_block(job)
+                self.progress(table, done, total)
+        self.stdout.write(f"Created {done} {table}")
+
+    def progress(self, table: str, done: int, total: int) -> None:
+        if self.verbosity > 1:
+            self.stdout.write(f"  {table}: {done}/{total}")
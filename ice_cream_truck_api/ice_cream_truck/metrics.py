@@ -0,0 +1,279 @@
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+from asyncio import iscoroutinefunction
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# Seconds between snapshots of a process's counters to METRICS_DIR
+FLUSH_SECONDS: float = 1.0
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        self.queries: int = 0
+        self.db_seconds: float = 0.0
+
+
+# Per-request DB stats. A ContextVar (rather than a thread local) follows the
+# request into the threads sync_to_async runs ORM calls on.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class Registry:
+    # Counters for this process. With METRICS_DIR set, each process also
+    # snapshots them to <METRICS_DIR>/<pid>.json, from a background thread
+    # every FLUSH_SECONDS and once more at exit, and /metrics sums every
+    # snapshot so any worker can answer for the whole server.
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.data: dict[str, dict] = self.empty()
+        self.dirty: bool = False
+        # The process the flusher thread runs in; a forked worker starts its own
+        self.flusher_pid: Optional[int] = None
+
+    @staticmethod
+    def empty() -> dict[str, dict]:
+        return {"requests": {}, "latency": {}, "db_queries": {}, "db_seconds": {}}
+
+    def observe(
+        self, view: str, method: str, status: int, seconds: float, stats: RequestStats
+    ) -> None:
+        with self.lock:
+            key = f"{view}|{method}|{status}"
+            self.data["requests"][key] = self.data["requests"].get(key, 0) + 1
+            histogram = self.data["latency"].setdefault(
+                view, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            )
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            queries, db_seconds = self.data["db_queries"], self.data["db_seconds"]
+            queries[view] = queries.get(view, 0) + stats.queries
+            db_seconds[view] = db_seconds.get(view, 0.0) + stats.db_seconds
+            self.dirty = True
+        if settings.METRICS_DIR and self.flusher_pid != os.getpid():
+            self.start_flusher()
+
+    def start_flusher(self) -> None:
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        threading.Thread(
+            target=self.flush_periodically, name="metrics-flush", daemon=True
+        ).start()
+        atexit.register(self.flush_quietly)
+
+    def flush_periodically(self) -> None:
+        # Snapshots reach the other workers even when no request comes in
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            if self.dirty:
+                self.flush_quietly()
+
+    def flush_quietly(self) -> None:
+        if not settings.METRICS_DIR:
+            return
+        try:
+            self.flush()
+        except OSError:
+            # Lost counters aren't worth taking the worker down for
+            pass
+
+    def flush(self) -> None:
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            snapshot = json.dumps(self.data)
+            self.dirty = False
+        # Written aside and renamed so readers never see a partial file
+        temporary = directory / f".{os.getpid()}.json.tmp"
+        temporary.write_text(snapshot)
+        os.replace(temporary, directory / f"{os.getpid()}.json")
+
+    def collect(self) -> dict[str, dict]:
+        if not settings.METRICS_DIR:
+            with self.lock:
+                return json.loads(json.dumps(self.data))
+        self.flush()
+        merged = self.empty()
+        for path in Path(settings.METRICS_DIR).glob("*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name in ("requests", "db_queries", "db_seconds"):
+                for key, value in snapshot[name].items():
+                    merged[name][key] = merged[name].get(key, 0) + value
+            for view, histogram in snapshot["latency"].items():
+                total = merged["latency"].setdefault(
+                    view,
+                    {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0},
+                )
+                total["buckets"] = [
+                    a + b for a, b in zip(total["buckets"], histogram["buckets"])
+                ]
+                total["sum"] += histogram["sum"]
+                total["count"] += histogram["count"]
+        return merged
+
+
+registry = Registry()
+
+
+def record_query(execute: Callable, sql: str, params: Any, many: bool, context: dict):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - started
+        stats.queries += 1
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs) -> None:
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response: Callable) -> Callable:
+    # Records latency, status, query count and DB time per URL name
+    def finish(request, response, started: float, stats: RequestStats) -> None:
+        match = getattr(request, "resolver_match", None)
+        registry.observe(
+            match.view_name if match else "unmatched",
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            stats,
+        )
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            stats = RequestStats()
+            token = _request_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _request_stats.reset(token)
+            finish(request, response, started, stats)
+            return response
+
+    else:
+
+        def middleware(request):
+            stats = RequestStats()
+            token = _request_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _request_stats.reset(token)
+            finish(request, response, started, stats)
+            return response
+
+    return middleware
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(data: dict[str, dict]) -> str:
+    lines: list[str] = [
+        "# HELP http_requests_total Requests by URL name, method and status.",
+        "# TYPE http_requests_total counter",
+    ]
+    for key, count in sorted(data["requests"].items()):
+        view, method, status = key.split("|")
+        lines.append(
+            f'http_requests_total{{view="{escape(view)}",method="{method}",'
+            f'status="{status}"}} {count}'
+        )
+
+    lines += [
+        "# HELP http_request_duration_seconds Request latency by URL name.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for view, histogram in sorted(data["latency"].items()):
+        label = f'view="{escape(view)}"'
+        for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+            lines.append(
+                f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}'
+            )
+        lines += [
+            f'http_request_duration_seconds_bucket{{{label},le="+Inf"}} '
+            f'{histogram["count"]}',
+            f'http_request_duration_seconds_sum{{{label}}} {histogram["sum"]}',
+            f'http_request_duration_seconds_count{{{label}}} {histogram["count"]}',
+        ]
+
+    lines += [
+        "# HELP db_queries_total SQL queries run while serving requests, by URL name.",
+        "# TYPE db_queries_total counter",
+    ]
+    for view, count in sorted(data["db_queries"].items()):
+        lines.append(f'db_queries_total{{view="{escape(view)}"}} {count}')
+
+    lines += [
+        "# HELP db_query_seconds_total Time spent in SQL queries, by URL name.",
+        "# TYPE db_query_seconds_total counter",
+    ]
+    for view, seconds in sorted(data["db_seconds"].items()):
+        lines.append(f'db_query_seconds_total{{view="{escape(view)}"}} {seconds}')
+    return "\n".join(lines) + "\n"
+
+
+def may_scrape(request) -> bool:
+    # Scrapers present "Authorization: Bearer <METRICS_TOKEN>"; without a
+    # token only METRICS_ALLOWED_ADDRESSES (the host itself by default) may
+    # read the metrics
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        return hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(), expected.encode()
+        )
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_ADDRESSES
+
+
+def metrics_view(request) -> HttpResponse:
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(registry.collect()), content_type="text/plain; version=0.0.4"
+    )
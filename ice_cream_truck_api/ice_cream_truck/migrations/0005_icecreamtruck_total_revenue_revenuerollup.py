@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0004_remove_customer_name_customer_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="icecreamtruck",
+            name="total_revenue",
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+        ),
+        migrations.CreateModel(
+            name="RevenueRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=4
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+                ),
+                ("units_sold", models.IntegerField(default=0)),
+                (
+                    "ice_cream_truck",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="ice_cream_truck.icecreamtruck",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("ice_cream_truck", "period", "bucket"),
+                        name="unique_revenue_rollup",
+                    )
+                ],
+            },
+        ),
+    ]
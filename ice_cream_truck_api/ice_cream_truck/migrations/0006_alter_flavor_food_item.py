@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0005_icecreamtruck_total_revenue_revenuerollup"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="flavor",
+            name="food_item",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="flavors",
+                to="ice_cream_truck.fooditem",
+            ),
+        ),
+    ]
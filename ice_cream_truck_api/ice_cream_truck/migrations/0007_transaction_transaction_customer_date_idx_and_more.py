@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0006_alter_flavor_food_item"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["customer", "date", "id"], name="transaction_customer_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["ice_cream_truck", "date", "id"],
+                name="transaction_truck_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0007_transaction_transaction_customer_date_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fooditem",
+            name="stock_shards",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="StockShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("stock", models.IntegerField(default=0)),
+                (
+                    "food_item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_shard_rows",
+                        to="ice_cream_truck.fooditem",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("food_item", "shard"), name="unique_stock_shard"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,174 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_stock_between_trucks(apps, schema_editor) -> None:
+    # Each truck that carried an item gets an even share of its old global
+    # stock (shards included); sharding is switched off and can be turned
+    # back on per truck with rebalance_stock_shards
+    FoodItem = apps.get_model("ice_cream_truck", "FoodItem")
+    IceCreamTruck = apps.get_model("ice_cream_truck", "IceCreamTruck")
+    StockShard = apps.get_model("ice_cream_truck", "StockShard")
+    TruckStock = apps.get_model("ice_cream_truck", "TruckStock")
+    Through = IceCreamTruck.food_items.through
+    db_alias: str = schema_editor.connection.alias
+
+    carried: dict[int, list[int]] = {}
+    for truck_id, food_item_id in (
+        Through.objects.using(db_alias)
+        .order_by("icecreamtruck_id")
+        .values_list("icecreamtruck_id", "fooditem_id")
+    ):
+        carried.setdefault(food_item_id, []).append(truck_id)
+    shard_stock: dict[int, int] = {}
+    for food_item_id, stock in StockShard.objects.using(db_alias).values_list(
+        "food_item_id", "stock"
+    ):
+        shard_stock[food_item_id] = shard_stock.get(food_item_id, 0) + stock
+
+    rows = []
+    for food_item_id, stock in FoodItem.objects.using(db_alias).values_list(
+        "id", "stock"
+    ):
+        trucks = carried.get(food_item_id, [])
+        if not trucks:
+            continue
+        share, extra = divmod(stock + shard_stock.get(food_item_id, 0), len(trucks))
+        rows += [
+            TruckStock(
+                ice_cream_truck_id=truck_id,
+                food_item_id=food_item_id,
+                stock=share + (index < extra),
+            )
+            for index, truck_id in enumerate(trucks)
+        ]
+    TruckStock.objects.using(db_alias).bulk_create(rows, batch_size=1000)
+
+
+def merge_truck_stock(apps, schema_editor) -> None:
+    FoodItem = apps.get_model("ice_cream_truck", "FoodItem")
+    IceCreamTruck = apps.get_model("ice_cream_truck", "IceCreamTruck")
+    TruckStock = apps.get_model("ice_cream_truck", "TruckStock")
+    Through = IceCreamTruck.food_items.through
+    db_alias: str = schema_editor.connection.alias
+
+    totals: dict[int, int] = {}
+    links = []
+    for truck_id, food_item_id, stock in TruckStock.objects.using(db_alias).values_list(
+        "ice_cream_truck_id", "food_item_id", "stock"
+    ):
+        totals[food_item_id] = totals.get(food_item_id, 0) + stock
+        links.append(Through(icecreamtruck_id=truck_id, fooditem_id=food_item_id))
+    Through.objects.using(db_alias).bulk_create(links, batch_size=1000)
+    for food_item_id, stock in totals.items():
+        # The old column is a smallint
+        FoodItem.objects.using(db_alias).filter(pk=food_item_id).update(
+            stock=min(stock, 32767)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0008_fooditem_stock_shards_stockshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TruckStock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stock", models.IntegerField(default=0)),
+                ("stock_shards", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "food_item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_rows",
+                        to="ice_cream_truck.fooditem",
+                    ),
+                ),
+                (
+                    "ice_cream_truck",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_rows",
+                        to="ice_cream_truck.icecreamtruck",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("ice_cream_truck", "food_item"),
+                        name="unique_truck_stock",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(split_stock_between_trucks, merge_truck_stock),
+        # A field can't switch to a custom through model in place
+        migrations.RemoveField(
+            model_name="icecreamtruck",
+            name="food_items",
+        ),
+        migrations.AddField(
+            model_name="icecreamtruck",
+            name="food_items",
+            field=models.ManyToManyField(
+                through="ice_cream_truck.TruckStock", to="ice_cream_truck.fooditem"
+            ),
+        ),
+        # Shards now belong to a truck's stock row; the old ones were folded
+        # into TruckStock.stock above
+        migrations.DeleteModel(
+            name="StockShard",
+        ),
+        migrations.CreateModel(
+            name="StockShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("stock", models.IntegerField(default=0)),
+                (
+                    "truck_stock",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="ice_cream_truck.truckstock",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("truck_stock", "shard"), name="unique_stock_shard"
+                    )
+                ],
+            },
+        ),
+        migrations.RemoveField(
+            model_name="fooditem",
+            name="stock",
+        ),
+        migrations.RemoveField(
+            model_name="fooditem",
+            name="stock_shards",
+        ),
+    ]
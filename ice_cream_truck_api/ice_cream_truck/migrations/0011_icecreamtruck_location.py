@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0010_outboxevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="icecreamtruck",
+            name="grid_cell",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="icecreamtruck",
+            name="latitude",
+            field=models.FloatField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(-90),
+                    django.core.validators.MaxValueValidator(90),
+                ],
+            ),
+        ),
+        migrations.AddField(
+            model_name="icecreamtruck",
+            name="longitude",
+            field=models.FloatField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(-180),
+                    django.core.validators.MaxValueValidator(180),
+                ],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="icecreamtruck",
+            index=models.Index(
+                fields=["grid_cell", "latitude", "longitude"], name="truck_location_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Sum
+
+
+def restore_total_revenue(apps, schema_editor) -> None:
+    IceCreamTruck = apps.get_model("ice_cream_truck", "IceCreamTruck")
+    RevenueRollup = apps.get_model("ice_cream_truck", "RevenueRollup")
+    db_alias: str = schema_editor.connection.alias
+
+    for truck_id, revenue in (
+        RevenueRollup.objects.using(db_alias)
+        .filter(period="day")
+        .values("ice_cream_truck_id")
+        .annotate(revenue=Sum("revenue"))
+        .values_list("ice_cream_truck_id", "revenue")
+        .order_by()
+        .iterator()
+    ):
+        IceCreamTruck.objects.using(db_alias).filter(id=truck_id).update(
+            total_revenue=revenue
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0011_icecreamtruck_location"),
+    ]
+
+    operations = [
+        # Trucks' rollups are filled in from their transactions by 0014
+        migrations.RunPython(migrations.RunPython.noop, restore_total_revenue),
+        migrations.RemoveField(
+            model_name="icecreamtruck",
+            name="total_revenue",
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0012_remove_icecreamtruck_total_revenue"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="revenuerollup",
+            name="unique_revenue_rollup",
+        ),
+        migrations.AddField(
+            model_name="revenuerollup",
+            name="shard",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name="revenuerollup",
+            constraint=models.UniqueConstraint(
+                fields=("ice_cream_truck", "period", "bucket", "shard"),
+                name="unique_revenue_rollup_shard",
+            ),
+        ),
+    ]
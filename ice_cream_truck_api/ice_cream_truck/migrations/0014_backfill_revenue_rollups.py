@@ -0,0 +1,69 @@
+from django.db import migrations
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def backfill_revenue_rollups(apps, schema_editor) -> None:
+    # The rollups arrived without a backfill, so trucks that sold before
+    # then have rollups that miss some or all of their sales, and revenue is
+    # read from the rollups only. Every truck whose daily rollups don't add
+    # up to its transactions has its rollups rebuilt from them.
+    RevenueRollup = apps.get_model("ice_cream_truck", "RevenueRollup")
+    Transaction = apps.get_model("ice_cream_truck", "Transaction")
+    db_alias: str = schema_editor.connection.alias
+
+    sold: dict[int, tuple] = {
+        truck_id: (revenue, units_sold)
+        for truck_id, revenue, units_sold in Transaction.objects.using(db_alias)
+        .values("ice_cream_truck_id")
+        .annotate(revenue=Sum("total"), units_sold=Sum("quantity"))
+        .values_list("ice_cream_truck_id", "revenue", "units_sold")
+        .order_by()
+        .iterator()
+    }
+    rolled_up: dict[int, tuple] = {
+        truck_id: (revenue, units_sold)
+        for truck_id, revenue, units_sold in RevenueRollup.objects.using(db_alias)
+        .filter(period="day")
+        .values("ice_cream_truck_id")
+        .annotate(revenue=Sum("revenue"), units_sold=Sum("units_sold"))
+        .values_list("ice_cream_truck_id", "revenue", "units_sold")
+        .order_by()
+        .iterator()
+    }
+    trucks: list[int] = sorted(
+        truck_id
+        for truck_id in sold.keys() | rolled_up.keys()
+        if sold.get(truck_id) != rolled_up.get(truck_id)
+    )
+
+    for start in range(0, len(trucks), 500):
+        chunk: list[int] = trucks[start : start + 500]
+        RevenueRollup.objects.using(db_alias).filter(
+            ice_cream_truck_id__in=chunk
+        ).delete()
+        for period, truncate in (("hour", TruncHour), ("day", TruncDay)):
+            RevenueRollup.objects.using(db_alias).bulk_create(
+                (
+                    RevenueRollup(period=period, **row)
+                    for row in Transaction.objects.using(db_alias)
+                    .filter(ice_cream_truck_id__in=chunk)
+                    .annotate(bucket=truncate("date"))
+                    .values("ice_cream_truck_id", "bucket")
+                    .annotate(revenue=Sum("total"), units_sold=Sum("quantity"))
+                    .order_by()
+                    .iterator()
+                ),
+                batch_size=1000,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ice_cream_truck", "0013_revenuerollup_shard"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_revenue_rollups, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,12 @@
+from datetime import datetime
+from typing import Optional
+
 from django.contrib.auth import get_user_model
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
+
+from .geo import grid_cell
 
 User = get_user_model()
 
@@ -10,7 +17,6 @@ class FoodItem(models.Model):
         unique=True,
     )
     price: models.DecimalField = models.DecimalField(max_digits=6, decimal_places=2)
-    stock: models.IntegerField = models.SmallIntegerField(default=0)
 
     def __str__(self) -> str:
         return self.name
@@ -18,7 +24,9 @@ class FoodItem(models.Model):
 
 class Flavor(models.Model):
     name: models.CharField = models.CharField(max_length=100)
-    food_item: models.ForeignKey = models.ForeignKey(FoodItem, on_delete=models.CASCADE)
+    food_item: models.ForeignKey = models.ForeignKey(
+        FoodItem, on_delete=models.CASCADE, related_name="flavors"
+    )
 
     def __str__(self) -> str:
         return self.name
@@ -26,11 +34,93 @@ class Flavor(models.Model):
 
 class IceCreamTruck(models.Model):
     name: models.CharField = models.CharField(max_length=100)
-    food_items: models.ManyToManyField = models.ManyToManyField(FoodItem)
+    food_items: models.ManyToManyField = models.ManyToManyField(
+        FoodItem, through="TruckStock"
+    )
+    latitude: models.FloatField = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude: models.FloatField = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
+    # The location's geo.grid_cell, which the nearby search looks trucks up
+    # by. save() keeps it in step; bulk_create() and update() callers must
+    # set it themselves.
+    grid_cell: models.BigIntegerField = models.BigIntegerField(
+        null=True, blank=True, editable=False
+    )
+
+    class Meta:
+        # Carries the coordinates too, so the bounding box is checked on
+        # the index entries
+        indexes = [
+            models.Index(
+                fields=["grid_cell", "latitude", "longitude"],
+                name="truck_location_idx",
+            )
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs) -> None:
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+        if kwargs.get("update_fields") is not None:
+            fields = set(kwargs["update_fields"])
+            if fields & {"latitude", "longitude"}:
+                kwargs["update_fields"] = fields | {"grid_cell"}
+        super().save(*args, **kwargs)
+
+
+class TruckStock(models.Model):
+    # What one truck carries of one food item. Each truck sells from its own
+    # rows, so trucks never wait on each other's stock updates.
+    ice_cream_truck: models.ForeignKey = models.ForeignKey(
+        IceCreamTruck, on_delete=models.CASCADE, related_name="stock_rows"
+    )
+    food_item: models.ForeignKey = models.ForeignKey(
+        FoodItem, on_delete=models.CASCADE, related_name="stock_rows"
+    )
+    stock: models.IntegerField = models.IntegerField(default=0)
+    # With shards, the stock lives in that many StockShard rows instead of
+    # `stock`, so concurrent purchases of a hot item update different rows
+    stock_shards: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        default=0
+    )
+
+    class Meta:
+        # Its (ice_cream_truck, food_item) index serves a truck's inventory
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ice_cream_truck", "food_item"], name="unique_truck_stock"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ice_cream_truck} {self.food_item}: {self.stock}"
+
+
+class StockShard(models.Model):
+    truck_stock: models.ForeignKey = models.ForeignKey(
+        TruckStock, on_delete=models.CASCADE, related_name="shards"
+    )
+    shard: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField()
+    stock: models.IntegerField = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["truck_stock", "shard"], name="unique_stock_shard"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.truck_stock} shard {self.shard}: {self.stock}"
+
 
 class Customer(models.Model):
     user: models.OneToOneField = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -42,6 +132,20 @@ class Customer(models.Model):
         return f"{self.user.first_name} {self.user.last_name} - ${self.balance}"
 
 
+class TransactionQuerySet(models.QuerySet):
+    def in_window(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> "TransactionQuerySet":
+        # `end` is exclusive. Combined with a customer or truck filter this is
+        # a range scan on the matching (owner, date, id) index.
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(date__lt=end)
+        return queryset
+
+
 class Transaction(models.Model):
     food_item: models.ForeignKey = models.ForeignKey(FoodItem, on_delete=models.CASCADE)
     customer: models.ForeignKey = models.ForeignKey(Customer, on_delete=models.CASCADE)
@@ -54,5 +158,80 @@ class Transaction(models.Model):
     )
     date: models.DateTimeField = models.DateTimeField(auto_now_add=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        # History pages and revenue windows range over (date, id) per owner
+        indexes = [
+            models.Index(
+                fields=["customer", "date", "id"],
+                name="transaction_customer_date_idx",
+            ),
+            models.Index(
+                fields=["ice_cream_truck", "date", "id"],
+                name="transaction_truck_date_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"{self.customer} bought {self.quantity} {self.food_item.name} for {self.total} on {self.date}"
+
+
+class RevenueRollup(models.Model):
+    HOUR: str = "hour"
+    DAY: str = "day"
+    PERIOD_CHOICES: list[tuple[str, str]] = [(HOUR, "Hour"), (DAY, "Day")]
+
+    ice_cream_truck: models.ForeignKey = models.ForeignKey(
+        IceCreamTruck, on_delete=models.CASCADE
+    )
+    period: models.CharField = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket: models.DateTimeField = models.DateTimeField()
+    revenue: models.DecimalField = models.DecimalField(
+        default=0.00, decimal_places=2, max_digits=12
+    )
+    units_sold: models.IntegerField = models.IntegerField(default=0)
+    # A bucket is kept in up to REVENUE_ROLLUP_SHARDS rows, so that
+    # concurrent sales at one truck mostly update different rows; readers
+    # sum the shards
+    shard: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        default=0
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ice_cream_truck", "period", "bucket", "shard"],
+                name="unique_revenue_rollup_shard",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ice_cream_truck} {self.period} {self.bucket}: {self.revenue}"
+
+
+class OutboxEvent(models.Model):
+    # A side effect of a write (e.g. a sale), stored in the same transaction
+    # as the write and handled later by run_outbox_worker
+    topic: models.CharField = models.CharField(max_length=100)
+    payload: models.JSONField = models.JSONField(default=dict)
+    created: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+    # Not handled before this time; pushed back after each failed attempt
+    available_at: models.DateTimeField = models.DateTimeField(default=timezone.now)
+    attempts: models.PositiveIntegerField = models.PositiveIntegerField(default=0)
+    last_error: models.TextField = models.TextField(blank=True)
+    # Set once the event has used up its attempts; it is then left alone
+    failed_at: models.DateTimeField = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Handled events are deleted, so the index only covers pending ones
+        indexes = [
+            models.Index(
+                fields=["available_at", "id"],
+                condition=models.Q(failed_at__isnull=True),
+                name="outbox_pending_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.topic} #{self.pk}"
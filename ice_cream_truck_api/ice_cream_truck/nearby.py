@@ -0,0 +1,72 @@
+from typing import Any, Optional
+
+from django.db.models import Exists, OuterRef, Q, QuerySet
+
+from .geo import bounding_box, cell_ranges, distance_km
+from .models import IceCreamTruck, TruckStock
+from .stock import total_stock
+
+DEFAULT_RADIUS_KM: float = 5.0
+DEFAULT_NEARBY_LIMIT: int = 20
+MAX_NEARBY_LIMIT: int = 100
+
+
+def in_stock(food_item_id: Optional[int], flavor: Optional[str]) -> Exists:
+    # Filters trucks to those with the food item, or an item of the flavor,
+    # in stock
+    stocked = (
+        TruckStock.objects.filter(ice_cream_truck=OuterRef("pk"))
+        .annotate(in_stock=total_stock())
+        .filter(in_stock__gt=0)
+    )
+    if food_item_id is not None:
+        stocked = stocked.filter(food_item_id=food_item_id)
+    if flavor:
+        stocked = stocked.filter(food_item__flavors__name__iexact=flavor)
+    return Exists(stocked)
+
+
+def closest(
+    trucks: QuerySet[IceCreamTruck],
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    limit: int,
+) -> list[dict[str, Any]]:
+    # The `limit` trucks of the queryset within radius_km, nearest first
+    rows: list[dict[str, Any]] = []
+    for row in trucks.values("id", "name", "latitude", "longitude"):
+        distance = distance_km(latitude, longitude, row["latitude"], row["longitude"])
+        if distance <= radius_km:
+            rows.append({**row, "distance_km": distance})
+    rows.sort(key=lambda row: (row["distance_km"], row["id"]))
+    for row in rows[:limit]:
+        row["distance_km"] = round(row["distance_km"], 3)
+    return rows[:limit]
+
+
+def nearby_trucks(
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    limit: int,
+    food_item_id: Optional[int] = None,
+    flavor: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    # The closest trucks, optionally only those with a food item or flavor
+    # in stock, in one query: the grid cells of the bounding box narrow the
+    # search on truck_location_idx and the box itself drops most trucks
+    # outside the circle, so the exact distance is only computed for what
+    # is left
+    box = bounding_box(latitude, longitude, radius_km)
+    south, north, longitudes = box
+    cells = Q()
+    for low, high in cell_ranges(box):
+        cells |= Q(grid_cell__range=(low, high))
+    within = Q()
+    for west, east in longitudes:
+        within |= Q(longitude__range=(west, east))
+    trucks = IceCreamTruck.objects.filter(cells, within, latitude__range=(south, north))
+    if food_item_id is not None or flavor:
+        trucks = trucks.filter(in_stock(food_item_id, flavor))
+    return closest(trucks, latitude, longitude, radius_km, limit)
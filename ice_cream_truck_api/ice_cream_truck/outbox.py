@@ -0,0 +1,79 @@
+from datetime import timedelta
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+Handler = Callable[[dict[str, Any]], None]
+
+# topic: handlers, in registration order
+HANDLERS: dict[str, list[Handler]] = {}
+
+
+def handler(topic: str) -> Callable[[Handler], Handler]:
+    # Registers a function to be called with the payload of every `topic`
+    # event. Handlers run in the worker's transaction, so their database
+    # writes commit together with the event being marked as handled.
+    def register(function: Handler) -> Handler:
+        HANDLERS.setdefault(topic, []).append(function)
+        return function
+
+    return register
+
+
+def publish(topic: str, payload: dict[str, Any]) -> OutboxEvent:
+    # Call from inside the transaction of the write the event is about: the
+    # event is stored if and only if that write commits
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def backoff(attempts: int) -> timedelta:
+    # Exponential: base, 2 x base, 4 x base, ... up to the maximum
+    seconds: float = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+
+def process_batch(batch_size: int = 0) -> int:
+    # Claims up to `batch_size` due events with SELECT ... FOR UPDATE SKIP
+    # LOCKED and keeps them locked until they are handled, so parallel
+    # workers each get a different batch and never handle an event twice.
+    # Each event runs in a savepoint: a failing handler only rolls back its
+    # own event, which is retried later with backoff. Returns the number of
+    # events claimed.
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        events: list[OutboxEvent] = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(failed_at__isnull=True, available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        handled: list[int] = []
+        retried: list[OutboxEvent] = []
+        for event in events:
+            try:
+                with transaction.atomic():
+                    handlers: list[Handler] = HANDLERS.get(event.topic, [])
+                    if not handlers:
+                        raise LookupError(f"No handler for topic {event.topic!r}")
+                    for function in handlers:
+                        function(event.payload)
+            except Exception as error:
+                event.attempts += 1
+                event.last_error = f"{type(error).__name__}: {error}"
+                if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    event.failed_at = now
+                else:
+                    event.available_at = now + backoff(event.attempts)
+                retried.append(event)
+            else:
+                handled.append(event.pk)
+
+        OutboxEvent.objects.filter(pk__in=handled).delete()
+        OutboxEvent.objects.bulk_update(
+            retried, ["attempts", "last_error", "available_at", "failed_at"]
+        )
+    return len(events)
@@ -0,0 +1,123 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import date, datetime
+from typing import Any, Optional
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Cursor pagination that seeks straight to the row after the last one
+    # seen, `WHERE (date, id) < (last_date, last_id) ORDER BY date DESC, id
+    # DESC LIMIT n`, so every page costs the same as the first. All ordering
+    # fields share a direction and the last one must be unique.
+    ordering: tuple[str, ...] = ("-id",)
+    page_size: int = 50
+    max_page_size: int = 500
+    cursor_query_param: str = "cursor"
+    page_size_query_param: str = "page_size"
+    invalid_cursor_message: str = "Invalid cursor"
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> list:
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields: list[str] = [field.lstrip("-") for field in self.ordering]
+        self.descending: bool = self.ordering[0].startswith("-")
+
+        queryset = queryset.order_by(*self.ordering)
+        position: Optional[list] = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        page: list = list(queryset[: self.page_size + 1])
+        self.has_next: bool = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.next_position: Optional[list] = (
+            [self.position_value(page[-1], field) for field in self.fields]
+            if self.has_next
+            else None
+        )
+        return page
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def after(self, position: list) -> Q:
+        # (a, b) < (x, y)  <=>  a <= x AND (a < x OR (a = x AND b < y)); the
+        # leading range on `a` lets the planner scan the composite index
+        lookup: str = "lt" if self.descending else "gt"
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            equal = {name: value for name, value in zip(self.fields[:index], position)}
+            condition |= Q(**equal, **{f"{field}__{lookup}": position[index]})
+        return Q(**{f"{self.fields[0]}__{lookup}e": position[0]}) & condition
+
+    def position_value(self, item: Any, field: str) -> Any:
+        return item[field] if isinstance(item, dict) else getattr(item, field)
+
+    def decode_cursor(self, request) -> Optional[list]:
+        encoded: Optional[str] = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position: list) -> str:
+        # Datetimes keep their microseconds, which DjangoJSONEncoder drops
+        values: list = [
+            value.isoformat() if isinstance(value, (date, datetime)) else value
+            for value in position
+        ]
+        return urlsafe_b64encode(
+            json.dumps(values, cls=DjangoJSONEncoder).encode("ascii")
+        ).decode("ascii")
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class FoodItemPagination(KeysetPagination):
+    ordering: tuple[str, ...] = ("id",)
+    page_size: int = 100
+
+
+class TransactionHistoryPagination(KeysetPagination):
+    ordering: tuple[str, ...] = ("-date", "-id")
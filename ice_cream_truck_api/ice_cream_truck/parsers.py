@@ -0,0 +1,16 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .catalog_import import parse_csv
+
+
+class CSVParser(BaseParser):
+    # Parses a CSV body into a list of row dicts keyed by the header
+    media_type: str = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None) -> list[dict]:
+        encoding: str = (parser_context or {}).get("encoding", "utf-8")
+        try:
+            return parse_csv(stream.read().decode(encoding))
+        except (UnicodeDecodeError, ValueError) as error:
+            raise ParseError(f"CSV parse error - {error}")
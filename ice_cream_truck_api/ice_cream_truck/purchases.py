@@ -0,0 +1,158 @@
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import Any
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+
+from .models import FoodItem, IceCreamTruck, Customer, Transaction, TruckStock
+from .outbox import publish
+from .rollups import record_sales
+from .routers import mark_written
+from .stock import take_sharded_stock
+
+
+class PurchaseError(Exception):
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        super().__init__(message)
+        self.message: str = message
+        self.status_code: int = status_code
+
+
+def parse_id(value: Any, message: str) -> int:
+    # IDs arrive as ints from JSON bodies and as strings from forms; anything
+    # else (a word, a list, a bool) is a bad request, not a server error
+    if isinstance(value, bool):
+        raise PurchaseError(message)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise PurchaseError(message)
+
+
+def buy_food(
+    food_item_id: int, customer_id: int, ice_cream_truck_id: int, quantity: int
+) -> Transaction:
+    return checkout(customer_id, ice_cream_truck_id, [(food_item_id, quantity)])[0]
+
+
+def checkout(
+    customer_id: int, ice_cream_truck_id: int, lines: list[tuple[int, int]]
+) -> list[Transaction]:
+    # Stock and balance are decremented with conditional UPDATEs
+    # (`SET stock = stock - n WHERE stock >= n`) so concurrent purchases can
+    # never oversell or lose a balance update, and no row is read into Python
+    # and written back. The statement count doesn't depend on the cart size.
+    customer_id = parse_id(customer_id, "Invalid customer ID")
+    ice_cream_truck_id = parse_id(ice_cream_truck_id, "Invalid ice cream truck ID")
+    quantities: dict[int, int] = {}
+    for food_item_id, quantity in lines:
+        food_item_id = parse_id(food_item_id, "Invalid food item ID")
+        quantities[food_item_id] = quantities.get(food_item_id, 0) + quantity
+
+    if not quantities:
+        raise PurchaseError("Cart is empty")
+
+    with transaction.atomic():
+        prices: dict[int, Decimal] = dict(
+            FoodItem.objects.filter(id__in=quantities).values_list("id", "price")
+        )
+        if len(prices) != len(quantities):
+            raise PurchaseError("Invalid food item ID")
+
+        # The truck's stock row for each line, as (row ID, shards); a truck
+        # without a row doesn't sell that item
+        rows: dict[int, tuple[int, int]] = {
+            food_item_id: (row_id, stock_shards)
+            for food_item_id, row_id, stock_shards in TruckStock.objects.filter(
+                ice_cream_truck_id=ice_cream_truck_id, food_item_id__in=quantities
+            ).values_list("food_item_id", "id", "stock_shards")
+        }
+        if len(rows) != len(quantities):
+            if not IceCreamTruck.objects.filter(id=ice_cream_truck_id).exists():
+                raise PurchaseError("Invalid ice cream truck ID")
+            raise PurchaseError("SORRY!")
+
+        totals: dict[int, Decimal] = {
+            food_item_id: prices[food_item_id] * quantity
+            for food_item_id, quantity in quantities.items()
+        }
+        total_price: Decimal = sum(totals.values(), Decimal("0"))
+
+        # Update the truck's stock for every unsharded line in one statement;
+        # a line without enough stock drops out of the WHERE clause and fails
+        # the cart
+        unsharded: dict[int, int] = {
+            rows[food_item_id][0]: quantity
+            for food_item_id, quantity in quantities.items()
+            if not rows[food_item_id][1]
+        }
+        if unsharded:
+            in_stock = reduce(
+                or_,
+                (
+                    Q(id=row_id, stock__gte=quantity)
+                    for row_id, quantity in unsharded.items()
+                ),
+            )
+            updated: int = TruckStock.objects.filter(in_stock).update(
+                stock=Case(
+                    *(
+                        When(id=row_id, then=F("stock") - quantity)
+                        for row_id, quantity in unsharded.items()
+                    ),
+                    default=F("stock"),
+                    output_field=IntegerField(),
+                )
+            )
+            if updated != len(unsharded):
+                raise PurchaseError("SORRY!")
+        for food_item_id, (row_id, stock_shards) in rows.items():
+            if stock_shards and not take_sharded_stock(
+                row_id, stock_shards, quantities[food_item_id]
+            ):
+                raise PurchaseError("SORRY!")
+
+        # Update customer balance
+        if not Customer.objects.filter(id=customer_id, balance__gte=total_price).update(
+            balance=F("balance") - total_price
+        ):
+            if not Customer.objects.filter(id=customer_id).exists():
+                raise PurchaseError("Invalid customer ID")
+            raise PurchaseError("SORRY!")
+
+        # Create transactions
+        transactions: list[Transaction] = Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    food_item_id=food_item_id,
+                    customer_id=customer_id,
+                    ice_cream_truck_id=ice_cream_truck_id,
+                    quantity=quantity,
+                    total=totals[food_item_id],
+                )
+                for food_item_id, quantity in quantities.items()
+            ]
+        )
+
+        # Keep the revenue rollups in step with the sale
+        record_sales(
+            ice_cream_truck_id,
+            transactions[0].date,
+            total_price,
+            sum(quantities.values()),
+        )
+        # Everything else that follows a sale is handled by run_outbox_worker
+        publish(
+            "sale",
+            {
+                "customer_id": customer_id,
+                "ice_cream_truck_id": ice_cream_truck_id,
+                "food_item_ids": list(quantities),
+                "transaction_ids": [sale.pk for sale in transactions],
+                "total": str(total_price),
+            },
+        )
+        mark_written(f"customer:{customer_id}", f"ice_cream_truck:{ice_cream_truck_id}")
+    return transactions
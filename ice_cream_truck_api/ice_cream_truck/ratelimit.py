@@ -0,0 +1,243 @@
+import hashlib
+import math
+import threading
+import time
+from asyncio import iscoroutinefunction
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, JsonResponse
+from django.urls import Resolver404, ResolverMatch, resolve
+from django.utils.decorators import sync_and_async_middleware
+
+# (bucket key, requests per second, burst)
+Limit = tuple[str, float, int]
+
+# Views that stay reachable when the server is at its concurrency cap
+EXEMPT_VIEWS: set[str] = {"metrics"}
+
+
+class LocalBuckets:
+    # Token buckets of this process. Bounded: past `max_keys` the least
+    # recently used bucket is dropped, which only means that key starts
+    # again with a full bucket.
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, limits: list[Limit]) -> float:
+        now = time.monotonic()
+        with self.lock:
+            states = [self.buckets.get(key) for key, _, _ in limits]
+            taken, wait = refill_all(limits, states, now)
+            if wait:
+                return wait
+            for (key, _, _), state in zip(limits, taken):
+                self.buckets.pop(key, None)
+                self.buckets[key] = state
+            while len(self.buckets) > settings.RATE_LIMIT_MAX_KEYS:
+                self.buckets.popitem(last=False)
+        return 0.0
+
+    def clear(self) -> None:
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    # Token buckets in the shared cache, so the limits hold across workers.
+    # The read-modify-write isn't atomic: under contention a few requests
+    # over the limit can get through, but never a steady stream.
+
+    def take(self, limits: list[Limit]) -> float:
+        now = time.time()
+        keys = [f"ratelimit:{key}" for key, _, _ in limits]
+        found = cache.get_many(keys)
+        taken, wait = refill_all(limits, [found.get(key) for key in keys], now)
+        if not wait:
+            for (key, rate, burst), state in zip(limits, taken):
+                cache.set(f"ratelimit:{key}", state, expiry(rate, burst))
+        return wait
+
+    async def atake(self, limits: list[Limit]) -> float:
+        now = time.time()
+        keys = [f"ratelimit:{key}" for key, _, _ in limits]
+        found = await cache.aget_many(keys)
+        taken, wait = refill_all(limits, [found.get(key) for key in keys], now)
+        if not wait:
+            for (key, rate, burst), state in zip(limits, taken):
+                await cache.aset(f"ratelimit:{key}", state, expiry(rate, burst))
+        return wait
+
+
+def expiry(rate: float, burst: int) -> int:
+    # A bucket left alone this long is full again anyway
+    return math.ceil(burst / rate) + 1
+
+
+def refill(
+    state: Optional[tuple[float, float]], rate: float, burst: int, now: float
+) -> tuple[float, float]:
+    # Returns the tokens left after taking one, and the seconds to wait for
+    # a token (0 when one was taken)
+    tokens, updated = state or (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+def refill_all(
+    limits: list[Limit], states: list[Optional[tuple[float, float]]], now: float
+) -> tuple[list[tuple[float, float]], float]:
+    # Takes a token from every bucket, or from none: a request turned away by
+    # one bucket doesn't use up the others. Returns the new bucket states and
+    # the seconds until all of them have a token (0 when they were taken).
+    taken: list[tuple[float, float]] = []
+    wait: float = 0.0
+    for (_, rate, burst), state in zip(limits, states):
+        tokens, bucket_wait = refill(state, rate, burst, now)
+        taken.append((tokens, now))
+        wait = max(wait, bucket_wait)
+    return taken, wait
+
+
+local_buckets = LocalBuckets()
+cache_buckets = CacheBuckets()
+
+
+class AdmissionGate:
+    # Counts the requests this process is serving. Past the cap, new ones
+    # are turned away at once instead of queueing for a database connection.
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.active: int = 0
+
+    def enter(self) -> bool:
+        with self.lock:
+            if (
+                settings.MAX_CONCURRENT_REQUESTS
+                and self.active >= settings.MAX_CONCURRENT_REQUESTS
+            ):
+                return False
+            self.active += 1
+            return True
+
+    def leave(self) -> None:
+        with self.lock:
+            self.active -= 1
+
+
+gate = AdmissionGate()
+
+
+def client_key(request: HttpRequest) -> str:
+    # Rules run before authentication, so an API token stands for its user
+    # (one token per user). A made-up token only earns a 401 from the view;
+    # everyone else is told apart by address.
+    authorization: str = request.headers.get("Authorization", "")
+    keyword, _, token = authorization.partition(" ")
+    if keyword == "Token" and token:
+        return "token:" + hashlib.sha256(token.encode()).hexdigest()[:32]
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def request_limits(request: HttpRequest, view_name: str) -> list[Limit]:
+    # The buckets the request counts against; the request body, which any
+    # client can fill with someone else's IDs, plays no part in the key
+    limits: list[Limit] = []
+    for scope, rate, burst in settings.RATE_LIMITS.get(view_name, ()):
+        key: str = f"{view_name}:{scope}"
+        if scope == "client":
+            key += f":{client_key(request)}"
+        limits.append((key, rate, burst))
+    return limits
+
+
+def route(request: HttpRequest) -> Optional[ResolverMatch]:
+    try:
+        match = resolve(request.path_info, getattr(request, "urlconf", None))
+    except Resolver404:
+        return None
+    # Lets /metrics label rejected requests with their view
+    request.resolver_match = match
+    return match
+
+
+def check_limits(request: HttpRequest, match: ResolverMatch) -> float:
+    # Returns 0 if the request may go ahead, otherwise the seconds until it
+    # may retry
+    limits: list[Limit] = request_limits(request, match.view_name)
+    if not limits:
+        return 0.0
+    if settings.RATE_LIMIT_BACKEND == "cache":
+        return cache_buckets.take(limits)
+    return local_buckets.take(limits)
+
+
+async def acheck_limits(request: HttpRequest, match: ResolverMatch) -> float:
+    limits: list[Limit] = request_limits(request, match.view_name)
+    if not limits:
+        return 0.0
+    if settings.RATE_LIMIT_BACKEND == "cache":
+        return await cache_buckets.atake(limits)
+    # Never waits on anything but the in-process lock
+    return local_buckets.take(limits)
+
+
+def admit(
+    match: Optional[ResolverMatch], wait: float
+) -> tuple[Optional[JsonResponse], bool]:
+    # Returns (rejection, entered the gate)
+    if match is None:
+        return None, False
+    if wait:
+        response = JsonResponse({"message": "Too many requests"}, status=429)
+        response["Retry-After"] = str(math.ceil(wait))
+        return response, False
+    if match.view_name in EXEMPT_VIEWS:
+        return None, False
+    if not gate.enter():
+        response = JsonResponse({"message": "Server busy"}, status=503)
+        response["Retry-After"] = "1"
+        return response, False
+    return None, True
+
+
+@sync_and_async_middleware
+def rate_limit_middleware(get_response: Callable) -> Callable:
+    # Rejects requests over RATE_LIMITS with 429 and, past
+    # MAX_CONCURRENT_REQUESTS in flight, with 503, before any database work
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            match = route(request)
+            wait = await acheck_limits(request, match) if match else 0.0
+            rejection, entered = admit(match, wait)
+            if rejection is not None:
+                return rejection
+            try:
+                return await get_response(request)
+            finally:
+                if entered:
+                    gate.leave()
+
+    else:
+
+        def middleware(request):
+            match = route(request)
+            wait = check_limits(request, match) if match else 0.0
+            rejection, entered = admit(match, wait)
+            if rejection is not None:
+                return rejection
+            try:
+                return get_response(request)
+            finally:
+                if entered:
+                    gate.leave()
+
+    return middleware
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+from .exports import CONTENT_TYPES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ExportRenderer(BaseRenderer):
+    # Selects an export format by ?format= or Accept. Export views stream
+    # their own rows; anything else rendered in the format (e.g. an error
+    # body) is a dict or a list of them, written one row per dict.
+    charset: str = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows: list[dict] = [
+            row if isinstance(row, dict) else {"detail": row}
+            for row in (data if isinstance(data, list) else [data])
+        ]
+        return self.render_rows(rows).encode(self.charset)
+
+    def render_rows(self, rows: list[dict]) -> str:
+        # One JSON object per line
+        return "".join(json.dumps(row, cls=encoders.JSONEncoder) + "\n" for row in rows)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type: str = CONTENT_TYPES["csv"]
+    format: str = "csv"
+
+    def render_rows(self, rows: list[dict]) -> str:
+        # One column per key, in order of first appearance; nested values
+        # (e.g. lists of validation errors) are written as JSON
+        columns: dict[str, None] = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(
+                (
+                    json.dumps(value, cls=encoders.JSONEncoder)
+                    if isinstance(value, (dict, list))
+                    else value
+                )
+                for value in (row.get(column, "") for column in columns)
+            )
+        return buffer.getvalue()
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type: str = CONTENT_TYPES["ndjson"]
+    format: str = "ndjson"
+
+
+class FastJSONRenderer(JSONRenderer):
+    # JSONRenderer's output, written by orjson when it is installed (and
+    # FAST_JSON isn't turned off). Anything orjson would write differently
+    # (datetimes, non-string keys, huge integers) is left to the stdlib path,
+    # so use it for data without floats, whose text the two libraries can
+    # format differently.
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or not settings.FAST_JSON
+            or data is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content: bytes = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # As JSONRenderer does, for JavaScript's sake
+        return content.replace("\u2028".encode(), b"\\u2028").replace(
+            "\u2029".encode(), b"\\u2029"
+        )
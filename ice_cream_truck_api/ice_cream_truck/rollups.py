@@ -0,0 +1,178 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import reduce
+from itertools import islice
+from operator import or_
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import IceCreamTruck, RevenueRollup, Transaction
+
+TRUNCATE: dict[str, type[TruncHour]] = {
+    RevenueRollup.HOUR: TruncHour,
+    RevenueRollup.DAY: TruncDay,
+}
+
+
+def bucket_start(date: datetime, period: str) -> datetime:
+    # Matches what TruncHour/TruncDay produce in the current time zone
+    date = timezone.localtime(date).replace(minute=0, second=0, microsecond=0)
+    if period == RevenueRollup.DAY:
+        date = date.replace(hour=0)
+    return date
+
+
+def record_sales(
+    ice_cream_truck_id: int, date: datetime, revenue: Decimal, units_sold: int
+) -> None:
+    # Called from inside the purchase transaction, on one random shard of the
+    # truck's hour and day buckets. Missing rows are created with INSERT ...
+    # ON CONFLICT DO NOTHING so concurrent purchases can't race on creation,
+    # then both are incremented in one UPDATE.
+    shard: int = random.randrange(settings.REVENUE_ROLLUP_SHARDS)
+    buckets: dict[str, datetime] = {
+        period: bucket_start(date, period) for period in TRUNCATE
+    }
+    RevenueRollup.objects.bulk_create(
+        [
+            RevenueRollup(
+                ice_cream_truck_id=ice_cream_truck_id,
+                period=period,
+                bucket=bucket,
+                shard=shard,
+            )
+            for period, bucket in buckets.items()
+        ],
+        ignore_conflicts=True,
+    )
+    RevenueRollup.objects.filter(
+        reduce(
+            or_,
+            (Q(period=period, bucket=bucket) for period, bucket in buckets.items()),
+        ),
+        ice_cream_truck_id=ice_cream_truck_id,
+        shard=shard,
+    ).update(revenue=F("revenue") + revenue, units_sold=F("units_sold") + units_sold)
+
+
+def truck_revenue() -> Coalesce:
+    # A truck's total revenue, for annotating IceCreamTruck querysets: the
+    # sum of its daily rollups. Only record_sales and rebuild_rollups write
+    # those, so saving a truck can't overwrite its revenue.
+    return Coalesce(
+        Subquery(
+            RevenueRollup.objects.filter(
+                ice_cream_truck=OuterRef("pk"), period=RevenueRollup.DAY
+            )
+            .values("ice_cream_truck")
+            .annotate(total=Sum("revenue"))
+            .values("total")
+        ),
+        Value(Decimal("0.00")),
+    )
+
+
+def revenue_buckets(
+    ice_cream_truck: IceCreamTruck,
+    period: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> list[dict]:
+    # One row per bucket in the window, its shards summed; `end` is exclusive
+    rollups = RevenueRollup.objects.filter(
+        ice_cream_truck=ice_cream_truck, period=period
+    )
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=bucket_start(start, period))
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+    return list(
+        rollups.values("bucket")
+        .annotate(revenue=Sum("revenue"), units_sold=Sum("units_sold"))
+        .order_by("bucket")
+    )
+
+
+def window_revenue(
+    ice_cream_truck: IceCreamTruck,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Decimal:
+    # Exact revenue for [start, end). Whole hours are read from the hourly
+    # rollups; only the partial hours at either edge are summed from
+    # Transaction, as range scans on the (ice_cream_truck, date) index.
+    transactions = Transaction.objects.filter(ice_cream_truck=ice_cream_truck)
+    first_hour: Optional[datetime] = None
+    last_hour: Optional[datetime] = None
+    if start is not None:
+        first_hour = bucket_start(start, RevenueRollup.HOUR)
+        if first_hour < start:
+            first_hour += timedelta(hours=1)
+    if end is not None:
+        last_hour = bucket_start(end, RevenueRollup.HOUR)
+
+    if first_hour is not None and last_hour is not None and first_hour >= last_hour:
+        return _sum_total(transactions.in_window(start, end))
+
+    rollups = RevenueRollup.objects.filter(
+        ice_cream_truck=ice_cream_truck, period=RevenueRollup.HOUR
+    )
+    if first_hour is not None:
+        rollups = rollups.filter(bucket__gte=first_hour)
+    if last_hour is not None:
+        rollups = rollups.filter(bucket__lt=last_hour)
+    revenue: Decimal = rollups.aggregate(
+        revenue=Coalesce(Sum("revenue"), Value(Decimal("0.00")))
+    )["revenue"]
+
+    edges = Q()
+    if start is not None and first_hour != start:
+        edges |= Q(date__gte=start, date__lt=first_hour)
+    if end is not None and last_hour != end:
+        edges |= Q(date__gte=last_hour, date__lt=end)
+    if edges:
+        revenue += _sum_total(transactions.filter(edges))
+    return revenue
+
+
+def _sum_total(transactions: QuerySet[Transaction]) -> Decimal:
+    return transactions.aggregate(total=Coalesce(Sum("total"), Value(Decimal("0.00"))))[
+        "total"
+    ]
+
+
+def rebuild_rollups(
+    trucks: Optional[QuerySet[IceCreamTruck]] = None, batch_size: int = 1000
+) -> int:
+    # Recomputes the rollup rows of `trucks` (every truck by default) from
+    # Transaction and returns how many were written. The buckets are streamed
+    # from the GROUP BY query and inserted batch_size at a time, so memory
+    # use doesn't grow with the number of transactions.
+    rollups = RevenueRollup.objects.all()
+    transactions = Transaction.objects.all()
+    if trucks is not None:
+        rollups = rollups.filter(ice_cream_truck__in=trucks.values("pk"))
+        transactions = transactions.filter(ice_cream_truck__in=trucks.values("pk"))
+
+    written: int = 0
+    with transaction.atomic():
+        rollups.delete()
+        for period, truncate in TRUNCATE.items():
+            rows = (
+                RevenueRollup(period=period, **row)
+                for row in transactions.annotate(bucket=truncate("date"))
+                .values("ice_cream_truck_id", "bucket")
+                .annotate(revenue=Sum("total"), units_sold=Sum("quantity"))
+                .order_by()
+                .iterator(chunk_size=batch_size)
+            )
+            while batch := list(islice(rows, batch_size)):
+                RevenueRollup.objects.bulk_create(batch)
+                written += len(batch)
+    return written
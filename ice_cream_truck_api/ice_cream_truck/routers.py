@@ -0,0 +1,70 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Set for the duration of a read-only view; the router only sends reads to a
+# replica while it is set, so writes and everything outside those views stay
+# on the primary.
+_replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        if _replica_reads.get() and settings.REPLICA_DATABASES:
+            return random.choice(settings.REPLICA_DATABASES)
+        return None
+
+    def db_for_write(self, model, **hints) -> Optional[str]:
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # Every alias holds the same data
+        return True
+
+
+@contextmanager
+def read_from_replica(*sticky_keys: str) -> Iterator[None]:
+    # Reads a replica unless one of the keys was written too recently for
+    # the replicas to have caught up (read-your-writes)
+    if not settings.REPLICA_DATABASES or (
+        sticky_keys and cache.get_many([f"sticky:{key}" for key in sticky_keys])
+    ):
+        yield
+        return
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def mark_written(*sticky_keys: str) -> None:
+    # Pins reads of these keys to the primary for REPLICA_STICKY_SECONDS once
+    # the current transaction commits
+    if not settings.REPLICA_DATABASES:
+        return
+    transaction.on_commit(
+        lambda: cache.set_many(
+            {f"sticky:{key}": True for key in sticky_keys},
+            settings.REPLICA_STICKY_SECONDS,
+        )
+    )
+
+
+class ReplicaReadMixin:
+    # Serves safe requests from a replica, unless a key from get_sticky_keys()
+    # was written moments ago
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica(*self.get_sticky_keys(kwargs)):
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_sticky_keys(self, kwargs: dict) -> list[str]:
+        return []
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import FoodItem, Flavor, IceCreamTruck
+from .models import FoodItem, Flavor, IceCreamTruck, Transaction, TruckStock
 
 
 class FlavorSerializer(serializers.ModelSerializer):
@@ -16,7 +16,81 @@ class FoodItemSerializer(serializers.ModelSerializer):
         fields: tuple[str, ...] = ("name", "price", "flavors")
 
 
+class InventoryItemSerializer(serializers.ModelSerializer):
+    # One of a truck's stock rows, shown as the food item it holds
+    id: serializers.IntegerField = serializers.IntegerField(
+        source="food_item.id", read_only=True
+    )
+    name: serializers.CharField = serializers.CharField(
+        source="food_item.name", read_only=True
+    )
+    price: serializers.DecimalField = serializers.DecimalField(
+        source="food_item.price", max_digits=6, decimal_places=2, read_only=True
+    )
+    # Annotated by the inventory queryset, so sharded stock is summed in SQL
+    stock: serializers.IntegerField = serializers.IntegerField(
+        source="total_stock", read_only=True
+    )
+    flavors: FlavorSerializer = FlavorSerializer(
+        source="food_item.flavors", many=True, read_only=True
+    )
+
+    class Meta:
+        model: type[TruckStock] = TruckStock
+        fields: tuple[str, ...] = ("id", "name", "price", "stock", "flavors")
+
+
 class IceCreamTruckSerializer(serializers.ModelSerializer):
+    food_items: InventoryItemSerializer = InventoryItemSerializer(
+        source="stock_rows", many=True, read_only=True
+    )
+
+    class Meta:
+        model: type[IceCreamTruck] = IceCreamTruck
+        fields: tuple[str, ...] = ("id", "name", "food_items")
+
+
+class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
-        model = IceCreamTruck
-        fields = "__all__"
+        model: type[Transaction] = Transaction
+        fields: tuple[str, ...] = (
+            "id",
+            "food_item",
+            "customer",
+            "ice_cream_truck",
+            "quantity",
+            "total",
+            "date",
+        )
+
+
+class CheckoutLineSerializer(serializers.Serializer):
+    food_item_id: serializers.IntegerField = serializers.IntegerField()
+    quantity: serializers.IntegerField = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    customer_id: serializers.IntegerField = serializers.IntegerField()
+    ice_cream_truck_id: serializers.IntegerField = serializers.IntegerField()
+    items: CheckoutLineSerializer = CheckoutLineSerializer(many=True, allow_empty=False)
+
+
+class CatalogRowSerializer(serializers.Serializer):
+    # One row of a catalog import or bulk restock; `stock` is added to the
+    # truck's stock
+    name: serializers.CharField = serializers.CharField(max_length=100)
+    price: serializers.DecimalField = serializers.DecimalField(
+        max_digits=6, decimal_places=2, min_value=0, required=False
+    )
+    flavors: serializers.ListField = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False
+    )
+    stock: serializers.IntegerField = serializers.IntegerField(
+        min_value=0, required=False
+    )
+
+
+class RestockSerializer(serializers.Serializer):
+    # A bulk restock body; the rows may also be sent as a bare list or CSV.
+    # Each row is validated on its own by catalog_import.import_catalog.
+    items: CatalogRowSerializer = CatalogRowSerializer(many=True)
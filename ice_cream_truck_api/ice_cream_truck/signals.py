@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog_cache import bump_catalog_version
+from .models import FoodItem, Flavor
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+@receiver(post_save, sender=Flavor)
+@receiver(post_delete, sender=Flavor)
+def invalidate_catalog(sender, **kwargs) -> None:
+    bump_catalog_version()
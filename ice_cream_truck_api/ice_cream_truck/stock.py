@@ -0,0 +1,104 @@
+import random
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, When
+from django.db.models.expressions import Combinable
+from django.db.models.functions import Coalesce
+
+from .models import StockShard, TruckStock
+
+# Sharded stock: a TruckStock row with stock_shards = N keeps its stock in N
+# StockShard rows (and 0 in TruckStock.stock). A purchase decrements one
+# random shard, so concurrent buyers of a hot item mostly lock different rows.
+
+
+def total_stock() -> Combinable:
+    # Annotates a TruckStock queryset with its stock, sharded or not
+    shards = (
+        StockShard.objects.filter(truck_stock=OuterRef("pk"))
+        .values("truck_stock")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+    return F("stock") + Coalesce(Subquery(shards), 0)
+
+
+def take_sharded_stock(truck_stock_id: int, shards: int, quantity: int) -> bool:
+    # Must run inside the purchase transaction. Returns False when the row
+    # doesn't have `quantity` left across all of its shards.
+    shard = random.randrange(shards)
+    if StockShard.objects.filter(
+        truck_stock_id=truck_stock_id, shard=shard, stock__gte=quantity
+    ).update(stock=F("stock") - quantity):
+        return True
+
+    # The chosen shard ran low: lock all the row's shards (in shard order, so
+    # two buyers can't deadlock) and take from the fullest ones
+    rows: list[tuple[int, int]] = list(
+        StockShard.objects.select_for_update()
+        .filter(truck_stock_id=truck_stock_id)
+        .order_by("shard")
+        .values_list("shard", "stock")
+    )
+    if sum(stock for _, stock in rows) < quantity:
+        return False
+    taken: dict[int, int] = {}
+    for shard, stock in sorted(rows, key=lambda row: -row[1]):
+        if quantity <= 0:
+            break
+        taken[shard] = min(stock, quantity)
+        quantity -= taken[shard]
+    StockShard.objects.filter(truck_stock_id=truck_stock_id, shard__in=taken).update(
+        stock=Case(
+            *(
+                When(shard=shard, then=F("stock") - count)
+                for shard, count in taken.items()
+            ),
+            default=F("stock"),
+            output_field=IntegerField(),
+        )
+    )
+    return True
+
+
+def restock(ice_cream_truck_id: int, food_item_id: int, quantity: int) -> None:
+    # Adds stock to a truck, spread evenly over the shards if any. The truck
+    # starts carrying the item if it didn't.
+    truck_stock, _ = TruckStock.objects.get_or_create(
+        ice_cream_truck_id=ice_cream_truck_id, food_item_id=food_item_id
+    )
+    if not truck_stock.stock_shards:
+        TruckStock.objects.filter(pk=truck_stock.pk).update(stock=F("stock") + quantity)
+        return
+    share, extra = divmod(quantity, truck_stock.stock_shards)
+    StockShard.objects.filter(truck_stock=truck_stock).update(
+        stock=F("stock")
+        + share
+        + Case(When(shard__lt=extra, then=1), default=0, output_field=IntegerField())
+    )
+
+
+def spread_stock(truck_stock_id: int, shards: int) -> int:
+    # Redistributes a row's whole stock evenly over `shards` shards (0 moves
+    # it back into TruckStock.stock). Used to shard a row, change its shard
+    # count and fix skew. Returns the row's stock.
+    with transaction.atomic():
+        truck_stock: TruckStock = TruckStock.objects.select_for_update().get(
+            pk=truck_stock_id
+        )
+        rows = StockShard.objects.select_for_update().filter(truck_stock=truck_stock)
+        total: int = truck_stock.stock + sum(
+            rows.order_by("shard").values_list("stock", flat=True)
+        )
+        rows.delete()
+        share, extra = divmod(total, shards) if shards else (0, 0)
+        StockShard.objects.bulk_create(
+            StockShard(
+                truck_stock=truck_stock, shard=shard, stock=share + (shard < extra)
+            )
+            for shard in range(shards)
+        )
+        truck_stock.stock = 0 if shards else total
+        truck_stock.stock_shards = shards
+        truck_stock.save(update_fields=["stock", "stock_shards"])
+    return total
@@ -1,13 +1,71 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from pathlib import Path
 from typing import Optional
 
 from unittest.mock import patch
 
 import pytest
 
-from django.urls import reverse
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.core.management import CommandError, call_command
+from django.db import close_old_connections, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import AsyncClient, RequestFactory
+from django.urls import get_resolver, reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from .models import FoodItem, IceCreamTruck, Customer, Transaction, Flavor
+from .models import (
+    FoodItem,
+    IceCreamTruck,
+    Customer,
+    Transaction,
+    Flavor,
+    OutboxEvent,
+    RevenueRollup,
+    StockShard,
+    TruckStock,
+)
+from .exports import export_rows, render_ndjson
+from .geo import distance_km
+from .idempotency import cache_keys
+from .load_data import id_bases
+from .metrics import Registry, RequestStats, registry
+from .nearby import nearby_trucks
+from .outbox import HANDLERS, handler, process_batch
+from .purchases import PurchaseError, buy_food
+from .ratelimit import acheck_limits, check_limits, gate, local_buckets, route
+from .rollups import rebuild_rollups, record_sales, truck_revenue
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .serializers import (
+    FoodItemSerializer,
+    IceCreamTruckSerializer,
+    TransactionSerializer,
+)
+from .views import FoodItemViewSet, IceCreamTruckInventoryView
+from ice_cream_truck_api.openapi import build_schema, load_artifact
 
 User = get_user_model()
 
@@ -31,6 +89,38 @@ def superuser():
     )
 
 
+@pytest.fixture(autouse=True)
+def clear_cache() -> None:
+    # Cached catalog responses and rate limit buckets must not leak between
+    # tests
+    cache.clear()
+    local_buckets.clear()
+
+
+@pytest.fixture(scope="session")
+def sqlite_replica_alias(django_db_setup, django_db_blocker, tmp_path_factory):
+    # A second SQLite database standing in for a read replica
+    replica = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": str(tmp_path_factory.mktemp("replica") / "replica.sqlite3"),
+    }
+    connections.settings["replica"] = connections.configure_settings(
+        {"default": replica, "replica": replica}
+    )["replica"]
+    with django_db_blocker.unblock():
+        call_command("migrate", database="replica", verbosity=0)
+    yield "replica"
+    connections["replica"].close()
+    del connections["replica"]
+    del connections.settings["replica"]
+
+
+@pytest.fixture
+def sqlite_replica(sqlite_replica_alias: str, settings) -> str:
+    settings.REPLICA_DATABASES = [sqlite_replica_alias]
+    return sqlite_replica_alias
+
+
 # Unit tests
 @pytest.mark.django_db
 def test_add_default_data_view(api_client: APIClient, superuser) -> None:
@@ -117,9 +207,10 @@ def test_ice_cream_truck_revenue_view_no_transactions(api_client: APIClient) ->
 @pytest.mark.django_db
 def test_buy_food_view(api_client: APIClient) -> None:
     # Ensure the buy_food view works correctly
-    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5, stock=10)
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
     customer = Customer.objects.create(name="John Doe", balance=100.0)
     ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
     url = reverse("buy-food")
     data = {"food_item_id": food_item.pk, "customer_id": customer.pk}
     response = api_client.post(url, data)
@@ -130,9 +221,10 @@ def test_buy_food_view(api_client: APIClient) -> None:
 @pytest.mark.django_db
 def test_buy_food_view_insufficient_balance(api_client: APIClient) -> None:
     # Ensure the buy_food view returns an error if the customer has insufficient balance
-    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5, stock=10)
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
     customer = Customer.objects.create(name="John Doe", balance=1.0)
     ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
     url = reverse("buy-food")
     data = {"food_item_id": food_item.pk, "customer_id": customer.pk}
     response = api_client.post(url, data)
@@ -143,9 +235,10 @@ def test_buy_food_view_insufficient_balance(api_client: APIClient) -> None:
 @pytest.mark.django_db
 def test_buy_food_view_out_of_stock(api_client: APIClient) -> None:
     # Ensure the buy_food view returns an error if the food item is out of stock
-    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5, stock=0)
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
     customer = Customer.objects.create(name="John Doe", balance=100.0)
     ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 0})
     url = reverse("buy-food")
     data = {"food_item_id": food_item.pk, "customer_id": customer.pk}
     response = api_client.post(url, data)
@@ -156,8 +249,9 @@ def test_buy_food_view_out_of_stock(api_client: APIClient) -> None:
 @pytest.mark.django_db
 def test_buy_food_view_invalid_customer(api_client: APIClient) -> None:
     # Ensure the buy_food view returns an error if the customer is not found
-    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5, stock=10)
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
     ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
     url = reverse("buy-food")
     data = {"food_item_id": food_item.pk, "customer_id": 1}
     response = api_client.post(url, data)
@@ -177,6 +271,43 @@ def test_buy_food_view_invalid_food_item(api_client: APIClient) -> None:
     assert response.data["message"] == "Food item not found."
 
 
+@pytest.mark.django_db
+def test_buy_food_views_reject_malformed_ids(api_client: APIClient) -> None:
+    # Ensure IDs that aren't integers, and bodies that aren't objects, are a
+    # 400 on both buy_food views rather than a server error
+    async_client = AsyncClient()
+    ice_cream_truck = stock_truck(2, 1)
+    food_item = ice_cream_truck.food_items.order_by("id").last()
+    customer = create_customer()
+    valid = {
+        "food_item_id": food_item.pk,
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "quantity": 1,
+    }
+    cases = [
+        ({**valid, "customer_id": "abc"}, "Invalid customer ID"),
+        ({**valid, "customer_id": [customer.pk]}, "Invalid customer ID"),
+        ({**valid, "ice_cream_truck_id": "abc"}, "Invalid ice cream truck ID"),
+        ({**valid, "ice_cream_truck_id": True}, "Invalid ice cream truck ID"),
+        ({**valid, "food_item_id": {"id": 1}}, "Invalid food item ID"),
+        ([valid], "Expected an object"),
+    ]
+    for data, message in cases:
+        response = api_client.post(reverse("buy_food"), data, format="json")
+        assert response.status_code == 400
+        assert response.data["message"] == message
+
+        response = async_to_sync(async_client.post)(
+            reverse("async_buy_food"), data, content_type="application/json"
+        )
+        assert response.status_code == 400
+        assert response.json() == {"message": message}
+
+    assert truck_stock(ice_cream_truck, food_item) == 1
+    assert not Transaction.objects.exists()
+
+
 # Integration tests
 @pytest.mark.django_db
 def test_buy_food_integration(
@@ -187,7 +318,7 @@ def test_buy_food_integration(
 ):
     # Create a food item
     if food_item is None:
-        food_item = FoodItem.objects.create(name="Ice Cream", price=2.5, stock=10)
+        food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
 
     # Create a customer
     if customer is None:
@@ -196,6 +327,7 @@ def test_buy_food_integration(
     # Create an ice cream truck
     if ice_cream_truck is None:
         ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+        ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
 
     # Buy the food item
     url = reverse("buy-food")
@@ -216,8 +348,7 @@ def test_buy_food_integration(
     assert customer.balance == 92.5
 
     # Assert that the food item's stock has been updated
-    food_item.refresh_from_db()
-    assert food_item.stock == 7
+    assert truck_stock(ice_cream_truck, food_item) == 7
 
 
 @patch.object(FoodItem, "refresh_from_db")
@@ -226,13 +357,14 @@ def test_buy_food_integration_with_patch(
     mock_food_item_refresh_from_db, mock_customer_refresh_from_db, api_client: APIClient
 ):
     # Create a food item
-    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5, stock=10)
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
 
     # Create a customer
     customer = Customer.objects.create(name="John Doe", balance=100.0)
 
     # Create an ice cream truck
     ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
 
     # Buy the food item
     url = reverse("buy-food")
@@ -247,3 +379,1809 @@ def test_buy_food_integration_with_patch(
     # Assert that the refresh_from_db methods were called
     mock_food_item_refresh_from_db.assert_called_once()
     mock_customer_refresh_from_db.assert_called_once()
+
+
+# Purchase path tests
+def create_customer(username: str = "john", balance: float = 100.0) -> Customer:
+    user = User.objects.create(username=username, first_name="John", last_name="Doe")
+    return Customer.objects.create(user=user, balance=balance)
+
+
+def truck_stock(ice_cream_truck: IceCreamTruck, food_item: FoodItem) -> int:
+    return TruckStock.objects.get(
+        ice_cream_truck=ice_cream_truck, food_item=food_item
+    ).stock
+
+
+@pytest.mark.django_db
+def test_buy_food_rolls_back_stock_on_insufficient_balance(
+    api_client: APIClient,
+) -> None:
+    # Ensure a failed balance check doesn't leave the stock decremented
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer(balance=1.0)
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    data = {
+        "food_item_id": food_item.pk,
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "quantity": 2,
+    }
+    response = api_client.post(reverse("buy_food"), data, format="json")
+    assert response.status_code == 400
+    assert response.data["message"] == "SORRY!"
+    assert truck_stock(ice_cream_truck, food_item) == 10
+    assert not Transaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_buy_food_query_count(
+    api_client: APIClient, django_assert_max_num_queries
+) -> None:
+    # Ensure a purchase is a fixed, small number of statements
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    data = {
+        "food_item_id": food_item.pk,
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "quantity": 3,
+    }
+    # Nine statements (the outbox event included) plus the savepoint pair
+    # wrapping the atomic block
+    with django_assert_max_num_queries(10):
+        response = api_client.post(reverse("buy_food"), data, format="json")
+    assert response.status_code == 200
+    customer.refresh_from_db()
+    assert customer.balance == Decimal("92.50")
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="Concurrent writers need a server database",
+)
+@pytest.mark.django_db(transaction=True)
+def test_buy_food_concurrent_purchases() -> None:
+    # Fire parallel purchases at one truck and make sure nothing is oversold
+    # and no balance update is lost
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customers = [create_customer(f"customer{i}", balance=50.0) for i in range(10)]
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 150})
+
+    def purchase(attempt: int) -> bool:
+        try:
+            buy_food(food_item.pk, customers[attempt % 10].pk, ice_cream_truck.pk, 1)
+            return True
+        except PurchaseError:
+            return False
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        sold = sum(executor.map(purchase, range(300)))
+
+    # Each customer can afford 20 items, so stock runs out first
+    assert sold == 150
+    assert truck_stock(ice_cream_truck, food_item) == 0
+    assert Transaction.objects.count() == sold
+    balances = Customer.objects.aggregate(total=Sum("balance"))["total"]
+    assert balances == Decimal("500.00") - Decimal("2.50") * sold
+
+
+@pytest.mark.django_db
+def test_checkout_view(api_client: APIClient, django_assert_max_num_queries) -> None:
+    # Ensure a whole cart is bought with a fixed number of statements
+    ice_cream = FoodItem.objects.create(name="Ice Cream", price=3.0)
+    snack_bar = FoodItem.objects.create(name="Snack Bar", price=1.5)
+    customer = create_customer(balance=20.0)
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(ice_cream, through_defaults={"stock": 5})
+    ice_cream_truck.food_items.add(snack_bar, through_defaults={"stock": 5})
+    data = {
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "items": [
+            {"food_item_id": ice_cream.pk, "quantity": 1},
+            {"food_item_id": snack_bar.pk, "quantity": 2},
+        ],
+    }
+    with django_assert_max_num_queries(10):
+        response = api_client.post(reverse("checkout"), data, format="json")
+    assert response.status_code == 200
+    assert response.data["total"] == Decimal("6.00")
+    customer.refresh_from_db()
+    assert customer.balance == Decimal("14.00")
+    assert truck_stock(ice_cream_truck, ice_cream) == 4
+    assert truck_stock(ice_cream_truck, snack_bar) == 3
+    assert Transaction.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_checkout_view_is_all_or_nothing(api_client: APIClient) -> None:
+    # Ensure one line without stock fails the whole cart
+    ice_cream = FoodItem.objects.create(name="Ice Cream", price=3.0)
+    snack_bar = FoodItem.objects.create(name="Snack Bar", price=1.5)
+    customer = create_customer(balance=20.0)
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(ice_cream, through_defaults={"stock": 5})
+    ice_cream_truck.food_items.add(snack_bar, through_defaults={"stock": 1})
+    data = {
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "items": [
+            {"food_item_id": ice_cream.pk, "quantity": 1},
+            {"food_item_id": snack_bar.pk, "quantity": 2},
+        ],
+    }
+    response = api_client.post(reverse("checkout"), data, format="json")
+    assert response.status_code == 400
+    assert response.data["message"] == "SORRY!"
+    assert truck_stock(ice_cream_truck, ice_cream) == 5
+    customer.refresh_from_db()
+    assert customer.balance == Decimal("20.00")
+    assert not Transaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_ice_cream_truck_revenue_view_reads_rollups(
+    api_client: APIClient, django_assert_max_num_queries
+) -> None:
+    # Ensure purchases keep the rollups current for the right truck
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck = IceCreamTruck.objects.create(name="Mr Whippy")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 2)
+    buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 1)
+
+    url = reverse("ice_cream_truck_revenue_detail", args=[ice_cream_truck.pk])
+    with django_assert_max_num_queries(1):
+        response = api_client.get(url)
+    assert response.data["total_revenue"] == Decimal("7.50")
+
+    with django_assert_max_num_queries(2):
+        response = api_client.get(url, {"period": "hour"})
+    assert response.data["total_revenue"] == Decimal("7.50")
+    assert len(response.data["buckets"]) == 1
+    assert response.data["buckets"][0]["units_sold"] == 3
+
+    tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+    response = api_client.get(url, {"period": "day", "from": tomorrow})
+    assert response.data["total_revenue"] == 0
+    assert response.data["buckets"] == []
+
+
+@pytest.mark.django_db
+def test_revenue_rollups_are_sharded(
+    api_client: APIClient, settings, monkeypatch
+) -> None:
+    # Ensure sales spread over the rollup shards still read as one bucket
+    settings.REVENUE_ROLLUP_SHARDS = 3
+    shards = itertools.cycle(range(3))
+    monkeypatch.setattr(
+        "ice_cream_truck.rollups.random.randrange", lambda stop: next(shards)
+    )
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    for _ in range(4):
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 1)
+    assert RevenueRollup.objects.filter(period=RevenueRollup.DAY).count() == 3
+
+    url = reverse("ice_cream_truck_revenue_detail", args=[ice_cream_truck.pk])
+    assert api_client.get(url).data["total_revenue"] == Decimal("10.00")
+    response = api_client.get(url, {"period": "day"})
+    assert response.data["total_revenue"] == Decimal("10.00")
+    assert [bucket["units_sold"] for bucket in response.data["buckets"]] == [4]
+
+
+@pytest.mark.django_db
+def test_rebuild_revenue_rollups_command() -> None:
+    # Ensure the rollups can be rebuilt from the raw transactions
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 2)
+    expected = list(RevenueRollup.objects.order_by("period").values())
+
+    RevenueRollup.objects.update(revenue=0, units_sold=0)
+    call_command("rebuild_revenue_rollups", stdout=StringIO())
+
+    rebuilt = list(RevenueRollup.objects.order_by("period").values())
+    assert [
+        (row["period"], row["bucket"], row["revenue"], row["units_sold"])
+        for row in rebuilt
+    ] == [
+        (row["period"], row["bucket"], row["revenue"], row["units_sold"])
+        for row in expected
+    ]
+    ice_cream_truck = IceCreamTruck.objects.annotate(total_revenue=truck_revenue()).get(
+        pk=ice_cream_truck.pk
+    )
+    assert ice_cream_truck.total_revenue == Decimal("5.00")
+
+
+@pytest.mark.django_db
+def test_saving_a_truck_keeps_its_revenue(api_client: APIClient) -> None:
+    # Ensure a truck saved after a sale (e.g. from the admin) doesn't write
+    # back the revenue it was loaded with
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    stale = IceCreamTruck.objects.get(pk=ice_cream_truck.pk)
+    buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 2)
+
+    stale.name = "Mr Whippy"
+    stale.save()
+    url = reverse("ice_cream_truck_revenue_detail", args=[ice_cream_truck.pk])
+    assert api_client.get(url).data["total_revenue"] == Decimal("5.00")
+
+
+@pytest.mark.django_db
+def test_rebuild_rollups_of_some_trucks() -> None:
+    # Ensure a scoped rebuild, in small batches, leaves other trucks' rollups
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    trucks = IceCreamTruck.objects.bulk_create(
+        IceCreamTruck(name=name) for name in ("Krispy Kream", "Mr Whippy")
+    )
+    for ice_cream_truck in trucks:
+        ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 2)
+    RevenueRollup.objects.update(revenue=0, units_sold=0)
+
+    rebuilt = rebuild_rollups(
+        IceCreamTruck.objects.filter(pk=trucks[0].pk), batch_size=1
+    )
+    assert rebuilt == 2
+    assert {
+        (row.ice_cream_truck_id, row.period): row.units_sold
+        for row in RevenueRollup.objects.all()
+    } == {
+        (trucks[0].pk, RevenueRollup.HOUR): 2,
+        (trucks[0].pk, RevenueRollup.DAY): 2,
+        (trucks[1].pk, RevenueRollup.HOUR): 0,
+        (trucks[1].pk, RevenueRollup.DAY): 0,
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migrations_roll_up_sales_made_before_the_rollups() -> None:
+    # Ensure a truck that sold before the rollups existed, with or without
+    # rollups for its later sales, keeps all of its revenue after upgrading
+    before_rollups = ("ice_cream_truck", "0004_remove_customer_name_customer_user")
+    before_backfill = ("ice_cream_truck", "0013_revenuerollup_shard")
+    executor = MigrationExecutor(connection)
+    executor.migrate([before_rollups])
+    old = executor.loader.project_state([before_rollups]).apps
+    user = old.get_model("auth", "User").objects.create(username="john")
+    customer = old.get_model("ice_cream_truck", "Customer").objects.create(
+        user=user, balance=100
+    )
+    food_item = old.get_model("ice_cream_truck", "FoodItem").objects.create(
+        name="Ice Cream", price=2.5
+    )
+    trucks = [
+        old.get_model("ice_cream_truck", "IceCreamTruck").objects.create(name=name)
+        for name in ("Krispy Kream", "Mr Whippy")
+    ]
+    OldTransaction = old.get_model("ice_cream_truck", "Transaction")
+    for ice_cream_truck, days_ago in [(trucks[0], 3), (trucks[0], 2), (trucks[1], 1)]:
+        sale = OldTransaction.objects.create(
+            customer=customer,
+            ice_cream_truck=ice_cream_truck,
+            food_item=food_item,
+            quantity=2,
+            total=Decimal("5.00"),
+        )
+        OldTransaction.objects.filter(pk=sale.pk).update(
+            date=timezone.now() - timedelta(days=days_ago)
+        )
+
+    # A sale made with rollups in place only ever reached its own buckets
+    executor = MigrationExecutor(connection)
+    executor.migrate([before_backfill])
+    sale = Transaction.objects.create(
+        customer_id=customer.pk,
+        ice_cream_truck_id=trucks[1].pk,
+        food_item_id=food_item.pk,
+        quantity=1,
+        total=Decimal("2.50"),
+    )
+    record_sales(trucks[1].pk, sale.date, sale.total, sale.quantity)
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
+    revenue = dict(
+        IceCreamTruck.objects.annotate(total_revenue=truck_revenue()).values_list(
+            "pk", "total_revenue"
+        )
+    )
+    assert revenue == {trucks[0].pk: Decimal("10.00"), trucks[1].pk: Decimal("7.50")}
+    assert RevenueRollup.objects.filter(
+        ice_cream_truck_id=trucks[0].pk, period=RevenueRollup.HOUR
+    ).aggregate(units_sold=Sum("units_sold")) == {"units_sold": 4}
+
+
+def stock_truck(items: int, flavors_per_item: int) -> IceCreamTruck:
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    food_items = FoodItem.objects.bulk_create(
+        FoodItem(name=f"Item {i}", price=1.5) for i in range(items)
+    )
+    Flavor.objects.bulk_create(
+        Flavor(name=f"Flavor {j}", food_item=food_item)
+        for food_item in food_items
+        for j in range(flavors_per_item)
+    )
+    TruckStock.objects.bulk_create(
+        TruckStock(ice_cream_truck=ice_cream_truck, food_item=food_item, stock=i)
+        for i, food_item in enumerate(food_items)
+    )
+    return ice_cream_truck
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("items,flavors_per_item", [(1, 1), (5, 3), (50, 10)])
+def test_ice_cream_truck_inventory_view_query_count(
+    api_client: APIClient, django_assert_num_queries, items: int, flavors_per_item: int
+) -> None:
+    # Ensure the nested inventory costs the same queries for any menu size
+    ice_cream_truck = stock_truck(items, flavors_per_item)
+    url = reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    with django_assert_num_queries(3):
+        response = api_client.get(url)
+    assert response.status_code == 200
+    assert len(response.data["food_items"]) == items
+    first_item = response.data["food_items"][0]
+    assert set(first_item) == {"id", "name", "price", "stock", "flavors"}
+    assert len(first_item["flavors"]) == flavors_per_item
+
+
+@pytest.mark.django_db
+def test_food_item_list_view_query_count(
+    api_client: APIClient, django_assert_num_queries
+) -> None:
+    # Ensure food item flavors are prefetched rather than loaded per item
+    stock_truck(20, 4)
+    with django_assert_num_queries(2):
+        response = api_client.get(reverse("fooditem-list"))
+    assert len(response.json()["results"]) == 20
+    assert len(response.json()["results"][0]["flavors"]) == 4
+
+
+@pytest.mark.django_db
+def test_food_item_list_view_is_cached_by_catalog_version(
+    api_client: APIClient,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+) -> None:
+    # Ensure repeat reads skip the database and edits invalidate the cache
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    url = reverse("fooditem-list")
+    first = api_client.get(url)
+    with django_assert_num_queries(0):
+        second = api_client.get(url)
+    assert second.content == first.content
+    assert second["ETag"] == first["ETag"]
+
+    with django_assert_num_queries(0):
+        not_modified = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+    assert not_modified.status_code == 304
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Flavor.objects.create(name="Mint", food_item=food_item)
+    third = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+    assert third.status_code == 200
+    assert third["ETag"] != first["ETag"]
+    assert third.json()["results"][0]["flavors"] == [{"name": "Mint"}]
+
+
+@pytest.mark.django_db
+def test_customer_transactions_view_pages_by_keyset(
+    api_client: APIClient, django_assert_num_queries
+) -> None:
+    # Ensure pages follow (date, id) order without gaps or repeats, even when
+    # several transactions share a timestamp, at a constant query cost
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 100})
+    for _ in range(8):
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 1)
+    same_time = timezone.now()
+    Transaction.objects.filter(
+        pk__in=Transaction.objects.order_by("id").values("pk")[2:5]
+    ).update(date=same_time)
+    expected = list(
+        Transaction.objects.order_by("-date", "-id").values_list("id", flat=True)
+    )
+
+    url = reverse("customer_transactions", args=[customer.pk])
+    seen: list[int] = []
+    params: dict = {"page_size": 3}
+    while url:
+        with django_assert_num_queries(1):
+            response = api_client.get(url, params)
+        assert response.status_code == 200
+        seen += [row["id"] for row in response.data["results"]]
+        url, params = response.data["next"], {}
+    assert seen == expected
+
+    other_truck = IceCreamTruck.objects.create(name="Mr Whippy")
+    url = reverse("ice_cream_truck_transactions", args=[other_truck.pk])
+    assert api_client.get(url).data["results"] == []
+
+
+@pytest.mark.django_db
+def test_ice_cream_truck_revenue_view_exact_time_window(api_client: APIClient) -> None:
+    # Ensure from/to windows are exact, not rounded to whole rollup buckets
+    food_item = FoodItem.objects.create(name="Ice Cream", price=1.0)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 100})
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    for minutes, quantity in [(-70, 1), (-50, 2), (10, 4), (50, 8), (70, 16)]:
+        sale = buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, quantity)
+        sale_date = hour + timedelta(minutes=minutes)
+        Transaction.objects.filter(pk=sale.pk).update(date=sale_date)
+    call_command("rebuild_revenue_rollups", stdout=StringIO())
+
+    url = reverse("ice_cream_truck_revenue_detail", args=[ice_cream_truck.pk])
+    cases = [
+        (
+            {"from": hour - timedelta(minutes=60), "to": hour + timedelta(minutes=60)},
+            14,
+        ),
+        (
+            {"from": hour - timedelta(minutes=55), "to": hour + timedelta(minutes=55)},
+            14,
+        ),
+        (
+            {"from": hour - timedelta(minutes=45), "to": hour + timedelta(minutes=65)},
+            12,
+        ),
+        ({"from": hour + timedelta(minutes=5), "to": hour + timedelta(minutes=20)}, 4),
+        ({"to": hour}, 3),
+        ({"from": hour + timedelta(minutes=30)}, 24),
+    ]
+    for window, expected in cases:
+        params = {key: value.isoformat() for key, value in window.items()}
+        response = api_client.get(url, params)
+        assert response.data["total_revenue"] == expected, window
+
+
+@pytest.mark.django_db
+def test_transaction_window_queries_use_composite_indexes() -> None:
+    # Ensure per-owner time windows are answered from the (owner, date) indexes
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            # The tables are tiny, so keep the planner off sequential scans
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    elif connection.vendor != "sqlite":
+        pytest.skip("Query plans are only checked on SQLite and PostgreSQL")
+
+    start = timezone.now() - timedelta(days=1)
+    end = timezone.now()
+    by_customer = Transaction.objects.filter(customer_id=1).in_window(start, end)
+    by_truck = Transaction.objects.filter(ice_cream_truck_id=1).in_window(start, end)
+    assert "transaction_customer_date_idx" in by_customer.order_by("-date").explain()
+    assert "transaction_truck_date_idx" in by_truck.order_by("-date").explain()
+
+
+@pytest.mark.django_db
+def test_async_views_match_sync_views(api_client: APIClient) -> None:
+    # Ensure the native async views buy and report exactly like the DRF views
+    async_client = AsyncClient()
+    ice_cream_truck = stock_truck(3, 2)
+    food_item = ice_cream_truck.food_items.order_by("id").last()
+    customer = create_customer()
+    data = {
+        "food_item_id": food_item.pk,
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "quantity": 2,
+    }
+    response = async_to_sync(async_client.post)(
+        reverse("async_buy_food"), data, content_type="application/json"
+    )
+    assert response.status_code == 200
+    assert response.json() == {"message": "ENJOY!"}
+    assert truck_stock(ice_cream_truck, food_item) == 0
+
+    data["quantity"] = 1
+    response = async_to_sync(async_client.post)(
+        reverse("async_buy_food"), data, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert response.json() == {"message": "SORRY!"}
+
+    for name, params in [
+        ("ice_cream_truck_inventory", {}),
+        ("ice_cream_truck_revenue_detail", {}),
+        ("ice_cream_truck_revenue_detail", {"period": "hour"}),
+        ("ice_cream_truck_revenue_detail", {"from": "2020-01-01"}),
+    ]:
+        url = reverse(name, args=[ice_cream_truck.pk])
+        async_url = reverse(f"async_{name}", args=[ice_cream_truck.pk])
+        expected = api_client.get(url, params, HTTP_ACCEPT="application/json")
+        response = async_to_sync(async_client.get)(async_url, params)
+        assert response.status_code == 200
+        assert response.json() == expected.json()
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_read_views_use_replica_until_a_purchase_makes_them_sticky(
+    api_client: APIClient, sqlite_replica: str, django_capture_on_commit_callbacks
+) -> None:
+    # The replica copy is renamed so reads from it can be told apart
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Primary Truck")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    IceCreamTruck.objects.using(sqlite_replica).create(
+        pk=ice_cream_truck.pk, name="Replica Truck"
+    )
+    url = reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    assert api_client.get(url).data["name"] == "Replica Truck"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 1)
+    assert api_client.get(url).data["name"] == "Primary Truck"
+
+    # Writes always go to the primary
+    assert Transaction.objects.using("default").count() == 1
+    assert Transaction.objects.using(sqlite_replica).count() == 0
+
+
+@pytest.mark.django_db
+def test_metrics_view_reports_per_view_latency_and_queries(
+    api_client: APIClient, settings, tmp_path
+) -> None:
+    # Ensure requests are recorded per URL name and merged across processes
+    settings.METRICS_DIR = str(tmp_path)
+    registry.data = registry.empty()
+    ice_cream_truck = stock_truck(2, 1)
+    url = reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    api_client.get(url)
+    api_client.get(url)
+    api_client.get(reverse("ice_cream_truck_inventory", args=[0]))
+
+    # Another worker's snapshot
+    other_worker = Registry()
+    other_worker.observe("ice_cream_truck_inventory", "GET", 200, 0.02, RequestStats())
+    (tmp_path / "0.json").write_text(json.dumps(other_worker.data))
+
+    body = api_client.get("/metrics").content.decode()
+    assert (
+        'http_requests_total{view="ice_cream_truck_inventory",method="GET",'
+        'status="200"} 3' in body
+    )
+    assert (
+        'http_requests_total{view="ice_cream_truck_inventory",method="GET",'
+        'status="404"} 1' in body
+    )
+    assert (
+        'http_request_duration_seconds_count{view="ice_cream_truck_inventory"} 4'
+        in body
+    )
+    # Three queries per found truck, one for the missing one
+    assert 'db_queries_total{view="ice_cream_truck_inventory"} 7' in body
+    assert 'db_query_seconds_total{view="ice_cream_truck_inventory"}' in body
+
+
+def test_metrics_snapshots_are_flushed_without_more_requests(
+    settings, tmp_path
+) -> None:
+    # Ensure a worker's last requests reach the other workers even when no
+    # request follows them, and are written once more at exit
+    settings.METRICS_DIR = str(tmp_path)
+    worker = Registry()
+    snapshot = tmp_path / f"{os.getpid()}.json"
+    with patch("ice_cream_truck.metrics.FLUSH_SECONDS", 0.01):
+        worker.observe("buy_food", "POST", 200, 0.01, RequestStats())
+        deadline = time.monotonic() + 5
+        while not snapshot.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert json.loads(snapshot.read_text())["requests"] == {"buy_food|POST|200": 1}
+
+    with patch("ice_cream_truck.metrics.FLUSH_SECONDS", 60):
+        time.sleep(0.05)
+        worker.observe("buy_food", "POST", 200, 0.01, RequestStats())
+        worker.flush_quietly()
+    assert json.loads(snapshot.read_text())["requests"] == {"buy_food|POST|200": 2}
+
+
+def test_metrics_view_is_not_public(api_client: APIClient, settings) -> None:
+    # Ensure only the host itself, or a scraper with the metrics token, can
+    # read the metrics
+    url = reverse("metrics")
+    assert api_client.get(url).status_code == 200
+    assert api_client.get(url, REMOTE_ADDR="203.0.113.7").status_code == 403
+
+    settings.METRICS_TOKEN = "scrape-me"
+    assert api_client.get(url).status_code == 403
+    response = api_client.get(
+        url, REMOTE_ADDR="203.0.113.7", HTTP_AUTHORIZATION="Bearer scrape-me"
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(b"# HELP http_requests_total")
+    response = api_client.get(url, HTTP_AUTHORIZATION="Bearer guess")
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_buy_food_idempotency_key_replays_first_response(
+    api_client: APIClient, django_assert_num_queries
+) -> None:
+    # Ensure a retried purchase is charged once and replayed without the DB
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    data = {
+        "food_item_id": food_item.pk,
+        "customer_id": customer.pk,
+        "ice_cream_truck_id": ice_cream_truck.pk,
+        "quantity": 1,
+    }
+    headers = {"HTTP_IDEMPOTENCY_KEY": "order-1"}
+    first = api_client.post(reverse("buy_food"), data, format="json", **headers)
+    with django_assert_num_queries(0):
+        retry = api_client.post(reverse("buy_food"), data, format="json", **headers)
+    assert (retry.status_code, retry.data) == (first.status_code, first.data)
+    assert retry["Idempotent-Replayed"] == "true"
+    assert truck_stock(ice_cream_truck, food_item) == 9
+    assert Transaction.objects.count() == 1
+
+    # The same key with another body is refused, a new key buys again
+    data["quantity"] = 2
+    response = api_client.post(reverse("buy_food"), data, format="json", **headers)
+    assert response.status_code == 422
+    api_client.post(
+        reverse("buy_food"), data, format="json", HTTP_IDEMPOTENCY_KEY="order-2"
+    )
+    assert Transaction.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_idempotency_keys_are_scoped_to_the_caller(
+    api_client: APIClient, superuser
+) -> None:
+    # Ensure two callers that pick the same key each buy, and never get the
+    # other's response back, on the sync and the async view
+    async_client = AsyncClient()
+    ice_cream_truck = stock_truck(2, 1)
+    food_item = ice_cream_truck.food_items.order_by("id").last()
+    TruckStock.objects.update(stock=10)
+    john = create_customer()
+    jane = create_customer("jane")
+
+    def data(customer: Customer) -> dict:
+        return {
+            "food_item_id": food_item.pk,
+            "customer_id": customer.pk,
+            "ice_cream_truck_id": ice_cream_truck.pk,
+            "quantity": 1,
+        }
+
+    for url, post in [
+        (
+            reverse("buy_food"),
+            partial(api_client.post, format="json", HTTP_IDEMPOTENCY_KEY="order-1"),
+        ),
+        (
+            reverse("async_buy_food"),
+            partial(
+                async_to_sync(async_client.post),
+                content_type="application/json",
+                headers={"Idempotency-Key": "order-1"},
+            ),
+        ),
+    ]:
+        Transaction.objects.all().delete()
+        cache.clear()
+        assert post(url, data(john)).status_code == 200
+        response = post(url, data(jane))
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response
+        assert post(url, data(jane))["Idempotent-Replayed"] == "true"
+        assert Transaction.objects.count() == 2
+
+    # Signed-in callers are told apart by their user, whatever the body says
+    api_client.force_authenticate(superuser)
+    response = api_client.post(
+        reverse("buy_food"), data(jane), format="json", HTTP_IDEMPOTENCY_KEY="order-1"
+    )
+    assert "Idempotent-Replayed" not in response
+    assert Transaction.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_checkout_idempotency_key_duplicate_waits_for_first_request(
+    api_client: APIClient, settings
+) -> None:
+    # A duplicate sent while the first request runs gets its response
+    settings.IDEMPOTENCY_WAIT_SECONDS = 5
+    path = reverse("checkout")
+    result_key, lock_key = cache_keys(path, "customer:0", "cart-1")
+    cache.add(lock_key, True)
+    body = json.dumps({"customer_id": 0, "ice_cream_truck_id": 0, "items": []})
+    digest = hashlib.sha256(body.encode()).hexdigest()
+
+    def first_request_finishes() -> None:
+        time.sleep(0.2)
+        cache.set(result_key, (digest, 200, {"message": "ENJOY!", "total": "1.00"}))
+        cache.delete(lock_key)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(first_request_finishes)
+        response = api_client.post(
+            path, body, content_type="application/json", HTTP_IDEMPOTENCY_KEY="cart-1"
+        )
+    assert response.status_code == 200
+    assert response.data == {"message": "ENJOY!", "total": "1.00"}
+    assert not Transaction.objects.exists()
+
+    # Still running after the wait: the duplicate is told to retry later
+    settings.IDEMPOTENCY_WAIT_SECONDS = 0
+    cache.add(cache_keys(path, "customer:0", "cart-2")[1], True)
+    response = api_client.post(
+        path, body, content_type="application/json", HTTP_IDEMPOTENCY_KEY="cart-2"
+    )
+    assert response.status_code == 409
+
+
+@pytest.mark.django_db
+def test_sharded_stock_purchases_restock_and_rebalance(api_client: APIClient) -> None:
+    # Ensure a sharded item sells down to zero across shards, reports the
+    # sum of its shards and can be restocked and rebalanced
+    from .stock import restock, spread_stock
+
+    food_item = FoodItem.objects.create(name="Ice Cream", price=1.0)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    row = TruckStock.objects.create(
+        ice_cream_truck=ice_cream_truck, food_item=food_item, stock=10
+    )
+    assert spread_stock(row.pk, 4) == 10
+    shards = StockShard.objects.filter(truck_stock=row).order_by("shard")
+    assert list(shards.values_list("stock", flat=True)) == [3, 3, 2, 2]
+
+    # The last purchase needs more than any one shard has left
+    for quantity in (1, 2, 3, 4):
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, quantity)
+    with pytest.raises(PurchaseError):
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 1)
+    assert sum(shards.values_list("stock", flat=True)) == 0
+
+    restock(ice_cream_truck.pk, food_item.pk, 7)
+    assert list(shards.values_list("stock", flat=True)) == [2, 2, 2, 1]
+    url = reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    assert api_client.get(url).data["food_items"][0]["stock"] == 7
+
+    StockShard.objects.filter(truck_stock=row, shard=0).update(stock=20)
+    call_command("rebalance_stock_shards", stdout=StringIO())
+    assert list(shards.values_list("stock", flat=True)) == [7, 6, 6, 6]
+    call_command("rebalance_stock_shards", food_item.pk, shards=0, stdout=StringIO())
+    row.refresh_from_db()
+    assert (row.stock, row.stock_shards) == (25, 0)
+    assert not shards.exists()
+    assert api_client.get(url).data["food_items"][0]["stock"] == 25
+
+
+@pytest.mark.django_db
+def test_buy_food_decrements_only_the_buying_trucks_stock(
+    api_client: APIClient,
+) -> None:
+    # Ensure trucks sell from their own stock, and only what they carry
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    other_item = FoodItem.objects.create(name="Snack Bar", price=1.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    other_truck = IceCreamTruck.objects.create(name="Frosty")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 5})
+    other_truck.food_items.add(food_item, through_defaults={"stock": 5})
+    other_truck.food_items.add(other_item, through_defaults={"stock": 5})
+
+    buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 2)
+    assert truck_stock(ice_cream_truck, food_item) == 3
+    assert truck_stock(other_truck, food_item) == 5
+    with pytest.raises(PurchaseError):
+        buy_food(other_item.pk, customer.pk, ice_cream_truck.pk, 1)
+    assert truck_stock(other_truck, other_item) == 5
+
+    url = reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    assert [
+        (item["name"], item["stock"]) for item in api_client.get(url).data["food_items"]
+    ] == [("Ice Cream", 3)]
+
+
+def sell(count: int, ice_cream_truck: IceCreamTruck, customer: Customer) -> None:
+    food_item = FoodItem.objects.create(name=f"Item {count}", price=1.25)
+    Transaction.objects.bulk_create(
+        Transaction(
+            food_item=food_item,
+            customer=customer,
+            ice_cream_truck=ice_cream_truck,
+            quantity=1,
+            total=Decimal("1.25"),
+        )
+        for _ in range(count)
+    )
+
+
+@pytest.mark.django_db
+def test_transaction_export_view_streams_csv_and_ndjson(
+    api_client: APIClient, superuser
+) -> None:
+    # Ensure exports are admin only, joined, windowed and a fixed query count
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    sell(3, ice_cream_truck, customer)
+    Transaction.objects.filter(pk=Transaction.objects.order_by("id").first().pk).update(
+        date=timezone.now() - timedelta(days=3)
+    )
+    url = reverse("transaction_export")
+    assert api_client.get(url).status_code == 403
+
+    api_client.force_authenticate(user=superuser)
+    response = api_client.get(url)
+    assert response["Content-Type"].startswith("text/csv")
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert lines[0].startswith("id,date,customer_id,customer,")
+    assert len(lines) == 4
+    assert lines[1].endswith(
+        ",john,%d,Krispy Kream,%d,Item 3,1,1.25"
+        % (ice_cream_truck.pk, Transaction.objects.first().food_item_id)
+    )
+
+    since = (timezone.now() - timedelta(days=1)).isoformat()
+    response = api_client.get(url, {"format": "ndjson", "from": since})
+    assert response["Content-Type"].startswith("application/x-ndjson")
+    rows = [
+        json.loads(line)
+        for line in b"".join(response.streaming_content).decode().splitlines()
+    ]
+    assert len(rows) == 2
+    assert rows[0]["ice_cream_truck"] == "Krispy Kream"
+    assert rows[0]["total"] == "1.25"
+    assert api_client.get(url, {"from": "soon"}).json() == {
+        "message": "Invalid time window"
+    }
+
+
+def test_export_renderers_write_error_bodies() -> None:
+    # Ensure a response negotiated as CSV or NDJSON outside the streamed
+    # export (e.g. an error) is rendered rather than raising
+    error = {"message": "Invalid time window", "fields": ["from", "to"]}
+    assert CSVRenderer().render(error).decode().splitlines() == [
+        "message,fields",
+        'Invalid time window,"[""from"", ""to""]"',
+    ]
+    assert NDJSONRenderer().render([error, "Not found."]).decode().splitlines() == [
+        json.dumps(error),
+        json.dumps({"detail": "Not found."}),
+    ]
+    assert CSVRenderer().render(None) == b""
+
+
+@pytest.mark.django_db
+def test_transaction_export_memory_stays_flat() -> None:
+    # Peak memory while streaming 10x the rows should stay about the same
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+
+    def peak_while_exporting() -> tuple[int, int]:
+        rows = 0
+        tracemalloc.start()
+        for chunk in render_ndjson(export_rows(chunk_size=200), chunk_size=200):
+            rows += chunk.count("\n")
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return rows, peak
+
+    sell(1000, ice_cream_truck, customer)
+    rows, small_peak = peak_while_exporting()
+    assert rows == 1000
+    sell(9000, ice_cream_truck, customer)
+    rows, large_peak = peak_while_exporting()
+    assert rows == 10000
+    assert large_peak < small_peak * 1.5
+
+
+def export_over_asgi(token: str) -> tuple[int, int]:
+    # (rows received, peak traced memory) for an NDJSON export sent through
+    # Django's ASGI handler, as uvicorn would drive it
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": reverse("transaction_export"),
+        "query_string": b"format=ndjson",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"authorization", f"Token {token}".encode()),
+        ],
+    }
+    received: list[int] = []
+
+    async def receive() -> dict:
+        if not received:
+            received.append(0)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # No disconnect while the response is sent
+        await asyncio.Event().wait()
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        elif message["type"] == "http.response.body":
+            received.append(message.get("body", b"").count(b"\n"))
+
+    # As the test client does, so the test's transaction stays open
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    tracemalloc.start()
+    try:
+        async_to_sync(ASGIHandler())(scope, receive, send)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+    return sum(received), peak
+
+
+@pytest.mark.django_db
+def test_transaction_export_streams_under_asgi(superuser) -> None:
+    # Ensure the export isn't read into memory before being sent when served
+    # by an ASGI server
+    token: str = Token.objects.create(user=superuser).key
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+
+    sell(2000, ice_cream_truck, customer)
+    rows, small_peak = export_over_asgi(token)
+    assert rows == 2000
+    sell(18000, ice_cream_truck, customer)
+    rows, large_peak = export_over_asgi(token)
+    assert rows == 20000
+    assert large_peak < small_peak * 1.5
+
+
+@pytest.mark.django_db
+def test_restock_view_applies_rows_in_bulk(
+    api_client: APIClient, superuser, django_assert_max_num_queries
+) -> None:
+    # Ensure a batch is applied with a fixed number of statements, and that
+    # one invalid row rejects the whole batch with a per-row report
+    ice_cream = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(ice_cream, through_defaults={"stock": 3})
+    url = reverse("ice_cream_truck_restock", args=[ice_cream_truck.pk])
+    api_client.force_authenticate(user=superuser)
+
+    rows = [
+        {"name": "Ice Cream", "price": "2.75", "flavors": ["Mint"], "stock": 7},
+        *(
+            {"name": f"Item {i}", "price": "1.00", "flavors": ["Plain"], "stock": i}
+            for i in range(1, 201)
+        ),
+    ]
+    with django_assert_max_num_queries(15):
+        response = api_client.post(url, rows, format="json")
+    assert response.status_code == 200
+    assert (response.data["created"], response.data["repriced"]) == (200, 1)
+    assert response.data["flavors_created"] == 201
+    assert truck_stock(ice_cream_truck, ice_cream) == 10
+    assert truck_stock(ice_cream_truck, FoodItem.objects.get(name="Item 200")) == 200
+    ice_cream.refresh_from_db()
+    assert ice_cream.price == Decimal("2.75")
+
+    body = "name,price,flavors,stock\nIce Cream,,Mint;Vanilla,5\nNew Item,,,1\n"
+    response = api_client.post(url, body, content_type="text/csv")
+    assert response.status_code == 400
+    assert [entry["status"] for entry in response.data["rows"]] == [
+        "updated",
+        "invalid",
+    ]
+    assert "price" in response.data["rows"][1]["errors"]
+    assert truck_stock(ice_cream_truck, ice_cream) == 10
+    assert not Flavor.objects.filter(name="Vanilla").exists()
+
+
+@pytest.mark.django_db
+def test_import_catalog_command(tmp_path, django_capture_on_commit_callbacks) -> None:
+    # Ensure the catalog imports from a file and bumps the catalog version
+    from .catalog_cache import catalog_version
+
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    path = tmp_path / "catalog.json"
+    path.write_text(
+        json.dumps([{"name": "Snack Bar", "price": "1.99", "flavors": ["Magnum"]}])
+    )
+    version = catalog_version()
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("import_catalog", str(path), stdout=StringIO())
+    assert catalog_version() != version
+    assert list(
+        FoodItem.objects.get(name="Snack Bar").flavors.values_list("name", flat=True)
+    ) == ["Magnum"]
+
+    path.write_text(json.dumps([{"name": "Snack Bar", "stock": 4}]))
+    with pytest.raises(CommandError):
+        call_command("import_catalog", str(path), stdout=StringIO(), stderr=StringIO())
+    call_command(
+        "import_catalog", str(path), truck=ice_cream_truck.pk, stdout=StringIO()
+    )
+    assert truck_stock(ice_cream_truck, FoodItem.objects.get(name="Snack Bar")) == 4
+
+
+@pytest.mark.django_db
+def test_sales_analytics_view_buckets_groups_and_top_k(
+    api_client: APIClient, django_assert_max_num_queries
+) -> None:
+    # Ensure sales are bucketed and ranked in SQL, and that closed buckets
+    # come from the cache on the next request
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    items = [FoodItem.objects.create(name=f"Item {i}", price=1) for i in range(3)]
+    now = timezone.now()
+    yesterday = now - timedelta(days=1)
+    for date, food_item, quantity in [
+        (yesterday, items[0], 1),
+        (yesterday, items[1], 5),
+        (yesterday, items[2], 3),
+        (now, items[2], 2),
+    ]:
+        sale = Transaction.objects.create(
+            food_item=food_item,
+            customer=customer,
+            ice_cream_truck=ice_cream_truck,
+            quantity=quantity,
+            total=quantity,
+        )
+        # date is auto_now_add
+        Transaction.objects.filter(pk=sale.pk).update(date=date)
+
+    url = reverse("sales_analytics")
+    params = {"period": "day", "group_by": "food_item", "top": 2}
+    response = api_client.get(url, params)
+    assert response.status_code == 200
+    rows = [
+        (row["name"], row["units_sold"], row["revenue"])
+        for row in response.data["buckets"]
+    ]
+    assert rows == [
+        ("Item 1", 5, Decimal("5.00")),
+        ("Item 2", 3, Decimal("3.00")),
+        ("Item 2", 2, Decimal("2.00")),
+    ]
+
+    # Only today's open bucket is aggregated again
+    with django_assert_max_num_queries(1):
+        assert api_client.get(url, params).data == response.data
+
+    response = api_client.get(url, {"period": "week", "truck": ice_cream_truck.pk})
+    assert sum(row["units_sold"] for row in response.data["buckets"]) == 11
+    assert api_client.get(url, {"period": "month"}).status_code == 400
+    assert api_client.get(url, {"top": 0}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_outbox_worker_handles_sale_events(caplog) -> None:
+    # Ensure a sale stores its event with the purchase and the worker hands
+    # it to the handlers, then deletes it
+    food_item = FoodItem.objects.create(name="Ice Cream", price=2.5)
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 6})
+    sale = buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 2)
+
+    event = OutboxEvent.objects.get()
+    assert event.topic == "sale"
+    assert event.payload["transaction_ids"] == [sale.pk]
+
+    with pytest.raises(PurchaseError):
+        buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 100)
+    assert OutboxEvent.objects.count() == 1
+
+    out = StringIO()
+    call_command("run_outbox_worker", "--once", stdout=out)
+    assert "Processed 1 outbox events" in out.getvalue()
+    assert not OutboxEvent.objects.exists()
+    assert "low on Ice Cream: 4 left" in caplog.text
+
+
+@pytest.mark.django_db
+def test_outbox_worker_retries_failed_events_with_backoff(settings) -> None:
+    # Ensure a failing handler only rolls back its own event, which is
+    # retried later and given up on after OUTBOX_MAX_ATTEMPTS
+    settings.OUTBOX_MAX_ATTEMPTS = 2
+    calls: list[dict] = []
+
+    @handler("test.flaky")
+    def flaky(payload: dict) -> None:
+        calls.append(payload)
+        FoodItem.objects.create(name=f"Item {payload['n']}", price=1)
+        if payload["n"] == 1:
+            raise ValueError("boom")
+
+    try:
+        OutboxEvent.objects.create(topic="test.flaky", payload={"n": 1})
+        OutboxEvent.objects.create(topic="test.flaky", payload={"n": 2})
+        OutboxEvent.objects.create(topic="test.unknown")
+        assert process_batch() == 3
+        assert list(FoodItem.objects.values_list("name", flat=True)) == ["Item 2"]
+
+        failed = OutboxEvent.objects.get(payload__n=1)
+        assert failed.attempts == 1
+        assert failed.last_error == "ValueError: boom"
+        assert failed.available_at > timezone.now()
+        assert (
+            OutboxEvent.objects.get(topic="test.unknown").last_error
+            == "LookupError: No handler for topic 'test.unknown'"
+        )
+
+        # Not due yet
+        assert process_batch() == 0
+        OutboxEvent.objects.update(available_at=timezone.now())
+        assert process_batch() == 2
+        failed.refresh_from_db()
+        assert failed.attempts == 2
+        assert failed.failed_at is not None
+        assert process_batch() == 0
+        assert len(calls) == 3
+    finally:
+        HANDLERS.pop("test.flaky")
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="SKIP LOCKED needs a server database",
+)
+@pytest.mark.django_db(transaction=True)
+def test_outbox_workers_never_handle_an_event_twice() -> None:
+    # Drain the outbox with parallel workers and make sure every event is
+    # handled exactly once
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic="test.count", payload={"n": n}) for n in range(500)]
+    )
+    seen: list[int] = []
+
+    @handler("test.count")
+    def count(payload: dict) -> None:
+        seen.append(payload["n"])
+        time.sleep(0.001)
+
+    def work(_: int) -> int:
+        try:
+            total = 0
+            while claimed := process_batch(20):
+                total += claimed
+            return total
+        finally:
+            connection.close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            assert sum(executor.map(work, range(5))) == 500
+    finally:
+        HANDLERS.pop("test.count")
+    assert sorted(seen) == list(range(500))
+    assert not OutboxEvent.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("backend", ["local", "cache"])
+def test_rate_limits_purchases_per_client(
+    api_client: APIClient, settings, django_assert_num_queries, backend: str
+) -> None:
+    # Ensure a client over their token bucket gets a 429 without touching
+    # the database, whichever customer they buy for, while other clients can
+    # still buy
+    settings.RATE_LIMIT_BACKEND = backend
+    settings.RATE_LIMITS = {"buy_food": [("client", 0.5, 2)]}
+    food_item = FoodItem.objects.create(name="Ice Cream", price=1)
+    john = create_customer()
+    jane = create_customer("jane")
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    ice_cream_truck.food_items.add(food_item, through_defaults={"stock": 10})
+    url = reverse("buy_food")
+
+    def buy(customer: Customer, **extra):
+        data = {
+            "food_item_id": food_item.pk,
+            "customer_id": customer.pk,
+            "ice_cream_truck_id": ice_cream_truck.pk,
+            "quantity": 1,
+        }
+        return api_client.post(url, data, format="json", **extra)
+
+    assert buy(john).status_code == 200
+    assert buy(jane).status_code == 200
+    with django_assert_num_queries(0):
+        response = buy(john)
+    assert response.status_code == 429
+    assert response.json()["message"] == "Too many requests"
+    assert response["Retry-After"] == "2"
+    assert buy(jane).status_code == 429
+    assert buy(john, REMOTE_ADDR="10.0.0.2").status_code == 200
+    token = Token.objects.create(user=jane.user)
+    assert buy(jane, HTTP_AUTHORIZATION=f"Token {token.key}").status_code == 200
+    assert truck_stock(ice_cream_truck, food_item) == 6
+
+
+@pytest.mark.parametrize("backend", ["local", "cache"])
+def test_rate_limit_rejections_take_no_tokens(settings, backend: str) -> None:
+    # Ensure a request turned away by one bucket leaves the others as they
+    # were, on both the sync and the async path
+    settings.RATE_LIMIT_BACKEND = backend
+    settings.RATE_LIMITS = {
+        "buy_food": [("endpoint", 0.001, 3), ("client", 0.001, 1)],
+    }
+    requests = [
+        RequestFactory().post(reverse("buy_food"), REMOTE_ADDR=f"10.0.0.{i}")
+        for i in range(4)
+    ]
+    match = route(requests[0])
+    assert check_limits(requests[0], match) == 0
+    for _ in range(5):
+        assert check_limits(requests[0], match) > 0
+        assert async_to_sync(acheck_limits)(requests[0], match) > 0
+    # Only the first request took a token from the endpoint's bucket
+    assert check_limits(requests[1], match) == 0
+    assert async_to_sync(acheck_limits)(requests[2], match) == 0
+    assert check_limits(requests[3], match) > 0
+
+
+@pytest.mark.django_db
+def test_rate_limits_use_the_async_cache_api(settings) -> None:
+    # Ensure the async middleware path doesn't block the event loop on the
+    # shared cache
+    settings.RATE_LIMIT_BACKEND = "cache"
+    settings.RATE_LIMITS = {"async_buy_food": [("client", 0.5, 1)]}
+    async_client = AsyncClient()
+    with patch.object(
+        cache, "aget_many", wraps=cache.aget_many
+    ) as aget_many, patch.object(cache, "aset", wraps=cache.aset) as aset:
+        async_to_sync(async_client.post)(
+            reverse("async_buy_food"), [], content_type="application/json"
+        )
+        response = async_to_sync(async_client.post)(
+            reverse("async_buy_food"), [], content_type="application/json"
+        )
+    assert aget_many.call_count == 2
+    assert aset.call_count == 1
+    assert response.status_code == 429
+
+
+def test_local_rate_limit_buckets_are_bounded(settings) -> None:
+    # Ensure the least recently used buckets are dropped past the bound
+    settings.RATE_LIMIT_MAX_KEYS = 2
+    for key in ["a", "b", "a", "c"]:
+        local_buckets.take([(key, 1, 5)])
+    assert list(local_buckets.buckets) == ["a", "c"]
+    assert local_buckets.buckets["a"][0] == pytest.approx(3, abs=0.01)
+
+
+@pytest.mark.django_db
+def test_concurrency_cap_answers_busy(api_client: APIClient, settings) -> None:
+    # Ensure requests past MAX_CONCURRENT_REQUESTS are turned away at once,
+    # except for /metrics
+    settings.MAX_CONCURRENT_REQUESTS = 1
+    assert gate.enter()
+    try:
+        response = api_client.get(reverse("fooditem-list"))
+        assert response.status_code == 503
+        assert response["Retry-After"] == "1"
+        assert api_client.get(reverse("metrics")).status_code == 200
+    finally:
+        gate.leave()
+    assert api_client.get(reverse("fooditem-list")).status_code == 200
+    assert gate.active == 0
+
+
+@pytest.mark.django_db
+def test_fast_list_paths_match_the_serializers(api_client: APIClient) -> None:
+    # Ensure the values()-based fast paths return exactly the bytes the
+    # serializers and JSONRenderer would
+    customer = create_customer()
+    ice_cream_truck = IceCreamTruck.objects.create(name="Krispy Kream")
+    for i, name in enumerate(["Ice Cream", "Snack Bar", "Crème brûlée\u2028"]):
+        food_item = FoodItem.objects.create(name=name, price=Decimal("1.5") * (i + 1))
+        for flavor in ["Vanilla", "Chocolate"][i % 2 :]:
+            Flavor.objects.create(name=flavor, food_item=food_item)
+        ice_cream_truck.food_items.add(food_item, through_defaults={"stock": i})
+        if i:
+            buy_food(food_item.pk, customer.pk, ice_cream_truck.pk, 1)
+    render = JSONRenderer().render
+
+    response = api_client.get(reverse("fooditem-list"))
+    assert response.content == render(
+        {
+            "next": None,
+            "results": FoodItemSerializer(
+                FoodItemViewSet.queryset.order_by("id"), many=True
+            ).data,
+        }
+    )
+
+    url = reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    response = api_client.get(url)
+    assert response.content == render(
+        IceCreamTruckSerializer(
+            IceCreamTruckInventoryView.queryset.get(pk=ice_cream_truck.pk)
+        ).data
+    )
+    assert api_client.get(reverse("ice_cream_truck_inventory", args=[0])).json() == {
+        "detail": "No IceCreamTruck matches the given query."
+    }
+
+    url = reverse("customer_transactions", args=[customer.pk])
+    response = api_client.get(url)
+    assert response.content == render(
+        {
+            "next": None,
+            "results": TransactionSerializer(
+                Transaction.objects.order_by("-date", "-id"), many=True
+            ).data,
+        }
+    )
+
+
+@pytest.mark.parametrize("fast_json", [True, False])
+def test_fast_json_renderer_matches_json_renderer(settings, fast_json: bool) -> None:
+    # Ensure the orjson path writes the same bytes as JSONRenderer, falling
+    # back to it for what orjson would write differently
+    settings.FAST_JSON = fast_json
+    data = {
+        "text": 'ünïcode \u2028 \u2029 "quoted"',
+        "price": Decimal("2.50"),
+        "date": timezone.now(),
+        "items": [1, None, True, {"nested": []}],
+        1: "non-string key",
+        "big": 2**70,
+    }
+    for value in [data, {"text": data["text"], "items": data["items"]}, [], None]:
+        assert FastJSONRenderer().render(value) == JSONRenderer().render(value)
+
+
+def test_fast_json_renderer_uses_orjson(settings) -> None:
+    # Ensure responses are actually written by orjson when it is installed,
+    # rather than always falling back to JSONRenderer
+    orjson = pytest.importorskip("orjson")
+    settings.FAST_JSON = True
+    data = {"name": "Ice Cream", "price": Decimal("2.50"), "flavors": ["Mint"]}
+    with patch("ice_cream_truck.renderers.orjson.dumps", wraps=orjson.dumps) as dumps:
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+    dumps.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_openapi_schema_is_served_from_the_built_artifact(
+    api_client: APIClient, settings, tmp_path
+) -> None:
+    # Ensure the schema endpoints serve build_openapi's files from memory
+    # without introspecting the API, with caching headers
+    call_command("build_openapi", "--output-dir", str(tmp_path), stdout=StringIO())
+    settings.OPENAPI_DIR = tmp_path
+    load_artifact.cache_clear()
+    try:
+        with patch.object(
+            OpenAPISchemaGenerator, "get_schema", side_effect=AssertionError
+        ):
+            response = api_client.get("/swagger.json")
+            assert response.status_code == 200
+            assert response.content == (tmp_path / "openapi-v1.json").read_bytes()
+            assert response["Content-Type"] == "application/json; charset=utf-8"
+            assert response["Cache-Control"] == "public, max-age=3600"
+            assert "/buy_food/" in response.json()["paths"]
+
+            etag = response["ETag"]
+            response = api_client.get("/swagger.json", HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304
+
+            response = api_client.get("/swagger.yaml")
+            assert response.content == (tmp_path / "openapi-v1.yaml").read_bytes()
+            response = api_client.get("/swagger/", {"format": "openapi"})
+            assert response["ETag"] == etag
+        # The doc pages only describe an empty API and fetch the schema
+        assert api_client.get("/redoc/").status_code == 200
+
+        # Generated per request only when asked for
+        settings.OPENAPI_RUNTIME = True
+        response = api_client.get("/swagger.json")
+        assert response.status_code == 200
+        assert "ETag" not in response
+    finally:
+        load_artifact.cache_clear()
+
+
+@pytest.mark.django_db
+def test_openapi_schema_describes_history_and_restock(caplog) -> None:
+    # Ensure schema generation, which has no request, doesn't trip over the
+    # history views' filters and describes the restock body
+    schema = json.loads(build_schema()["json"])
+    assert "/customers/{id}/transactions/" in schema["paths"]
+    assert "TransactionHistoryView" not in caplog.text
+    assert "IceCreamTruckRestockView" not in caplog.text
+    body = schema["paths"]["/trucks/{id}/restock/"]["post"]["parameters"][0]
+    assert body["schema"] == {"$ref": "#/definitions/Restock"}
+
+
+def test_openapi_schema_without_the_built_artifact(
+    api_client: APIClient, settings, tmp_path, caplog
+) -> None:
+    # Ensure a missing artifact is only generated on demand in DEBUG, and is
+    # otherwise reported instead of silently introspecting the API
+    settings.OPENAPI_DIR = tmp_path
+    load_artifact.cache_clear()
+    try:
+        with pytest.raises(ImproperlyConfigured):
+            api_client.get("/swagger.json")
+        assert "run build_openapi" in caplog.text
+
+        settings.DEBUG = True
+        response = api_client.get("/swagger.json")
+        assert response.status_code == 200
+        assert "/buy_food/" in response.json()["paths"]
+    finally:
+        load_artifact.cache_clear()
+
+
+@pytest.mark.django_db
+def test_add_default_data_stocks_the_truck(api_client: APIClient, superuser) -> None:
+    # Ensure the default truck gets stock rows for the default food items
+    api_client.force_authenticate(user=superuser)
+    response = api_client.post(reverse("add_default_data"))
+    assert response.status_code == 200
+    ice_cream_truck = IceCreamTruck.objects.get(name="Krispy Kream")
+    response = api_client.get(
+        reverse("ice_cream_truck_inventory", args=[ice_cream_truck.pk])
+    )
+    assert [(item["name"], item["stock"]) for item in response.data["food_items"]] == [
+        ("Ice Cream", 10),
+        ("Shaved Ice", 5),
+        ("Snack Bar", 15),
+    ]
+
+
+@pytest.mark.django_db
+def test_seed_load_data_is_deterministic() -> None:
+    # Ensure the same seed and volumes produce the same rows (relative to
+    # the IDs they start from), whatever the batch size
+    def seed(batch_size: int) -> list[tuple]:
+        bases = id_bases()
+        call_command(
+            "seed_load_data",
+            "--seed=3",
+            "--trucks=3",
+            "--food-items=20",
+            "--items-per-truck=5",
+            "--customers=30",
+            "--transactions=500",
+            "--end-date=2024-06-01",
+            f"--batch-size={batch_size}",
+            stdout=StringIO(),
+        )
+        return [
+            (
+                food_item - bases["food_item_base"],
+                customer - bases["customer_base"],
+                ice_cream_truck - bases["truck_base"],
+                *rest,
+            )
+            for food_item, customer, ice_cream_truck, *rest in Transaction.objects.filter(
+                pk__gt=bases["transaction_base"]
+            )
+            .order_by("pk")
+            .values_list(
+                "food_item_id",
+                "customer_id",
+                "ice_cream_truck_id",
+                "customer__balance",
+                "quantity",
+                "total",
+                "date",
+            )
+        ]
+
+    first_run = seed(1000)
+    assert len(first_run) == 500
+    assert first_run == seed(7)
+    assert Customer.objects.count() == 60
+    assert TruckStock.objects.count() == 30
+    dates = [row[-1] for row in first_run]
+    assert max(dates) < datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+    assert min(dates) >= datetime(2024, 3, 3, tzinfo=dt_timezone.utc)
+    # Sales made after seeding are still dated when they happen
+    assert Transaction._meta.get_field("date").auto_now_add
+    # The revenue rollups cover the seeded sales
+    revenue = Transaction.objects.aggregate(total=Sum("total"))["total"]
+    assert IceCreamTruck.objects.annotate(total_revenue=truck_revenue()).aggregate(
+        total=Sum("total_revenue")
+    )["total"] == (revenue)
+    with pytest.raises(CommandError):
+        call_command("seed_load_data", "--transactions=5", "--customers=0")
+
+
+@pytest.mark.django_db
+def test_token_authentication(api_client: APIClient, superuser) -> None:
+    # Ensure admins can use the ops endpoints with a token instead of a session
+    url = reverse("transaction_export")
+    assert api_client.get(url).status_code in (401, 403)
+    token = Token.objects.create(user=superuser)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    assert api_client.get(url).status_code == 200
+
+
+def test_lean_profile_leaves_out_docs_admin_and_sessions() -> None:
+    # Settings and URLs are loaded once per process, so check the lean
+    # profile in a fresh one
+    script = """
+import json, sys
+import django
+django.setup()
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+def routed(path):
+    try:
+        resolve(path)
+    except Resolver404:
+        return False
+    return True
+
+print(json.dumps({
+    "routes": [routed(path) for path in ("/api/food_items/", "/admin/", "/swagger.json", "/redoc/")],
+    "drf_yasg": any(name.startswith("drf_yasg") for name in sys.modules),
+    "apps": settings.INSTALLED_APPS,
+    "middleware": settings.MIDDLEWARE,
+    "authentication": settings.REST_FRAMEWORK["DEFAULT_AUTHENTICATION_CLASSES"],
+}))
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).resolve().parent.parent,
+        env={**os.environ, "API_PROFILE": "lean"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    lean = json.loads(output)
+    assert lean["routes"] == [True, False, False, False]
+    assert not lean["drf_yasg"]
+    assert not set(lean["apps"]) & {"django.contrib.admin", "drf_yasg"}
+    assert "django.contrib.sessions.middleware.SessionMiddleware" not in (
+        lean["middleware"]
+    )
+    assert "django.middleware.csrf.CsrfViewMiddleware" not in lean["middleware"]
+    assert lean["authentication"] == [
+        "rest_framework.authentication.TokenAuthentication"
+    ]
+
+
+@pytest.mark.django_db
+def test_nearby_trucks_matches_a_full_scan() -> None:
+    # Ensure the grid cell and bounding box prefilters drop no truck within
+    # the radius, across the antimeridian and around a pole too
+    rng = random.Random(25)
+    centers = [(51.5, -0.12), (-33.9, 151.2), (0.0, 179.99), (89.9, 40.0)]
+    for latitude, longitude in centers:
+        for _ in range(150):
+            IceCreamTruck.objects.create(
+                name="Truck",
+                latitude=max(-90, min(90, latitude + rng.uniform(-1, 1))),
+                longitude=(longitude + rng.uniform(-1, 1) + 180) % 360 - 180,
+            )
+    trucks = list(IceCreamTruck.objects.values_list("id", "latitude", "longitude"))
+    for latitude, longitude in centers:
+        for radius_km in (1, 10, 50):
+            expected = {
+                pk
+                for pk, other_latitude, other_longitude in trucks
+                if distance_km(latitude, longitude, other_latitude, other_longitude)
+                <= radius_km
+            }
+            found = nearby_trucks(latitude, longitude, radius_km, limit=1000)
+            assert {row["id"] for row in found} == expected
+            distances = [row["distance_km"] for row in found]
+            assert distances == sorted(distances)
+
+
+@pytest.mark.django_db
+def test_nearby_trucks_view_filters_by_stock(
+    api_client: APIClient, django_assert_num_queries
+) -> None:
+    # Ensure only trucks with a matching item in stock are listed, nearest
+    # first, in one query
+    mint = FoodItem.objects.create(name="Mint Cone", price=2.5)
+    Flavor.objects.create(name="Mint", food_item=mint)
+    vanilla = FoodItem.objects.create(name="Vanilla Cone", price=2.0)
+    near = IceCreamTruck.objects.create(name="Near", latitude=51.501, longitude=-0.12)
+    sold_out = IceCreamTruck.objects.create(
+        name="Sold out", latitude=51.5, longitude=-0.12
+    )
+    far = IceCreamTruck.objects.create(name="Far", latitude=51.8, longitude=-0.12)
+    IceCreamTruck.objects.create(name="Nowhere")
+    near.food_items.add(mint, vanilla, through_defaults={"stock": 3})
+    sold_out.food_items.add(mint, through_defaults={"stock": 0})
+    sold_out.food_items.add(vanilla, through_defaults={"stock": 3})
+    far.food_items.add(mint, through_defaults={"stock": 3})
+
+    url = reverse("nearby_trucks")
+    here = {"lat": 51.5, "lon": -0.12}
+    with django_assert_num_queries(1):
+        response = api_client.get(url, {**here, "flavor": "mint"})
+    assert response.status_code == 200
+    assert [row["name"] for row in response.data["results"]] == ["Near"]
+    assert response.data["results"][0]["distance_km"] == pytest.approx(0.111, abs=1e-3)
+
+    response = api_client.get(url, {**here, "food_item": vanilla.pk})
+    assert [row["name"] for row in response.data["results"]] == ["Sold out", "Near"]
+    response = api_client.get(url, {**here, "radius": 50, "limit": 2})
+    assert [row["name"] for row in response.data["results"]] == ["Sold out", "Near"]
+    response = api_client.get(url, {**here, "radius": 50, "flavor": "Mint"})
+    assert [row["name"] for row in response.data["results"]] == ["Near", "Far"]
+
+    # Moving a truck moves it to another grid cell
+    far.latitude = 51.51
+    far.save(update_fields=["latitude"])
+    response = api_client.get(url, {**here, "flavor": "Mint"})
+    assert [row["name"] for row in response.data["results"]] == ["Near", "Far"]
+
+    for params in [
+        {"lat": 51.5},
+        {**here, "radius": 500},
+        {**here, "radius": 0},
+        {"lat": 91, "lon": 0},
+        {**here, "limit": "many"},
+    ]:
+        response = api_client.get(url, params)
+        assert response.status_code == 400
+
+
+# Budgets for every route in ice_cream_truck/urls.py: the most SQL
+# statements a request may run and the wall time (ms) it may take, on the
+# budget_data set with a cold cache. Tests count the savepoint pair around
+# atomic blocks; scale the times with BUDGET_TIME_SCALE.
+ROUTE_BUDGETS: dict[str, tuple[int, float]] = {
+    "api-root": (0, 50),
+    "fooditem-list": (2, 50),
+    "fooditem-detail": (2, 50),
+    "add_default_data": (10, 100),
+    "ice_cream_truck_inventory": (3, 50),
+    "ice_cream_truck_revenue": (1, 50),
+    "ice_cream_truck_revenue_detail": (2, 50),
+    "sales_analytics": (2, 200),
+    "buy_food": (10, 100),
+    "checkout": (10, 100),
+    "customer_transactions": (1, 50),
+    "ice_cream_truck_transactions": (1, 50),
+    "nearby_trucks": (1, 100),
+    "ice_cream_truck_restock": (6, 250),
+    "transaction_export": (1, 250),
+    "async_ice_cream_truck_inventory": (3, 100),
+    "async_ice_cream_truck_revenue": (1, 50),
+    "async_ice_cream_truck_revenue_detail": (2, 100),
+    "async_buy_food": (10, 100),
+}
+
+
+def budget_request(name: str, ids: dict[str, int]) -> tuple[str, str, dict]:
+    # (method, URL, query parameters or JSON body) for one route
+    ice_cream_truck: int = ids["ice_cream_truck"]
+    purchase = {
+        "food_item_id": ids["food_item"],
+        "customer_id": ids["customer"],
+        "ice_cream_truck_id": ice_cream_truck,
+        "quantity": 1,
+    }
+    requests: dict[str, tuple[str, list, dict]] = {
+        "api-root": ("get", [], {}),
+        "fooditem-list": ("get", [], {}),
+        "fooditem-detail": ("get", [ids["food_item"]], {}),
+        "add_default_data": ("post", [], {}),
+        "ice_cream_truck_inventory": ("get", [ice_cream_truck], {}),
+        "ice_cream_truck_revenue": ("get", [], {}),
+        "ice_cream_truck_revenue_detail": ("get", [ice_cream_truck], {"period": "day"}),
+        "sales_analytics": ("get", [], {"period": "week", "group_by": "truck"}),
+        "buy_food": ("post", [], purchase),
+        "checkout": (
+            "post",
+            [],
+            {
+                "customer_id": ids["customer"],
+                "ice_cream_truck_id": ice_cream_truck,
+                "items": [
+                    {"food_item_id": ids["food_item"], "quantity": 1},
+                    {"food_item_id": ids["other_food_item"], "quantity": 2},
+                ],
+            },
+        ),
+        "customer_transactions": ("get", [ids["customer"]], {}),
+        "ice_cream_truck_transactions": ("get", [ice_cream_truck], {}),
+        "nearby_trucks": (
+            "get",
+            [],
+            {"lat": 51.5, "lon": -0.5, "radius": 50, "flavor": "mint"},
+        ),
+        "ice_cream_truck_restock": (
+            "post",
+            [ice_cream_truck],
+            {
+                "items": [
+                    {"name": f"Restock {i}", "price": "1.00", "stock": 5}
+                    for i in range(50)
+                ]
+            },
+        ),
+        "transaction_export": ("get", [], {}),
+        "async_ice_cream_truck_inventory": ("get", [ice_cream_truck], {}),
+        "async_ice_cream_truck_revenue": ("get", [], {}),
+        "async_ice_cream_truck_revenue_detail": (
+            "get",
+            [ice_cream_truck],
+            {"period": "day"},
+        ),
+        "async_buy_food": ("post", [], purchase),
+    }
+    method, args, data = requests[name]
+    return method, reverse(name, args=args), data
+
+
+def route_names(patterns: list) -> set[str]:
+    names: set[str] = set()
+    for pattern in patterns:
+        if hasattr(pattern, "url_patterns"):
+            names |= route_names(pattern.url_patterns)
+        else:
+            names.add(pattern.name)
+    return names
+
+
+def test_every_route_has_a_budget() -> None:
+    # A new route needs a budget (and a request in budget_request)
+    assert route_names(get_resolver("ice_cream_truck.urls").url_patterns) == set(
+        ROUTE_BUDGETS
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("name", ROUTE_BUDGETS)
+def test_route_stays_within_budget(
+    name: str, api_client: APIClient, superuser, budget_data, within_budget
+) -> None:
+    # Ensure no route grows extra queries (an N+1, another lookup) or slows
+    # down unnoticed. Requests are made as an admin, which the ops routes
+    # need and costs no queries.
+    queries, milliseconds = ROUTE_BUDGETS[name]
+    method, url, data = budget_request(name, budget_data)
+    api_client.force_authenticate(user=superuser)
+    async_client = AsyncClient()
+
+    def send():
+        if name.startswith("async_"):
+            if method == "get":
+                return async_to_sync(async_client.get)(url, data)
+            return async_to_sync(async_client.post)(
+                url, data, content_type="application/json"
+            )
+        if method == "get":
+            return api_client.get(url, data)
+        return api_client.post(url, data, format="json")
+
+    # Default data can only be added once
+    once: bool = name == "add_default_data"
+    response = within_budget(
+        queries, milliseconds, send, repeat=1 if once else 3, warm_up=not once
+    )
+    assert response.status_code == 200
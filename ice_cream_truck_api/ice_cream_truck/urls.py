@@ -1,9 +1,22 @@
 from django.urls import include, path
+from django.views.decorators.csrf import csrf_exempt
+
+from .async_views import (
+    AsyncBuyFoodView,
+    AsyncIceCreamTruckInventoryView,
+    AsyncIceCreamTruckRevenueView,
+)
 from .views import (
     FoodItemViewSet,
     IceCreamTruckInventoryView,
+    IceCreamTruckRestockView,
     IceCreamTruckRevenueView,
+    NearbyTrucksView,
+    SalesAnalyticsView,
     BuyFoodView,
+    CheckoutView,
+    TransactionExportView,
+    TransactionHistoryView,
     AddDefaultDataView,
 )
 from rest_framework.routers import DefaultRouter
@@ -22,5 +35,54 @@ urlpatterns: list = [
     path(
         "revenue/", IceCreamTruckRevenueView.as_view(), name="ice_cream_truck_revenue"
     ),
+    path(
+        "revenue/<int:pk>/",
+        IceCreamTruckRevenueView.as_view(),
+        name="ice_cream_truck_revenue_detail",
+    ),
+    path("analytics/sales/", SalesAnalyticsView.as_view(), name="sales_analytics"),
     path("buy_food/", BuyFoodView.as_view(), name="buy_food"),
+    path("checkout/", CheckoutView.as_view(), name="checkout"),
+    path(
+        "customers/<int:pk>/transactions/",
+        TransactionHistoryView.as_view(owner_field="customer"),
+        name="customer_transactions",
+    ),
+    path("trucks/nearby/", NearbyTrucksView.as_view(), name="nearby_trucks"),
+    path(
+        "trucks/<int:pk>/transactions/",
+        TransactionHistoryView.as_view(owner_field="ice_cream_truck"),
+        name="ice_cream_truck_transactions",
+    ),
+    path(
+        "trucks/<int:pk>/restock/",
+        IceCreamTruckRestockView.as_view(),
+        name="ice_cream_truck_restock",
+    ),
+    path(
+        "transactions/export/",
+        TransactionExportView.as_view(),
+        name="transaction_export",
+    ),
+    # Native async variants for ASGI deployments
+    path(
+        "async/inventory/<int:pk>/",
+        AsyncIceCreamTruckInventoryView.as_view(),
+        name="async_ice_cream_truck_inventory",
+    ),
+    path(
+        "async/revenue/",
+        AsyncIceCreamTruckRevenueView.as_view(),
+        name="async_ice_cream_truck_revenue",
+    ),
+    path(
+        "async/revenue/<int:pk>/",
+        AsyncIceCreamTruckRevenueView.as_view(),
+        name="async_ice_cream_truck_revenue_detail",
+    ),
+    path(
+        "async/buy_food/",
+        csrf_exempt(AsyncBuyFoodView.as_view()),
+        name="async_buy_food",
+    ),
 ]
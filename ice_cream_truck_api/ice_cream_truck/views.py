@@ -1,18 +1,78 @@
-from typing import Any
-
+from datetime import datetime, time
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.db.models import Prefetch
 from django.db.models.query import QuerySet
-from django.db.models import Sum, F
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from rest_framework import generics, status, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from .models import FoodItem, IceCreamTruck, Customer, Transaction, Flavor
-from .serializers import FoodItemSerializer, IceCreamTruckSerializer
+from .analytics import GROUPS, PERIODS, sales_analytics
+from .catalog_cache import CatalogCacheMixin, bump_catalog_version
+from .catalog_import import import_catalog
+from .exports import CONTENT_TYPES, RENDERERS, export_rows, stream_async
+from .fast_serializers import (
+    food_item_rows,
+    food_item_values,
+    inventory,
+    transaction_rows,
+    transaction_values,
+)
+from .idempotency import idempotent
+from .models import (
+    FoodItem,
+    IceCreamTruck,
+    Flavor,
+    RevenueRollup,
+    Transaction,
+    TruckStock,
+)
+from .nearby import (
+    DEFAULT_NEARBY_LIMIT,
+    DEFAULT_RADIUS_KM,
+    MAX_NEARBY_LIMIT,
+    nearby_trucks,
+)
+from .pagination import FoodItemPagination, TransactionHistoryPagination
+from .parsers import CSVParser
+from .purchases import PurchaseError, buy_food, checkout
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .routers import ReplicaReadMixin, read_from_replica
+from .rollups import revenue_buckets, truck_revenue, window_revenue
+from .serializers import (
+    CheckoutSerializer,
+    FoodItemSerializer,
+    IceCreamTruckSerializer,
+    RestockSerializer,
+    TransactionSerializer,
+)
+from .stock import total_stock
 
 User = get_user_model()
 
+# FastJSONRenderer in place of JSONRenderer, next to the other configured
+# renderers (the browsable API, outside the lean profile)
+FAST_RENDERERS: list = [FastJSONRenderer] + [
+    renderer
+    for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    if not issubclass(renderer, JSONRenderer)
+]
+
 
 class AddDefaultDataView(APIView):
     def post(self, request) -> Response:
@@ -57,12 +117,25 @@ class AddDefaultDataView(APIView):
     def create_food_items(self, ice_cream_truck: IceCreamTruck) -> None:
         # Create food items
         food_items: list[FoodItem] = [
-            FoodItem(name="Ice Cream", price=3.99, ice_cream_truck=ice_cream_truck),
-            FoodItem(name="Shaved Ice", price=2.99, ice_cream_truck=ice_cream_truck),
-            FoodItem(name="Snack Bar", price=1.99, ice_cream_truck=ice_cream_truck),
+            FoodItem(name="Ice Cream", price=3.99),
+            FoodItem(name="Shaved Ice", price=2.99),
+            FoodItem(name="Snack Bar", price=1.99),
         ]
         FoodItem.objects.bulk_create(food_items)
 
+        # Stock the truck with them
+        stock: dict[str, int] = {"Ice Cream": 10, "Shaved Ice": 5, "Snack Bar": 15}
+        TruckStock.objects.bulk_create(
+            [
+                TruckStock(
+                    ice_cream_truck=ice_cream_truck,
+                    food_item=food_item,
+                    stock=stock[food_item.name],
+                )
+                for food_item in FoodItem.objects.filter(name__in=stock)
+            ]
+        )
+
         # Create flavorss
         self.create_flavors()
 
@@ -94,91 +167,367 @@ class AddDefaultDataView(APIView):
 
         Flavor.objects.bulk_create(flavors)
 
+        # bulk_create doesn't send post_save
+        bump_catalog_version()
+
 
 class FoodItemDetailView(generics.RetrieveAPIView):
-    queryset: QuerySet[FoodItem] = FoodItem.objects.all()
+    queryset: QuerySet[FoodItem] = FoodItem.objects.prefetch_related("flavors")
     serializer_class: type[FoodItemSerializer] = FoodItemSerializer
 
 
-class FoodItemViewSet(viewsets.ModelViewSet):
-    queryset: QuerySet[FoodItem] = FoodItem.objects.all()
+class FoodItemViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
+    # Flavors in id order, as the list's fast path returns them
+    queryset: QuerySet[FoodItem] = FoodItem.objects.prefetch_related(
+        Prefetch("flavors", queryset=Flavor.objects.order_by("id"))
+    )
     serializer_class: type[FoodItemSerializer] = FoodItemSerializer
+    pagination_class: type[FoodItemPagination] = FoodItemPagination
+    renderer_classes: list = FAST_RENDERERS
+
+    def get_sticky_keys(self, kwargs: dict) -> list[str]:
+        return ["catalog"]
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.list_rows, request, *args, **kwargs)
+
+    def list_rows(self, request, *args, **kwargs) -> Response:
+        # Read-only fast path: values() rows instead of a serializer per item
+        page: list[dict] = self.paginate_queryset(food_item_values())
+        return self.get_paginated_response(food_item_rows(page))
+
+
+class IceCreamTruckInventoryView(ReplicaReadMixin, generics.RetrieveAPIView):
+    # Three queries however big the menu is: the truck, its stock rows joined
+    # to their food items (one range scan of the unique_truck_stock index)
+    # and the flavors
+    queryset: QuerySet[IceCreamTruck] = IceCreamTruck.objects.prefetch_related(
+        Prefetch(
+            "stock_rows",
+            queryset=TruckStock.objects.select_related("food_item")
+            .annotate(total_stock=total_stock())
+            .order_by("food_item__name")
+            .prefetch_related(
+                Prefetch("food_item__flavors", queryset=Flavor.objects.order_by("name"))
+            ),
+        )
+    )
+    serializer_class: type[IceCreamTruckSerializer] = IceCreamTruckSerializer
+    renderer_classes: list = FAST_RENDERERS
 
-
-class IceCreamTruckInventoryView(generics.RetrieveAPIView):
-    queryset = IceCreamTruck.objects.all()
-    serializer_class = IceCreamTruckSerializer
+    def get_sticky_keys(self, kwargs: dict) -> list[str]:
+        return [f"ice_cream_truck:{kwargs['pk']}"]
 
     def get(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        # Read-only fast path with the same queries and output as the
+        # queryset and serializer above
+        ice_cream_truck: dict = get_object_or_404(
+            IceCreamTruck.objects.values("id", "name"), pk=kwargs["pk"]
+        )
+        return Response(inventory(ice_cream_truck))
+
+
+class IceCreamTruckRestockView(generics.GenericAPIView):
+    # Applies a batch of catalog rows (name, price, flavors, stock) to one
+    # truck in a single transaction; see catalog_import.import_catalog
+    permission_classes: list = [IsAdminUser]
+    parser_classes: list = [JSONParser, CSVParser]
+    queryset: QuerySet[IceCreamTruck] = IceCreamTruck.objects.all()
+    serializer_class: type[RestockSerializer] = RestockSerializer
+
+    def post(self, request, *args, **kwargs) -> Response:
+        ice_cream_truck: IceCreamTruck = self.get_object()
+        rows: Any = request.data
+        if isinstance(rows, dict):
+            rows = rows.get("items")
+        if not isinstance(rows, list):
+            return Response(
+                {"message": "Expected a list of rows"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        applied, report = import_catalog(rows, ice_cream_truck.pk)
+        return Response(
+            report,
+            status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST,
+        )
 
 
-class IceCreamTruckRevenueView(generics.RetrieveAPIView):
-    def get(self, request, *args, **kwargs):
-        ice_cream_truck = IceCreamTruck.objects.first()
-        total_revenue = Transaction.objects.filter(
-            ice_cream_truck=ice_cream_truck
-        ).aggregate(total_revenue=Sum(F("total")))["total_revenue"]
-        total_revenue = total_revenue or 0
-        return Response({"total_revenue": total_revenue})
+class TransactionHistoryView(ReplicaReadMixin, generics.ListAPIView):
+    # Mounted once per owner, e.g. as_view(owner_field="customer")
+    owner_field: str = "customer"
+    queryset: QuerySet[Transaction] = Transaction.objects.all()
+    serializer_class: type[TransactionSerializer] = TransactionSerializer
+    pagination_class: type[TransactionHistoryPagination] = TransactionHistoryPagination
+    renderer_classes: list = FAST_RENDERERS
 
+    def get_sticky_keys(self, kwargs: dict) -> list[str]:
+        return [f"{self.owner_field}:{kwargs['pk']}"]
 
-class BuyFoodView(generics.CreateAPIView):
-    def post(self, request, *args, **kwargs):
-        food_item_id = request.data.get("food_item_id")
-        customer_id = request.data.get("customer_id")
-        ice_cream_truck_id = request.data.get("ice_cream_truck_id")
-        quantity = request.data.get("quantity")
+    def get_queryset(self) -> QuerySet[Transaction]:
+        if getattr(self, "swagger_fake_view", False):
+            # Schema generation, without a request or URL kwargs
+            return Transaction.objects.none()
+        try:
+            start = parse_window_bound(self.request.query_params.get("from"))
+            end = parse_window_bound(self.request.query_params.get("to"))
+        except ValueError:
+            raise ValidationError({"message": "Invalid time window"})
+        return (
+            super()
+            .get_queryset()
+            .filter(**{self.owner_field: self.kwargs["pk"]})
+            .in_window(start, end)
+        )
 
+    def list(self, request, *args, **kwargs) -> Response:
+        # Read-only fast path: values() rows instead of a serializer per row
+        page: list[dict] = self.paginate_queryset(
+            transaction_values(self.get_queryset())
+        )
+        return self.get_paginated_response(transaction_rows(page))
+
+
+class TransactionExportView(APIView):
+    # Streams every transaction in the from/to window as CSV (the default) or
+    # NDJSON, chosen with ?format= or Accept, in constant memory
+    permission_classes: list = [IsAdminUser]
+    renderer_classes: list = [CSVRenderer, NDJSONRenderer]
+
+    def get(self, request, *args, **kwargs) -> StreamingHttpResponse:
         try:
-            food_item = FoodItem.objects.get(id=food_item_id)
-            customer = Customer.objects.get(id=customer_id)
-            ice_cream_truck = IceCreamTruck.objects.get(id=ice_cream_truck_id)
-
-            if quantity > food_item.stock:
-                return Response(
-                    {"message": "SORRY!"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            start = parse_window_bound(request.query_params.get("from"))
+            end = parse_window_bound(request.query_params.get("to"))
+        except ValueError:
+            raise ValidationError({"message": "Invalid time window"})
+
+        export_format: str = request.accepted_renderer.format
+        # The rows are read after this view returns, so the database (a
+        # replica if there is one) is chosen now
+        with read_from_replica():
+            using: str = router.db_for_read(Transaction)
+        chunks = RENDERERS[export_format](export_rows(start, end, using))
+        if isinstance(request._request, ASGIRequest):
+            chunks = stream_async(chunks)
+        response = StreamingHttpResponse(
+            chunks, content_type=CONTENT_TYPES[export_format]
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="transactions.{export_format}"'
+        )
+        return response
+
+    def handle_exception(self, exc):
+        # Errors are JSON, whichever export format was asked for
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+
+class SalesAnalyticsView(ReplicaReadMixin, APIView):
+    # Revenue and units sold per hour, day or week, optionally per truck,
+    # food item or customer and limited to the top K best-sellers of each
+    # bucket. ?truck=, ?food_item= and ?customer= narrow the sales counted.
+    def get(self, request, *args, **kwargs) -> Response:
+        params = request.query_params
+        period: str = params.get("period", "day")
+        group_by: Optional[str] = params.get("group_by") or None
+        if period not in PERIODS:
+            raise ValidationError({"message": "Invalid period"})
+        if group_by is not None and group_by not in GROUPS:
+            raise ValidationError({"message": "Invalid group_by"})
+
+        top: Optional[int] = None
+        filters: dict[str, int] = {}
+        try:
+            start = parse_window_bound(params.get("from"))
+            end = parse_window_bound(params.get("to"))
+            if params.get("top"):
+                top = int(params["top"])
+                if top < 1:
+                    raise ValueError(top)
+            for name, (field, _) in GROUPS.items():
+                if params.get(name):
+                    filters[field] = int(params[name])
+        except ValueError:
+            raise ValidationError({"message": "Invalid analytics query"})
+
+        return Response(
+            {
+                "period": period,
+                "group_by": group_by,
+                "buckets": sales_analytics(period, group_by, top, start, end, filters),
+            }
+        )
+
 
-            total_price = food_item.price * quantity
-            if customer.balance < total_price:
-                return Response(
-                    {"message": "SORRY!"},
-                    status=status.HTTP_400_BAD_REQUEST,
+class NearbyTrucksView(ReplicaReadMixin, APIView):
+    # Trucks within ?radius= km (5 by default) of ?lat=&lon=, nearest first.
+    # ?food_item= (an ID) and ?flavor= (a name) keep the trucks that have
+    # such an item in stock; ?limit= caps the results.
+    def get(self, request, *args, **kwargs) -> Response:
+        params = request.query_params
+        food_item_id: Optional[int] = None
+        try:
+            latitude = float(params["lat"])
+            longitude = float(params["lon"])
+            radius_km = float(params.get("radius", DEFAULT_RADIUS_KM))
+            limit = int(params.get("limit", DEFAULT_NEARBY_LIMIT))
+            if params.get("food_item"):
+                food_item_id = int(params["food_item"])
+        except (KeyError, ValueError):
+            raise ValidationError({"message": "Invalid nearby query"})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({"message": "Invalid location"})
+        if not 0 < radius_km <= settings.NEARBY_MAX_RADIUS_KM:
+            raise ValidationError(
+                {
+                    "message": "radius must be between 0 and "
+                    f"{settings.NEARBY_MAX_RADIUS_KM} km"
+                }
+            )
+        if not 1 <= limit <= MAX_NEARBY_LIMIT:
+            raise ValidationError({"message": "Invalid limit"})
+
+        return Response(
+            {
+                "results": nearby_trucks(
+                    latitude,
+                    longitude,
+                    radius_km,
+                    limit,
+                    food_item_id,
+                    params.get("flavor") or None,
                 )
+            }
+        )
+
 
-            # Update stock and customer balance
-            food_item.stock -= quantity
-            food_item.save()
-            customer.balance -= total_price
-            customer.save()
-
-            # Create transaction
-            Transaction.objects.create(
-                food_item=food_item,
-                customer=customer,
-                ice_cream_truck=ice_cream_truck,
-                quantity=quantity,
-                total=total_price,
+class IceCreamTruckRevenueView(ReplicaReadMixin, generics.RetrieveAPIView):
+    queryset: QuerySet[IceCreamTruck] = IceCreamTruck.objects.annotate(
+        total_revenue=truck_revenue()
+    )
+
+    def get_sticky_keys(self, kwargs: dict) -> list[str]:
+        return [f"ice_cream_truck:{kwargs['pk']}"] if "pk" in kwargs else []
+
+    def get(self, request, *args, **kwargs):
+        # Without a pk this reports on the first truck, as it always has
+        if "pk" in kwargs:
+            ice_cream_truck = self.get_object()
+        else:
+            ice_cream_truck = self.get_queryset().first()
+            if ice_cream_truck is None:
+                return Response({"total_revenue": 0})
+
+        params = request.query_params
+        if not {"period", "from", "to"} & set(params):
+            return Response({"total_revenue": ice_cream_truck.total_revenue})
+
+        try:
+            start = parse_window_bound(params.get("from"))
+            end = parse_window_bound(params.get("to"))
+        except ValueError:
+            return Response(
+                {"message": "Invalid time window"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-            return Response({"message": "ENJOY!"}, status=status.HTTP_200_OK)
+        if "period" not in params:
+            return Response(
+                {"total_revenue": window_revenue(ice_cream_truck, start, end)}
+            )
 
-        except FoodItem.DoesNotExist:
+        period: str = params["period"]
+        if period not in dict(RevenueRollup.PERIOD_CHOICES):
             return Response(
-                {"message": "Invalid food item ID"}, status=status.HTTP_400_BAD_REQUEST
+                {"message": "Invalid period"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        except Customer.DoesNotExist:
+        buckets = revenue_buckets(ice_cream_truck, period, start, end)
+        return Response(
+            {
+                "total_revenue": sum(
+                    (bucket["revenue"] for bucket in buckets), Decimal("0.00")
+                ),
+                "buckets": buckets,
+            }
+        )
+
+
+def parse_window_bound(value: Optional[str]) -> Optional[datetime]:
+    # Accepts ISO 8601 dates or datetimes; naive values are in TIME_ZONE
+    if value is None:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        date = datetime.combine(day, time.min)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class BuyFoodView(generics.CreateAPIView):
+    @idempotent()
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
             return Response(
-                {"message": "Invalid customer ID"}, status=status.HTTP_400_BAD_REQUEST
+                {"message": "Expected an object"}, status=status.HTTP_400_BAD_REQUEST
             )
+        food_item_id = request.data.get("food_item_id")
+        customer_id = request.data.get("customer_id")
+        ice_cream_truck_id = request.data.get("ice_cream_truck_id")
+        quantity = parse_quantity(request.data.get("quantity"))
 
-        except IceCreamTruck.DoesNotExist:
+        if quantity is None:
             return Response(
-                {"message": "Invalid ice cream truck ID"},
+                {"message": "Invalid quantity"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            buy_food(food_item_id, customer_id, ice_cream_truck_id, quantity)
+        except PurchaseError as error:
+            return Response({"message": error.message}, status=error.status_code)
+
+        return Response({"message": "ENJOY!"}, status=status.HTTP_200_OK)
+
+
+class CheckoutView(generics.CreateAPIView):
+    serializer_class: type[CheckoutSerializer] = CheckoutSerializer
+
+    @idempotent()
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Invalid cart", "errors": serializer.errors},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+        cart: dict[str, Any] = serializer.validated_data
+        try:
+            transactions = checkout(
+                cart["customer_id"],
+                cart["ice_cream_truck_id"],
+                [(line["food_item_id"], line["quantity"]) for line in cart["items"]],
+            )
+        except PurchaseError as error:
+            return Response({"message": error.message}, status=error.status_code)
+
+        return Response(
+            {
+                "message": "ENJOY!",
+                "total": sum(transaction.total for transaction in transactions),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+def parse_quantity(value: Any) -> Optional[int]:
+    # Quantities arrive as ints from JSON bodies and as strings from forms
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity > 0 else None
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
+
+logger = logging.getLogger(__name__)
+
+API_VERSION: str = "v1"
+
+openapi_info = openapi.Info(
+    title="Ice Cream Truck API",
+    default_version=API_VERSION,
+    description="API Documentation for the Ice Cream Truck API",
+    terms_of_service="https://www.google.com/terms/",
+    contact=openapi.Contact(email="mazi76erx@gmail.com"),
+    license=openapi.License(name="MIT License"),
+)
+
+# Artifact extension: codec
+CODECS: dict[str, type] = {"json": OpenAPICodecJson, "yaml": OpenAPICodecYaml}
+# Spec renderer format: artifact extension
+RENDERER_ARTIFACTS: dict[str, str] = {"openapi": "json", "json": "json", "yaml": "yaml"}
+
+
+def artifact_path(extension: str, directory: Optional[Path] = None) -> Path:
+    # Versioned by the API version, e.g. openapi/openapi-v1.json
+    directory = Path(directory or settings.OPENAPI_DIR)
+    return directory / f"openapi-{API_VERSION}.{extension}"
+
+
+def build_schema() -> dict[str, bytes]:
+    # Introspects every view and serializer once, for all formats. Without a
+    # request every endpoint is included and the server URL is left to
+    # SWAGGER_SETTINGS["DEFAULT_API_URL"].
+    schema = OpenAPISchemaGenerator(openapi_info).get_schema(request=None, public=True)
+    return {extension: codec([]).encode(schema) for extension, codec in CODECS.items()}
+
+
+@lru_cache(maxsize=None)
+def load_artifact(extension: str) -> tuple[bytes, str]:
+    # (content, ETag), read once per process. Without an artifact (no
+    # build_openapi run) a DEBUG process generates the schema once and keeps
+    # it; anywhere else that is a broken build, so the request fails.
+    path = artifact_path(extension)
+    if path.exists():
+        content: bytes = path.read_bytes()
+    elif settings.DEBUG:
+        content = build_schema()[extension]
+    else:
+        logger.error("OpenAPI schema %s is missing; run build_openapi", path)
+        raise ImproperlyConfigured(
+            f"{path} is missing: run `manage.py build_openapi` at build time"
+        )
+    return content, f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+RuntimeSchemaView = get_schema_view(openapi_info, public=True)
+
+
+class SchemaView(RuntimeSchemaView):
+    # Serves the schema built by `manage.py build_openapi` from memory.
+    # Generating it on every request is opt-in (OPENAPI_RUNTIME, which needs
+    # DEBUG); the Swagger UI and ReDoc pages don't introspect the API either
+    # way and fetch the schema with ?format=openapi.
+
+    def get(self, request, version="", format=None):
+        extension = RENDERER_ARTIFACTS.get(request.accepted_renderer.format)
+        if settings.OPENAPI_RUNTIME or extension is None:
+            return super().get(request, version, format)
+
+        content, etag = load_artifact(extension)
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content,
+                content_type=f"{request.accepted_renderer.media_type}; charset=utf-8",
+            )
+        response["ETag"] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.OPENAPI_CACHE_SECONDS
+        )
+        return response
@@ -9,9 +9,11 @@ https://docs.djangoproject.com/en/4.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
+
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,7 +32,7 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv("DEBUG") == "True"
 
-ALLOWED_HOSTS: list[str] = []
+ALLOWED_HOSTS: list[str] = list(filter(None, os.getenv("ALLOWED_HOSTS", "").split(",")))
 
 
 # Application definition
@@ -44,12 +46,15 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     # Third party
     "rest_framework",
+    "rest_framework.authtoken",
     "drf_yasg",
     # Local
     "ice_cream_truck",
 ]
 
 MIDDLEWARE = [
+    "ice_cream_truck.metrics.metrics_middleware",
+    "ice_cream_truck.ratelimit.rate_limit_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -59,6 +64,35 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Startup profile
+# "full" serves the admin, the Swagger UI/ReDoc pages and the browsable API,
+# with session logins. "lean" is for API-only workers: it leaves out the
+# docs, the admin and the session, CSRF, auth and messages middleware, so
+# workers import less and start faster. Clients authenticate with a token
+# ("Authorization: Token <key>", see `manage.py drf_create_token`).
+
+API_PROFILE = os.getenv("API_PROFILE", "full")
+if API_PROFILE not in ("full", "lean"):
+    raise ImproperlyConfigured("API_PROFILE must be 'full' or 'lean'")
+
+FULL_PROFILE_APPS: set[str] = {
+    "django.contrib.admin",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+    "drf_yasg",
+}
+FULL_PROFILE_MIDDLEWARE: set[str] = {
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+}
+
+if API_PROFILE == "lean":
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in FULL_PROFILE_APPS]
+    MIDDLEWARE = [item for item in MIDDLEWARE if item not in FULL_PROFILE_MIDDLEWARE]
+
 ROOT_URLCONF = "ice_cream_truck_api.urls"
 
 TEMPLATES = [
@@ -77,6 +111,11 @@ TEMPLATES = [
     },
 ]
 
+if API_PROFILE == "lean":
+    TEMPLATES[0]["OPTIONS"]["context_processors"].remove(
+        "django.contrib.messages.context_processors.messages"
+    )
+
 WSGI_APPLICATION = "ice_cream_truck_api.wsgi.application"
 
 
@@ -94,6 +133,134 @@ DATABASES = {
     }
 }
 
+# Read replicas
+# Each comma-separated host in POSTGRES_REPLICA_HOSTS becomes an alias
+# ("replica_1", ...) that the read-only views (catalog, inventory, revenue and
+# history) query. Writes always go to "default".
+
+REPLICA_DATABASES: list[str] = []
+
+for index, host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), start=1
+):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["ice_cream_truck.routers.ReplicaRouter"]
+
+# Seconds after a write (e.g. a purchase) during which reads of that customer,
+# truck or the catalog stay on the primary
+REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Set REDIS_URL (needs the redis package) so that every worker shares the
+# cache, and with it the food item catalog invalidation.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+if os.getenv("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+
+# Seconds a rendered food item catalog response is kept for one catalog version
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Seconds a sales analytics result for closed time buckets is cached, and
+# how long after a bucket ends it counts as closed (purchases still in flight
+# or replica lag could otherwise be missed)
+ANALYTICS_CACHE_TIMEOUT = 60 * 60 * 24
+ANALYTICS_CLOSE_GRACE_SECONDS = 60
+
+# Largest radius (km) /api/trucks/nearby/ searches; the bounding box and the
+# number of grid cell ranges it queries grow with it
+NEARBY_MAX_RADIUS_KM = 50
+
+# Write JSON for the list endpoints with orjson when it is installed
+FAST_JSON = os.getenv("FAST_JSON", "True") == "True"
+
+# Idempotency-Key handling for purchases; keys are only seen by every worker
+# when the cache is shared (REDIS_URL). Seconds a purchase response is kept
+# for replay, how long a duplicate waits for the first request to finish,
+# and how long a crashed request can hold its key.
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 60 * 60 * 24))
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_LOCK_SECONDS = 30
+
+
+# Outbox
+# Events stored with each sale and handled by `manage.py run_outbox_worker`.
+# Events claimed per transaction, attempts before an event is given up on,
+# and the retry backoff (doubling from the base, in seconds).
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_RETRY_BASE_SECONDS = 5
+OUTBOX_RETRY_MAX_SECONDS = 60 * 60
+
+# Rows each truck's hourly and daily revenue rollups are spread over. Every
+# sale adds to one random shard, so sales at a busy truck don't all wait on
+# the same row locks; 1 keeps a single row per bucket.
+REVENUE_ROLLUP_SHARDS = 8
+
+# A sale that leaves a truck with this many units of an item or fewer logs a
+# low stock warning
+LOW_STOCK_THRESHOLD = 5
+
+
+# Rate limiting and admission control
+# Token buckets per URL name: (scope, requests per second, burst), where the
+# scope is "endpoint" (shared by all clients) or "client" (one bucket per API
+# token, or per address for requests without one). A request takes a token
+# from all of its buckets or, answered 429, from none. Buckets live in each
+# process (at most RATE_LIMIT_MAX_KEYS of them); set RATE_LIMIT_BACKEND=cache
+# to keep them in the shared cache. RATE_LIMITS=off turns the limits off (the
+# benchmarks do).
+
+PURCHASE_RATE_LIMITS: list[tuple[str, float, int]] = [
+    ("client", 2, 10),
+    ("endpoint", 500, 1000),
+]
+RATE_LIMITS: dict[str, list[tuple[str, float, int]]] = {
+    "buy_food": PURCHASE_RATE_LIMITS,
+    "checkout": PURCHASE_RATE_LIMITS,
+    "async_buy_food": PURCHASE_RATE_LIMITS,
+    "fooditem-list": [("endpoint", 1000, 2000)],
+}
+if os.getenv("RATE_LIMITS") == "off":
+    RATE_LIMITS = {}
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+RATE_LIMIT_MAX_KEYS = 100_000
+
+# Requests a process serves at once before answering 503 (0 for no cap).
+# Keep it near the number of database connections a process can open.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 64))
+
+
+# Metrics
+# With several worker processes, point METRICS_DIR at a directory they share
+# (emptied on deploy) so /metrics reports the sum over every worker.
+# /metrics answers scrapers sending "Authorization: Bearer <METRICS_TOKEN>";
+# without a token it only answers requests from METRICS_ALLOWED_ADDRESSES.
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_ALLOWED_ADDRESSES: list[str] = list(
+    filter(None, os.getenv("METRICS_ALLOWED_ADDRESSES", "127.0.0.1,::1").split(","))
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -137,6 +304,40 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+        "rest_framework.authentication.TokenAuthentication",
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+if API_PROFILE == "lean":
+    # No sessions to log in with, and no pages to browse
+    REST_FRAMEWORK["DEFAULT_AUTHENTICATION_CLASSES"] = [
+        "rest_framework.authentication.TokenAuthentication",
+    ]
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = [
+        "rest_framework.renderers.JSONRenderer",
+    ]
+
 SWAGGER_SETTINGS = {
-    "DEFAULT_INFO": "icecreamtruckapi.urls.openapi_info",
+    "DEFAULT_INFO": "ice_cream_truck_api.openapi.openapi_info",
 }
+SWAGGER_USE_COMPAT_RENDERERS = False
+
+# API schema
+# `manage.py build_openapi` writes openapi-<version>.json/.yaml here at build
+# time; /swagger.json, /swagger.yaml and the doc pages serve them from memory,
+# cached by clients for OPENAPI_CACHE_SECONDS. Without the files only a DEBUG
+# process generates the schema (once); otherwise the schema requests fail and
+# log an error. OPENAPI_RUNTIME=True (with DEBUG) regenerates the schema on
+# every request instead, for development.
+
+OPENAPI_DIR = BASE_DIR / "openapi"
+OPENAPI_CACHE_SECONDS = 60 * 60
+OPENAPI_RUNTIME = DEBUG and os.getenv("OPENAPI_RUNTIME") == "True"
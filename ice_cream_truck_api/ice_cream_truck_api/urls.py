@@ -14,36 +14,31 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path, include
 
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from django.conf import settings
+from django.urls import path, include, re_path
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Ice Cream Truck API",
-        default_version="v1",
-        description="API Documentation for the Ice Cream Truck API",
-        terms_of_service="https://www.google.com/terms/",
-        contact=openapi.Contact(email="mazi76erx@gmail.com"),
-        license=openapi.License(name="MIT License"),
-    ),
-    public=True,
-)
+from ice_cream_truck.metrics import metrics_view
 
 urlpatterns: list = [
-    path("admin/", admin.site.urls),
     path("api/", include("ice_cream_truck.urls")),
-    path(
-        "swagger(<format>\.json|\.yaml)/",
-        schema_view.without_ui(cache_timeout=0),
-        name="schema-json",
-    ),
-    path(
-        "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
-        name="schema-swagger-ui",
-    ),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("metrics", metrics_view, name="metrics"),
 ]
+
+if settings.API_PROFILE == "full":
+    # Imported here so that lean workers never load the admin or drf_yasg
+    from django.contrib import admin
+
+    from ice_cream_truck_api.openapi import SchemaView
+
+    urlpatterns += [
+        path("admin/", admin.site.urls),
+        # The schema is built ahead of time with `manage.py build_openapi`
+        re_path(
+            r"^swagger\.(?P<format>json|yaml)$",
+            SchemaView.without_ui(),
+            name="schema-json",
+        ),
+        path("swagger/", SchemaView.with_ui("swagger"), name="schema-swagger-ui"),
+        path("redoc/", SchemaView.with_ui("redoc"), name="schema-redoc"),
+    ]